@@ -0,0 +1,326 @@
+"""
+Vectorized EWMA anomaly detector for meter consumption (spikes, drops, zero consumption).
+
+    python anomaly_detector.py --store store [--state store/anomaly_state]
+
+A chunk is a (meters x intervals) kWh array. Each interval is first divided by the chunk's
+mean across meters for that interval, which takes out the daily load shape and anything
+common to the whole population (weather, feeder outages). Consumption noise is
+multiplicative, so the log of that ratio is tracked. Every meter keeps an EWMA baseline of it
+(mean and variance, West's update). Each interval is scored against
+the baseline as it stood before it, and then folded in. Scoring runs one column at a time,
+vectorized over all meters of the chunk. Values beyond CLIP_Z are winsorized before they
+update the baseline, so a spike does not mask the next one.
+
+Per-meter state (DetectorState) is a few numbers per meter: mean, variance, observations,
+repeat streak, last anomaly time and the end of the data folded in. It is carried between
+chunks, so blocks can be fed incrementally as they arrive; data older than a meter's baseline
+is skipped rather than folded in out of order. Consecutive anomalous intervals of one type within a chunk are
+reported as one record: meter, type (spike / drop / zero), severity (Low / Medium / High by
+peak |z|; zero records below the Low threshold count as Low), start, end, intervals, peak z,
+expected and observed kWh at the peak, and repeats (how many earlier anomalies of the meter
+follow each other within REPEAT_DAYS). For a
+profile_store root, anomalies are kept per block_profile partition in the "anomalies" table,
+and only new partitions are processed.
+"""
+import argparse
+import json
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+
+import profile_store
+
+ALPHA = 2 / (96 + 1)  # EWMA span of one day of 15-minute blocks
+MIN_HISTORY = 96  # observations before a meter is scored
+SEVERITY_Z = (4.0, 6.0, 9.0)  # |z| thresholds for Low, Medium, High
+CLIP_Z = 3.0
+ZERO_MIN_KWH = 0.05  # a zero reading is an anomaly when at least this much was expected
+MIN_SD = 0.02  # floor on the baseline sd (log-ratio units), so flat meters don't flag tiny noise
+RATIO_FLOOR = 0.01  # log(ratio) is taken at no less than this, so zero readings stay finite
+REPEAT_DAYS = 7
+TYPES = ("spike", "drop", "zero")
+SEVERITIES = ("Low", "Medium", "High")
+BLOCK_SECONDS = 900
+TABLE = "anomalies"
+STATE_FILE = "state.npz"
+META_FILE = "meta.json"
+
+Anomaly = namedtuple("Anomaly", "meter type severity start end intervals peak_z expected observed repeats")
+
+_FIELDS = ("mean", "var", "n", "streak", "last", "until")
+
+
+class DetectorState:
+    """Per-meter EWMA baseline and anomaly history, indexed by dense meter id."""
+
+    def __init__(self, n_meters=0):
+        self.mean = np.zeros(n_meters, dtype=np.float32)
+        self.var = np.zeros(n_meters, dtype=np.float32)
+        self.n = np.zeros(n_meters, dtype=np.int32)
+        self.streak = np.zeros(n_meters, dtype=np.int32)  # earlier anomalies in the current repeat streak
+        self.last = np.full(n_meters, -1, dtype=np.int64)  # end of the latest anomaly (epoch s)
+        self.until = np.full(n_meters, -1, dtype=np.int64)  # end of the latest interval folded in (epoch s)
+        self.partitions = {}  # processed block_profile partition -> content hash
+
+    def __len__(self):
+        return len(self.mean)
+
+    def grow(self, n):
+        if n > len(self):
+            extra = n - len(self)
+            for name in _FIELDS:
+                arr = getattr(self, name)
+                fill = -1 if name in ("last", "until") else 0
+                setattr(self, name, np.concatenate([arr, np.full(extra, fill, dtype=arr.dtype)]))
+
+    def stale(self, meters, t0):
+        """Mask of meters whose baseline already covers t0 (data older than what was folded in)."""
+        return self.until[meters] > t0
+
+    def save(self, path):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.savez(path / STATE_FILE, **{name: getattr(self, name) for name in _FIELDS})
+        with open(path / META_FILE, "w", encoding="utf-8") as f:
+            json.dump({"meters": len(self), "alpha": ALPHA, "partitions": self.partitions}, f, indent=1, sort_keys=True)
+        return path
+
+    @classmethod
+    def load(cls, path, n_meters=0):
+        """State saved at path, or a fresh one for n_meters."""
+        path = Path(path)
+        state = cls(n_meters)
+        if (path / STATE_FILE).exists():
+            with open(path / META_FILE, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["alpha"] != ALPHA:
+                raise ValueError(f"state built with alpha={meta['alpha']}, expected {ALPHA}")
+            z = np.load(path / STATE_FILE)
+            fresh = cls(len(z["mean"]))  # fields added since the state was saved start empty
+            for name in _FIELDS:
+                setattr(state, name, z[name] if name in z.files else getattr(fresh, name))
+            state.partitions = meta["partitions"]
+            state.grow(n_meters)
+        return state
+
+
+def severity(z):
+    """0 / 1 / 2 (Low / Medium / High) by |z|. Zero-consumption records need no |z| threshold, so
+    anything below SEVERITY_Z[0] is Low."""
+    return np.maximum(np.searchsorted(SEVERITY_Z, np.abs(z), side="right") - 1, 0)
+
+
+def detect_chunk(state, meters, kwh, t0, step=BLOCK_SECONDS):
+    """
+    Score one chunk and fold it into state.
+    meters: (n,) dense meter ids; kwh: (n, T) consumption per interval (NaN = missing);
+    t0: epoch seconds of column 0. Returns the chunk's anomaly records as columns.
+    Meters whose baseline already covers t0 are skipped: a baseline only moves forward in time.
+    """
+    meters = np.asarray(meters, dtype=np.int64)
+    x = np.asarray(kwh, dtype=np.float32)
+    state.grow(int(meters.max()) + 1 if len(meters) else 0)
+    fresh = ~state.stale(meters, t0)
+    meters, x = meters[fresh], x[fresh]
+    n, width = x.shape
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shape = np.nanmean(x, axis=0) if n else np.zeros(width, dtype=np.float32)
+        ratio = np.log(np.maximum(x / np.where(shape > 0, shape, np.nan)[None, :], RATIO_FLOOR))
+    mean, var, seen = state.mean[meters], state.var[meters], state.n[meters]
+    z = np.zeros((n, width), dtype=np.float32)
+    kind = np.full((n, width), -1, dtype=np.int8)
+    expected = np.zeros((n, width), dtype=np.float32)
+    for t in range(width):
+        r = ratio[:, t]
+        ok = ~np.isnan(r)
+        sd = np.maximum(np.sqrt(var), MIN_SD)
+        zt = np.where(ok, (r - mean) / sd, 0.0)
+        scored = ok & (seen >= MIN_HISTORY)
+        expected[:, t] = np.exp(mean) * shape[t]
+        z[:, t] = np.where(scored, zt, 0.0)
+        kt = kind[:, t]
+        kt[scored & (zt >= SEVERITY_Z[0])] = 0
+        kt[scored & (zt <= -SEVERITY_Z[0])] = 1
+        kt[scored & (x[:, t] == 0) & (expected[:, t] >= ZERO_MIN_KWH)] = 2
+        # West's EWMA update with the winsorized value; the first reading just seeds the mean
+        rc = np.where(seen > 0, np.clip(r, mean - CLIP_Z * sd, mean + CLIP_Z * sd), r)
+        diff = rc - mean
+        incr = ALPHA * diff
+        mean = np.where(ok, np.where(seen > 0, mean + incr, r), mean)
+        var = np.where(ok & (seen > 0), (1 - ALPHA) * (var + diff * incr), var)
+        seen = seen + ok
+    state.mean[meters], state.var[meters], state.n[meters] = mean, var, seen
+    state.until[meters] = t0 + width * step
+    return _records(state, meters, kind, z, expected, x, t0, step)
+
+
+def _records(state, meters, kind, z, expected, observed, t0, step):
+    """Collapse runs of one anomaly type per meter into records; update repeat tracking."""
+    flagged = kind >= 0
+    prev = np.concatenate([np.full((len(kind), 1), -1, dtype=np.int8), kind[:, :-1]], axis=1)
+    start = flagged & (kind != prev)
+    rows, cols = np.nonzero(flagged)  # row-major, so each run is contiguous
+    if not len(rows):
+        return {name: np.empty(0, dtype=dtype) for name, dtype in _RECORD_DTYPES}
+    run_starts = np.flatnonzero(start[rows, cols])
+    absz = np.abs(z[rows, cols])
+    peak_at = _argmax_reduceat(absz, run_starts)
+    run_rows, first_col = rows[run_starts], cols[run_starts]
+    lengths = np.diff(np.append(run_starts, len(rows)))
+    last_col = first_col + lengths - 1
+    meter = meters[run_rows]
+    peak_z = z[rows[peak_at], cols[peak_at]]
+    start_ts = t0 + first_col.astype(np.int64) * step
+    end_ts = t0 + (last_col.astype(np.int64) + 1) * step
+    kinds = kind[run_rows, first_col]
+
+    # Repeats: length of the meter's streak of anomalies each within REPEAT_DAYS of the previous.
+    # Records are meter-major and in time order per meter; one pass over records, not readings.
+    repeats = np.zeros(len(meter), dtype=np.int32)
+    window = REPEAT_DAYS * 86400
+    for i, m in enumerate(meter):
+        recent = state.last[m] >= 0 and start_ts[i] - state.last[m] <= window
+        state.streak[m] = state.streak[m] + 1 if recent else 0
+        repeats[i] = state.streak[m]
+        state.last[m] = end_ts[i]
+    return {
+        "meter": meter.astype(np.int64),
+        "type": kinds.astype(np.int8),
+        "severity": severity(peak_z).astype(np.int8),
+        "start": start_ts,
+        "end": end_ts,
+        "intervals": lengths.astype(np.int32),
+        "peak_z": peak_z.astype(np.float32),
+        "expected": expected[rows[peak_at], cols[peak_at]].astype(np.float32),
+        "observed": observed[rows[peak_at], cols[peak_at]].astype(np.float32),
+        "repeats": repeats,
+    }
+
+
+_RECORD_DTYPES = (("meter", np.int64), ("type", np.int8), ("severity", np.int8), ("start", np.int64),
+                  ("end", np.int64), ("intervals", np.int32), ("peak_z", np.float32), ("expected", np.float32),
+                  ("observed", np.float32), ("repeats", np.int32))
+
+
+def _argmax_reduceat(values, starts):
+    """Index of the maximum of each segment values[starts[i]:starts[i + 1]]."""
+    peak = np.maximum.reduceat(values, starts)
+    seg = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(values))))
+    hit = np.flatnonzero(values == peak[seg])
+    # First hit per segment
+    return hit[np.unique(seg[hit], return_index=True)[1]]
+
+
+def iter_records(records):
+    """Anomaly namedtuples from record columns (type / severity as names)."""
+    for i in range(len(records["meter"])):
+        yield Anomaly(int(records["meter"][i]), TYPES[records["type"][i]], SEVERITIES[records["severity"][i]],
+                      int(records["start"][i]), int(records["end"][i]), int(records["intervals"][i]),
+                      round(float(records["peak_z"][i]), 2), round(float(records["expected"][i]), 4),
+                      round(float(records["observed"][i]), 4), int(records["repeats"][i]))
+
+
+# --- profile_store driver ---
+
+def pivot(block):
+    """(meters, (meters x intervals) kWh, t0) from Block Profile rows on a regular 15-minute grid."""
+    meter = np.asarray(block["meter"])
+    ts = np.asarray(block["ts"])
+    ids, row = np.unique(meter, return_inverse=True)
+    t0 = int(ts.min())
+    col = (ts - t0) // BLOCK_SECONDS
+    kwh = np.full((len(ids), int(col.max()) + 1), np.nan, dtype=np.float32)
+    kwh[row, col] = block["kwh_imp"]
+    return ids, kwh, t0
+
+
+def update_store(root, state_dir=None):
+    """
+    Detect over block_profile partitions not processed yet, in period order; returns (state, new
+    partitions). A partition rewritten after later data was folded in is not replayed for the
+    meters it would take back in time (reported as "late"); its earlier records are kept.
+    """
+    state_dir = Path(state_dir) if state_dir else Path(root) / "anomaly_state"
+    masters = profile_store.periods(root, "consumer_master")
+    n_meters = len(profile_store.open_partition(root, "consumer_master", masters[0]).column("meter")) if masters else 0
+    state = DetectorState.load(state_dir, n_meters)
+    hashes = profile_store.partition_hashes(root, "block_profile")
+    new = [p for p, h in hashes.items() if state.partitions.get(p) != h]
+    for period in new:
+        block = profile_store.open_partition(root, "block_profile", period).read(["meter", "ts", "kwh_imp"])
+        if len(block["meter"]):
+            meters, kwh, t0 = pivot(block)
+            state.grow(int(meters.max()) + 1)
+            late = int(state.stale(meters, t0).sum())
+            if late:
+                print(f"{period}: {late:,} meters already processed past this partition, skipped")
+            if late < len(meters):
+                records = detect_chunk(state, meters, kwh, t0)
+                profile_store.write_partition(root, TABLE, period, records, key="meter", index=())
+        state.partitions[period] = hashes[period]
+    state.save(state_dir)
+    return state, new
+
+
+def load_records(root, prefix=""):
+    """Anomaly records of every processed partition (optionally those starting with prefix, e.g. a month)."""
+    parts = [p for p in profile_store.periods(root, TABLE) if p.startswith(prefix)]
+    return profile_store.read(root, TABLE, period_list=parts) if parts else {}
+
+
+def dashboard_values(records):
+    """Dashboard-5 / Dashboard-9 KPI values (KPI_SPECS names), ready for computed=... overrides."""
+    if not records or not len(records["meter"]):
+        return {"Total anomalies detected (by time period)": 0, "Consumption spikes/drops": 0,
+                "Anomalies by type": 0, "Anomalies by severity": 0, "Repeat anomaly tracking": 0}
+    types = np.asarray(records["type"], dtype=np.int64)
+    sev = np.asarray(records["severity"], dtype=np.int64)
+    return {
+        "Total anomalies detected (by time period)": len(types),
+        "Consumption spikes/drops": int(np.count_nonzero(types <= 1)),
+        # Distinct types / severity levels seen (units "types" / "levels"); the counts per
+        # type and per level are in breakdowns()
+        "Anomalies by type": int(np.count_nonzero(np.bincount(types))),
+        "Anomalies by severity": int(np.count_nonzero(np.bincount(sev))),
+        "Repeat anomaly tracking": len(np.unique(np.asarray(records["meter"])[np.asarray(records["repeats"]) > 0])),
+    }
+
+
+def breakdowns(records):
+    """Record counts per type and per severity, for the export's breakdowns=... argument."""
+    types = np.asarray(records.get("type", []), dtype=np.int64) if records else np.empty(0, np.int64)
+    sev = np.asarray(records.get("severity", []), dtype=np.int64) if records else np.empty(0, np.int64)
+    return {
+        "Anomalies by type": dict(zip(TYPES, np.bincount(types, minlength=len(TYPES)).tolist())),
+        "Anomalies by severity": dict(zip(SEVERITIES, np.bincount(sev, minlength=len(SEVERITIES)).tolist())),
+    }
+
+
+def summary(records):
+    """{type: {severity: count}} of a record set."""
+    out = {t: {s: 0 for s in SEVERITIES} for t in TYPES}
+    for t, s in zip(records.get("type", []), records.get("severity", [])):
+        out[TYPES[t]][SEVERITIES[s]] += 1
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detect consumption spikes / drops over new Block Profile partitions")
+    parser.add_argument("--store", required=True, help="profile_store root")
+    parser.add_argument("--state", help="detector state directory (default: <store>/anomaly_state)")
+    parser.add_argument("--period", default="", help="only report records of partitions starting with this, e.g. 2025-01")
+    args = parser.parse_args(argv)
+    state, new = update_store(args.store, args.state)
+    records = load_records(args.store, args.period)
+    print(f"Processed {len(new)} new partitions; {len(state):,} meters tracked")
+    for t, by_sev in summary(records).items():
+        print(f"  {t:>6}: " + ", ".join(f"{s} {n:,}" for s, n in by_sev.items()))
+    for k, v in dashboard_values(records).items():
+        print(f"  {k}: {v}")
+    return records
+
+
+if __name__ == "__main__":
+    main()
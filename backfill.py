@@ -0,0 +1,88 @@
+"""
+Backfill KPIs for a range of months across a process pool.
+
+    python backfill.py --start 2023-01 --end 2024-12 [--workers 8]
+
+Every (period, dashboard) pair is an independent task and every KPI is seeded per
+(period, KPI), so the output is identical whatever the worker count. Results are merged into:
+  KPI_Backfill_<start>_<end>.xlsx              KPI_Data rows for every period + summary
+  dashboards/periods/<YYYY-MM>/...             per-period shards + manifest.json
+  dashboards/periods/index.json                all backfilled periods
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+import export_dashboard_data
+import generate_kpi_data
+from kpi_registry import DASHBOARD_IDS, period_label, period_range
+
+PERIODS_DIR = f"{export_dashboard_data.SHARD_DIR}/periods"
+
+
+def compute_period_dashboard(period, dashboard):
+    """Worker task: JSON block and Excel rows for one dashboard in one period."""
+    dashboards, manifest, _ = export_dashboard_data.build_dashboards(period=period, dashboard_ids={dashboard})
+    rows = list(generate_kpi_data.iter_kpi_rows(period=period, dashboards={dashboard}))
+    return dashboards[dashboard], manifest, rows
+
+
+def _merge_index(index_path, periods):
+    entries = {}
+    if index_path.exists():
+        with open(index_path, encoding="utf-8") as f:
+            entries = {e["period"]: e for e in json.load(f).get("periods", [])}
+    for period in periods:
+        entries[period] = {
+            "period": period,
+            "label": period_label(period),
+            "manifest": f"{PERIODS_DIR}/{period}/manifest.json",
+        }
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump({"periods": [entries[p] for p in sorted(entries)]}, f, indent=2)
+
+
+def backfill(start, end, workers=None, out_dir=export_dashboard_data.OUT_DIR):
+    periods = period_range(start, end)
+    tasks = [(p, d) for p in periods for d in DASHBOARD_IDS]
+    chunksize = max(1, len(tasks) // (4 * (workers or os.cpu_count() or 1)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # map() yields in submission order, so merging is deterministic too
+        outputs = pool.map(compute_period_dashboard, *zip(*tasks), chunksize=chunksize)
+        results = dict(zip(tasks, outputs))
+
+    for period in periods:
+        dashboards = {d: results[(period, d)][0] for d in DASHBOARD_IDS}
+        shard_dir = f"{PERIODS_DIR}/{period}"
+        export_dashboard_data.write_shards(dashboards, out_dir, shard_dir=shard_dir)
+        manifest = {"version": export_dashboard_data.EXPORT_VERSION, "period": period, "kpis": {}, "charts": {}}
+        for d in DASHBOARD_IDS:
+            part = results[(period, d)][1]
+            manifest["kpis"].update(part["kpis"])
+            manifest["charts"].update(part["charts"])
+        with open(out_dir / shard_dir / export_dashboard_data.EXPORT_MANIFEST, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+    _merge_index(out_dir / PERIODS_DIR / "index.json", periods)
+
+    xlsx_path = out_dir / f"KPI_Backfill_{start}_{end}.xlsx"
+    rows = chain.from_iterable(results[(p, d)][2] for p in periods for d in DASHBOARD_IDS)
+    total = generate_kpi_data.write_workbook(xlsx_path, rows)
+    print(f"Backfilled {len(periods)} periods ({start} .. {end}) with {len(tasks)} tasks")
+    print(f"Generated: {xlsx_path} ({total} rows)")
+    print(f"Exported: {out_dir / PERIODS_DIR / 'index.json'}")
+    return xlsx_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill KPI exports for a range of months")
+    parser.add_argument("--start", required=True, help="first period, YYYY-MM")
+    parser.add_argument("--end", required=True, help="last period, YYYY-MM")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    args = parser.parse_args(argv)
+    backfill(args.start, args.end, args.workers)
+
+
+if __name__ == "__main__":
+    main()
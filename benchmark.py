@@ -0,0 +1,282 @@
+"""
+Benchmark suite for the KPI pipeline hot paths at synthetic scale.
+
+    python benchmark.py --meters 10000,100000 --periods 1,6 [--only lookup,engine] [--out bench_results]
+    python benchmark.py --compare bench_results/old.json bench_results/new.json
+
+Each case is timed (best of --repeat) and then re-run under tracemalloc for peak memory.
+Results go to <out>/<commit>-<timestamp>.json so runs can be diffed between commits.
+"""
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+
+import export_dashboard_data
+import generate_kpi_data
+import kpi_engine
+import kpi_registry
+from kpi_registry import DEFAULT_PERIOD, KPI_SPECS, period_range, shift_period
+
+ROOT = Path(__file__).resolve().parent
+EXCEL_MAX_ROWS = 1_048_575
+METERS_PER_DT = 100
+BLOCKS_PER_DAY = 96
+
+
+def _periods(n):
+    return period_range(shift_period(DEFAULT_PERIOD, 1 - n), DEFAULT_PERIOD)
+
+
+# --- cases: each returns (setup() -> state, run(state) -> rows processed) ---
+
+def case_lookup(meters, periods):
+    """norm + find_formula over per-asset KPI instance names (one per DT and KPI)."""
+    def setup():
+        n_dt = max(1, meters // METERS_PER_DT)
+        return [f"{s[2]} [DT-{i}]" for i in range(n_dt) for s in KPI_SPECS][: meters]
+
+    def run(names):
+        kpi_registry._formula_for.cache_clear()
+        for n in names:
+            kpi_registry.find_formula(n)
+        return len(names)
+    return setup, run
+
+
+def case_norm(meters, periods):
+    def setup():
+        return [f"{s[2]} [M-{i}]" for i in range(max(1, meters // len(KPI_SPECS))) for s in KPI_SPECS]
+
+    def run(names):
+        for n in names:
+            kpi_registry.norm(n)
+        return len(names)
+    return setup, run
+
+
+def case_engine(meters, periods):
+    """kpi_engine.compute_kpis on one day of DT Block / Block Profile data."""
+    def setup():
+        rng = np.random.default_rng(0)
+        n_dt = max(1, meters // METERS_PER_DT)
+        rows = n_dt * BLOCKS_PER_DAY
+        return dict(
+            dt_block={"dt": np.repeat(np.arange(n_dt), BLOCKS_PER_DAY),
+                      "voltage": rng.normal(240, 5, (rows, 3)), "current": rng.uniform(5, 200, (rows, 3))},
+            asset_master={"rated_kva": rng.choice([25, 63, 100, 160, 200, 250, 315], n_dt).astype(float)},
+            block_profile={"meter": np.arange(meters), "kwh_imp": rng.uniform(0, 2, meters),
+                           "kvah_imp": rng.uniform(1, 2.5, meters)},
+            consumer={"max_demand": rng.uniform(0, 10, meters), "sanctioned_load": rng.uniform(2, 10, meters)},
+        )
+
+    def run(inputs):
+        for _ in range(periods):
+            kpi_engine.compute_kpis(**inputs)
+        return periods * (len(inputs["dt_block"]["dt"]) + meters)
+    return setup, run
+
+
+def case_generate(meters, periods):
+    """generate_kpi_data streaming workbook (incl. column width fitting), per-DT KPI rows."""
+    def setup():
+        n_dt = max(1, meters // METERS_PER_DT)
+        return tempfile.TemporaryDirectory(), min(n_dt * len(KPI_SPECS) * periods, EXCEL_MAX_ROWS)
+
+    def run(state):
+        tmp, n = state
+        rows = (r for p in _periods(periods) for _ in range(n) for r in generate_kpi_data.iter_kpi_rows(period=p))
+        return generate_kpi_data.write_workbook(Path(tmp.name) / "bench.xlsx", islice(rows, n))
+
+    def teardown(state):
+        state[0].cleanup()
+    return setup, run, teardown
+
+
+def case_autofit(meters, periods):
+    def setup():
+        return list(islice(generate_kpi_data.iter_kpi_rows(), generate_kpi_data.AUTOFIT_ROWS))
+
+    def run(rows):
+        for _ in range(max(1, meters // 1000)):
+            generate_kpi_data.column_widths(rows, len(generate_kpi_data.KPI_COLUMNS))
+        return max(1, meters // 1000) * len(rows)
+    return setup, run
+
+
+def case_export(meters, periods):
+    """export_dashboard_data.main for each period into a scratch directory."""
+    def setup():
+        return tempfile.TemporaryDirectory()
+
+    def run(tmp):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for p in _periods(periods):
+                export_dashboard_data.main(out_dir=Path(tmp.name), period=p)
+        return periods * len(KPI_SPECS)
+
+    def teardown(tmp):
+        tmp.cleanup()
+    return setup, run, teardown
+
+
+def case_serve(meters, periods):
+    """serve.py throughput: full GETs then conditional (304) GETs over keep-alive connections."""
+    import serve
+
+    class QuietHandler(serve.DashboardHandler):
+        def log_message(self, *args):
+            pass
+
+    def setup():
+        server = serve.DashboardServer(("127.0.0.1", 0), QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def client(port, n, etag):
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        headers = {"Accept-Encoding": "gzip"}
+        if etag:
+            headers["If-None-Match"] = etag
+        for _ in range(n):
+            conn.request("GET", "/dashboards.json", headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+        conn.close()
+
+    def run(server):
+        port = server.server_address[1]
+        total = max(100, min(meters // 100, 20000))
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        conn.request("GET", "/dashboards.json")
+        resp = conn.getresponse()
+        resp.read()
+        etag = resp.getheader("ETag")
+        conn.close()
+        with ThreadPoolExecutor(8) as pool:
+            for tag in (None, etag):
+                list(pool.map(lambda _: client(port, total // 8, tag), range(8)))
+        # shutdown() waits out serve_forever's poll interval; keep it off the clock
+        threading.Thread(target=lambda: (server.shutdown(), server.server_close()), daemon=True).start()
+        return 2 * (total // 8) * 8
+    return setup, run
+
+
+CASES = {
+    "norm": case_norm,
+    "lookup": case_lookup,
+    "engine": case_engine,
+    "autofit": case_autofit,
+    "generate": case_generate,
+    "export": case_export,
+    "serve": case_serve,
+}
+
+
+def measure(case, meters, periods, repeat, memory):
+    # Cases return (setup, run) or (setup, run, teardown); teardown runs off the clock
+    setup, run, *rest = case(meters, periods)
+    teardown = rest[0] if rest else (lambda state: None)
+    best = None
+    rows = 0
+    for _ in range(repeat):
+        state = setup()
+        try:
+            t0 = time.perf_counter()
+            rows = run(state)
+            elapsed = time.perf_counter() - t0
+        finally:
+            teardown(state)
+        best = elapsed if best is None else min(best, elapsed)
+    result = {"seconds": round(best, 6), "rows": rows, "rows_per_sec": round(rows / best, 1) if best else None}
+    if memory:
+        state = setup()
+        tracemalloc.start()
+        try:
+            run(state)
+            result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 3)
+        finally:
+            tracemalloc.stop()
+            teardown(state)
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(old_path, new_path):
+    with open(old_path, encoding="utf-8") as f:
+        old = {(r["case"], r["meters"], r["periods"]): r for r in json.load(f)["results"]}
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)["results"]
+    print(f"{'case':<10}{'meters':>10}{'periods':>8}{'old s':>12}{'new s':>12}{'ratio':>8}")
+    for r in new:
+        o = old.get((r["case"], r["meters"], r["periods"]))
+        if o:
+            ratio = r["seconds"] / o["seconds"] if o["seconds"] else float("nan")
+            print(f"{r['case']:<10}{r['meters']:>10}{r['periods']:>8}{o['seconds']:>12.4f}{r['seconds']:>12.4f}{ratio:>8.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark KPI generation, export, lookup and serving")
+    parser.add_argument("--meters", default="10000,100000", help="comma-separated meter counts (10k .. 10M)")
+    parser.add_argument("--periods", default="1,6", help="comma-separated period counts (1 .. 24)")
+    parser.add_argument("--only", default=",".join(CASES), help="comma-separated cases: " + ", ".join(CASES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--out", default=str(ROOT / "bench_results"))
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return None
+
+    results = []
+    for name in args.only.split(","):
+        for meters in (int(m) for m in args.meters.split(",")):
+            for periods in (int(p) for p in args.periods.split(",")):
+                r = measure(CASES[name], meters, periods, args.repeat, not args.no_memory)
+                r.update(case=name, meters=meters, periods=periods)
+                results.append(r)
+                print(f"{name:<10} meters={meters:<9} periods={periods:<3} {r['seconds']:>10.4f}s "
+                      f"{r['rows_per_sec'] or 0:>14,.0f} rows/s  peak={r.get('peak_mb', '-')} MB", flush=True)
+
+    commit = git_commit()
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_path = out_dir / f"{commit}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": commit,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "results": results,
+        }, f, indent=2)
+    print(f"Results: {out_path}")
+    return out_path
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+Out-of-core energy audit: feeder / DT / LT loss, billing and collection efficiency, AT&C loss.
+
+    python energy_audit.py --store store [--month 2025-01] [--buckets 32] [--memory-mb 256]
+                           [--spill-dir /tmp] [--mapping dt|tagged_dt] [--out <store>/energy_audit.csv]
+
+Input energy is metered per feeder (feeder_block) and per DT (dt_block). Consumer energy
+(block_profile) and billed / collected amounts (billing) are recorded per meter and reach a
+DT only through the asset mapping: consumer_master (meter -> DT), then asset_master (DT ->
+feeder). Feeder and DT input are per-asset sums and stay in memory. The consumer side is a
+Grace hash join:
+
+  pass 1  every partition is reduced to one row per (meter, month) and the rows are
+          hash-partitioned by meter into BUCKETS spill files, flushed to disk whenever the
+          buffered rows exceed the memory budget; the mapping is partitioned the same way.
+  pass 2  one bucket at a time, the mapping rows become a direct-address table (slot =
+          meter // buckets) and the consumer rows are looked up in it and added into
+          per-(month, DT) totals.
+
+So memory is the budget plus one bucket, however large the month. Figures per DT, per
+feeder and overall, per month (kpi_engine formulas):
+
+  HT loss          (Feeder input − Σ DT input) ÷ Feeder input
+  Feeder loss      (Feeder input − Σ billed) ÷ Feeder input
+  DT loss          (DT input − Σ billed) ÷ DT input
+  LT loss          (DT input − Σ consumer energy) ÷ DT input       (FORMULA_MAP "lt loss")
+  Billing eff.     Σ billed ÷ input (feeder input where metered, else DT input)
+  Collection eff.  Σ collected ÷ Σ billed;  AT&C = 1 − BE × CE
+
+Billing rows of meters missing from the mapping count towards the overall figures only.
+"""
+import argparse
+import csv
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+import kpi_engine
+import profile_store
+import ranking
+
+BUCKETS = 32
+MEMORY_MB = 256
+ENERGY = ("metered_kwh", "billed_kwh", "amount_billed", "amount_collected")
+RECORD = np.dtype([("meter", "<i8"), ("month", "<i4")] + [(c, "<f8") for c in ENERGY])
+MAPPING = np.dtype([("meter", "<i8"), ("dt", "<i8")])
+
+# Dashboard-1 KPI -> overall figure
+KPI_FIGURES = {
+    "Feeder Loss (%)": "feeder_loss_pct",
+    "DT (Distribution Transformer) Loss (%)": "dt_loss_pct",
+    "LT Loss (%)": "lt_loss_pct",
+    "Billing Efficiency (%)": "billing_eff_pct",
+    "Collection Efficiency (%)": "collection_eff_pct",
+    "AT&C Loss (%)": "atc_loss_pct",
+}
+# Ranked "Top ..." KPI -> (level, figure, asset name prefix); worst first
+RANKED = {
+    "Top High Loss DTs / Feeders": ("dt", "lt_loss_pct", "DT"),
+    "Top High-Loss Feeders / DTs": ("feeder", "feeder_loss_pct", "FDR"),
+    "Top X Best/Worst Feeders/DTs": ("feeder", "atc_loss_pct", "FDR"),
+}
+
+
+class SpillBuckets:
+    """Structured rows hash-partitioned by an integer key into n bucket files, buffered up to budget bytes."""
+
+    def __init__(self, directory, n, dtype, budget_bytes, key="meter"):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.n = n
+        self.dtype = dtype
+        self.budget = budget_bytes
+        self.key = key
+        self.rows = 0
+        self.spilled_bytes = 0
+        self._buffers = [[] for _ in range(n)]
+        self._buffered = 0
+
+    def _path(self, i):
+        return self.dir / f"bucket{i:04d}.bin"
+
+    def add(self, rows):
+        if not len(rows):
+            return
+        b = rows[self.key] % self.n
+        order = np.argsort(b, kind="stable")
+        rows = rows[order]
+        bounds = np.searchsorted(b[order], np.arange(self.n + 1))
+        for i in np.flatnonzero(np.diff(bounds)):
+            self._buffers[i].append(rows[bounds[i]:bounds[i + 1]])
+        self.rows += len(rows)
+        self._buffered += rows.nbytes
+        if self._buffered >= self.budget:
+            self.flush()
+
+    def flush(self):
+        """Append every buffered row to its bucket file."""
+        for i, parts in enumerate(self._buffers):
+            if parts:
+                with open(self._path(i), "ab") as f:
+                    for p in parts:
+                        p.tofile(f)
+                parts.clear()
+        self.spilled_bytes += self._buffered
+        self._buffered = 0
+
+    def bucket(self, i):
+        """All rows of bucket i: spilled, then still buffered."""
+        path = self._path(i)
+        parts = [np.fromfile(path, dtype=self.dtype)] if path.exists() else []
+        parts += self._buffers[i]
+        return np.concatenate(parts) if parts else np.empty(0, self.dtype)
+
+
+def _sum_by(keys, values):
+    """(unique keys, per-key sums) of key-sorted rows; values may be (rows, k)."""
+    keys = np.asarray(keys)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.empty(0, np.int64)
+    sums = np.add.reduceat(np.asarray(values, dtype=np.float64), starts, axis=0) if len(keys) else None
+    return keys[starts], sums
+
+
+def meter_rows(root, period, month_index):
+    """One RECORD row per meter of a partition: block_profile energy and billing, joined on meter."""
+    metered = billed = (np.empty(0, np.int64), None)
+    if (profile_store.partition_dir(root, "block_profile", period) / profile_store.META_FILE).exists():
+        part = profile_store.open_partition(root, "block_profile", period)
+        metered = _sum_by(part.column("meter"), part.column("kwh_imp"))  # rows are sorted by meter
+    if (profile_store.partition_dir(root, "billing", period) / profile_store.META_FILE).exists():
+        part = profile_store.open_partition(root, "billing", period)
+        billed = _sum_by(part.column("meter"), np.column_stack([part.column(c) for c in ENERGY[1:]]))
+    meters = np.union1d(metered[0], billed[0])
+    rows = np.zeros(len(meters), dtype=RECORD)
+    rows["meter"] = meters
+    rows["month"] = month_index
+    if metered[1] is not None:
+        rows["metered_kwh"][np.searchsorted(meters, metered[0])] = metered[1]
+    if billed[1] is not None:
+        pos = np.searchsorted(meters, billed[0])
+        for j, c in enumerate(ENERGY[1:]):
+            rows[c][pos] = billed[1][:, j]
+    return rows
+
+
+def _input_energy(root, profile, key, months, n):
+    """(months, n) kWh imported per asset, summed over the profile's partitions of those months."""
+    out = np.zeros((len(months), n))
+    for period in profile_store.periods(root, profile):
+        m = months.get(period[:7])
+        if m is None:
+            continue
+        part = profile_store.open_partition(root, profile, period)
+        ids = np.asarray(part.column(key))
+        out[m] += np.bincount(ids, weights=np.asarray(part.column("kwh_imp"), dtype=np.float64), minlength=n)[:n]
+    return out
+
+
+def _rollup(values, idx, n):
+    """(months, n) sums of (months, assets) values grouped by idx per asset."""
+    out = np.zeros((values.shape[0], n))
+    np.add.at(out, (slice(None), idx), values)
+    return out
+
+
+def audit_store(root, months=None, buckets=BUCKETS, memory_mb=MEMORY_MB, spill_dir=None, mapping="dt"):
+    """
+    Energy totals per DT, per feeder and overall for each month (YYYY-MM) of a profile_store
+    root (default: every month with consumer data). mapping: the consumer_master DT column
+    to join through ("dt", or "tagged_dt" to audit with the recorded tags).
+    """
+    found = sorted({p[:7] for profile in ("block_profile", "billing") for p in profile_store.periods(root, profile)})
+    months = [m for m in (found if months is None else months) if m in found]
+    month_index = {m: i for i, m in enumerate(months)}
+    asset = profile_store.open_partition(root, "asset_master", "master").read(["dt", "feeder"])
+    n_dt = int(np.max(asset["dt"])) + 1 if len(asset["dt"]) else 0
+    dt_feeder = np.zeros(n_dt, dtype=np.int64)
+    dt_feeder[np.asarray(asset["dt"])] = asset["feeder"]
+    n_feeder = int(np.max(asset["feeder"])) + 1 if len(asset["feeder"]) else 0
+
+    dt = {"id": np.arange(n_dt), "feeder": dt_feeder,
+          "dt_input_kwh": _input_energy(root, "dt_block", "dt", month_index, n_dt)}
+    dt.update({c: np.zeros((len(months), n_dt)) for c in ENERGY})
+    unmapped = {c: np.zeros(len(months)) for c in ENERGY}
+    budget = memory_mb * 1024 * 1024
+    tmp = Path(tempfile.mkdtemp(prefix="energy_audit_", dir=spill_dir))
+    try:
+        # Pass 1: partition the mapping and the per-(meter, month) consumer rows
+        cm = profile_store.open_partition(root, "consumer_master", "master")
+        maps = SpillBuckets(tmp / "mapping", buckets, MAPPING, budget // 4)
+        step = 1 << 20
+        for lo in range(0, len(cm), step):
+            chunk = np.zeros(min(step, len(cm) - lo), dtype=MAPPING)
+            chunk["meter"] = cm.column("meter")[lo:lo + step]
+            chunk["dt"] = cm.column(mapping)[lo:lo + step]
+            maps.add(chunk)
+        dt["consumers"] = np.bincount(np.asarray(cm.column(mapping)), minlength=n_dt)[:n_dt]
+        rows = SpillBuckets(tmp / "rows", buckets, RECORD, budget)
+        periods = sorted(set(profile_store.periods(root, "block_profile")) | set(profile_store.periods(root, "billing")))
+        for period in periods:
+            if period[:7] in month_index:
+                rows.add(meter_rows(root, period, month_index[period[:7]]))
+
+        # Pass 2: join bucket by bucket into per-(month, DT) totals
+        for b in range(buckets):
+            m, r = maps.bucket(b), rows.bucket(b)
+            if not len(r):
+                continue
+            table = np.full(int(m["meter"].max()) // buckets + 1 if len(m) else 0, -1, dtype=np.int64)
+            table[m["meter"] // buckets] = m["dt"]
+            slot = r["meter"] // buckets
+            hit = np.flatnonzero(slot < len(table))
+            owner = np.full(len(r), -1, dtype=np.int64)
+            owner[hit] = table[slot[hit]]
+            ok = (owner >= 0) & (owner < n_dt)
+            flat = r["month"][ok] * n_dt + owner[ok]
+            for c in ENERGY:
+                dt[c] += np.bincount(flat, weights=r[c][ok], minlength=len(months) * n_dt).reshape(len(months), n_dt)
+                unmapped[c] += np.bincount(r["month"][~ok], weights=r[c][~ok], minlength=len(months))
+        # Months a profile has no partitions for are unknown, not zero
+        for profile, cols in (("block_profile", ENERGY[:1]), ("billing", ENERGY[1:])):
+            have = {p[:7] for p in profile_store.periods(root, profile)}
+            missing = [i for i, month in enumerate(months) if month not in have]
+            for c in cols:
+                dt[c][missing] = np.nan
+                unmapped[c][missing] = np.nan
+        stats = {"rows": rows.rows, "buckets": buckets, "spilled_mb": round(rows.spilled_bytes / 1e6, 1)}
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    feeder = {"id": np.arange(n_feeder),
+              "feeder_input_kwh": _input_energy(root, "feeder_block", "feeder", month_index, n_feeder)}
+    for c in ("dt_input_kwh",) + ENERGY:
+        feeder[c] = _rollup(dt[c], dt_feeder, n_feeder)
+    overall = {c: feeder[c].sum(axis=1) for c in ("feeder_input_kwh", "dt_input_kwh")}
+    overall.update({c: feeder[c].sum(axis=1) + unmapped[c] for c in ENERGY})
+    return {"months": months, "dt": dt, "feeder": feeder, "overall": overall, "unmapped": unmapped, "stats": stats}
+
+
+def figures(energy):
+    """Loss / efficiency % from one level's energy totals (any shape); NaN where an input is zero."""
+    dt_in, billed = energy["dt_input_kwh"], energy["billed_kwh"]
+    out = {
+        "dt_loss_pct": kpi_engine.safe_div(dt_in - billed, dt_in) * 100.0,
+        "lt_loss_pct": kpi_engine.safe_div(dt_in - energy["metered_kwh"], dt_in) * 100.0,
+    }
+    supplied = dt_in
+    if "feeder_input_kwh" in energy:
+        fin = energy["feeder_input_kwh"]
+        out["ht_loss_pct"] = kpi_engine.safe_div(fin - dt_in, fin) * 100.0
+        out["feeder_loss_pct"] = kpi_engine.safe_div(fin - billed, fin) * 100.0
+        supplied = np.where(fin > 0, fin, dt_in)
+    out["billing_eff_pct"] = kpi_engine.billing_efficiency(billed, supplied)
+    out["collection_eff_pct"] = kpi_engine.collection_efficiency(energy["amount_collected"], energy["amount_billed"])
+    out["atc_loss_pct"] = kpi_engine.atc_loss(out["billing_eff_pct"], out["collection_eff_pct"])
+    return out
+
+
+def _month_index(audit, month):
+    if month is None:
+        return len(audit["months"]) - 1 if audit["months"] else None
+    return audit["months"].index(month) if month in audit["months"] else None
+
+
+def dashboard_values(audit, month=None):
+    """Dashboard-1 loss / efficiency KPI values for a month (default: the last audited)."""
+    m = _month_index(audit, month)
+    if m is None:
+        return {}
+    fig = figures({c: v[m] for c, v in audit["overall"].items()})
+    return {name: round(float(fig[f]), 2) for name, f in KPI_FIGURES.items() if not np.isnan(fig[f])}
+
+
+def trend_values(audit):
+    """{KPI name: {YYYY-MM: value}} over every audited month, for the lossTrend chart."""
+    fig = figures(audit["overall"])
+    return {name: {month: round(float(v), 2) for month, v in zip(audit["months"], fig[f]) if not np.isnan(v)}
+            for name, f in KPI_FIGURES.items()}
+
+
+def _names(prefix, ids, count):
+    width = len(str(count))
+    return [f"{prefix}-{i:0{width}d}" for i in ids]
+
+
+def rankings(audit, month=None, k=ranking.DEFAULT_K):
+    """{Top ... KPI: [(asset, value)] worst first} from the per-DT / per-feeder figures of a month."""
+    m = _month_index(audit, month)
+    if m is None:
+        return {}
+    ranker = ranking.Ranker({name: True for name in RANKED}, k)
+    for name, (level, figure, prefix) in RANKED.items():
+        energy = audit[level]
+        fig = figures({c: energy[c][m] for c in energy if c.endswith("_kwh") or c.startswith("amount_")})
+        values = np.round(fig[figure], 2)
+        ranker.feed(name, _names(prefix, energy["id"], len(energy["id"])), values)
+    return ranker.result()
+
+
+def write_csv(path, audit, month=None):
+    """Per-DT and per-feeder energy and figures for a month (default: the last audited)."""
+    m = _month_index(audit, month)
+    header = ["Level", "Asset", "Feeder", "Feeder Input (kWh)", "DT Input (kWh)", "Consumer Energy (kWh)",
+              "Billed (kWh)", "Amount Billed", "Amount Collected", "HT Loss (%)", "Feeder Loss (%)", "DT Loss (%)",
+              "LT Loss (%)", "Billing Efficiency (%)", "Collection Efficiency (%)", "AT&C Loss (%)"]
+    cols = ("feeder_input_kwh", "dt_input_kwh") + ENERGY
+    figs = ("ht_loss_pct", "feeder_loss_pct", "dt_loss_pct", "lt_loss_pct", "billing_eff_pct",
+            "collection_eff_pct", "atc_loss_pct")
+
+    def cell(x):
+        return "" if x is None or np.isnan(x) else round(float(x), 2)
+
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(header)
+        if m is None:
+            return path
+        for level, prefix in (("feeder", "FDR"), ("dt", "DT")):
+            energy = {c: v[m] for c, v in audit[level].items() if c in cols}
+            fig = figures(energy)
+            names = _names(prefix, audit[level]["id"], len(audit[level]["id"]))
+            for i, name in enumerate(names):
+                feeder = audit[level]["feeder"][i] if level == "dt" else audit[level]["id"][i]
+                w.writerow([level, name, int(feeder)]
+                           + [cell(energy[c][i]) if c in energy else "" for c in cols]
+                           + [cell(fig[g][i]) if g in fig else "" for g in figs])
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Feeder / DT / LT loss and AT&C energy audit of a profile_store root")
+    parser.add_argument("--store", required=True, help="profile_store root")
+    parser.add_argument("--month", action="append", help="YYYY-MM to audit (repeatable; default: all)")
+    parser.add_argument("--buckets", type=int, default=BUCKETS, help="hash partitions of the join (default: %(default)s)")
+    parser.add_argument("--memory-mb", type=int, default=MEMORY_MB, help="rows buffered before spilling (default: %(default)s)")
+    parser.add_argument("--spill-dir", default=None, help="directory for spill files (default: system temp)")
+    parser.add_argument("--mapping", default="dt", choices=("dt", "tagged_dt"), help="consumer_master DT column to join on")
+    parser.add_argument("--out", help="per-DT / per-feeder figures of the last month (default: <store>/energy_audit.csv)")
+    args = parser.parse_args(argv)
+    args.out = args.out or os.path.join(args.store, "energy_audit.csv")
+    audit = audit_store(args.store, args.month, args.buckets, args.memory_mb, args.spill_dir, args.mapping)
+    stats = audit["stats"]
+    print(f"{stats['rows']:,} meter-day rows joined in {stats['buckets']} buckets "
+          f"({stats['spilled_mb']} MB spilled); months: {', '.join(audit['months']) or 'none'}")
+    for month in audit["months"]:
+        print(f"  {month}: " + ", ".join(f"{k} {v}" for k, v in dashboard_values(audit, month).items()))
+    write_csv(args.out, audit)
+    print(f"Per-DT / per-feeder figures: {args.out}")
+    return audit
+
+
+if __name__ == "__main__":
+    main()
@@ -1,209 +1,498 @@
 """
 Export KPI data per dashboard to JSON for frontend (values + trend data for charts).
+
+Every KPI draws from its own seeded RNG and every chart block declares the KPIs it reads,
+so an incremental run (--incremental) can compare content hashes against the previous
+export manifest and recompute / rewrite only the KPIs, chart blocks and dashboard shards
+whose inputs changed.
+
+Each run records wall time, rows and (with --trace-memory) peak memory per stage, per KPI and
+per chart block to run_metrics/export.json (see instrumentation.py); --profile also dumps
+cProfile stats next to it.
 """
+import argparse
+import hashlib
 import json
-import random
+import time
+from datetime import datetime, timezone
 from pathlib import Path
 
-# Reuse same value logic as generate_kpi_data
-def generate_value(vtype, lo, hi, unit):
-    if vtype == "pct":
-        return round(random.uniform(lo, hi), 2)
-    if vtype == "count":
-        return random.randint(int(lo), int(hi))
-    if vtype == "index":
-        return round(random.uniform(lo, hi), 3)
-    if vtype == "minutes":
-        return round(random.uniform(lo, hi), 1)
-    if vtype == "kva":
-        return random.choice([25, 63, 100, 160, 200, 250, 315])
-    if vtype == "score":
-        return random.randint(int(lo), int(hi))
-    return round(random.uniform(lo, hi), 2)
-
-# KPI_SPECS: (Dashboard, Department, KPI Name, value_type, min_val, max_val, unit)
-KPI_SPECS = [
-    ("Dashboard-1", "Finance", "Feeder Loss (%)", "pct", 3, 18, "%"),
-    ("Dashboard-1", "Finance", "DT (Distribution Transformer) Loss (%)", "pct", 2, 12, "%"),
-    ("Dashboard-1", "Finance", "LT Loss (%)", "pct", 1, 8, "%"),
-    ("Dashboard-1", "Finance", "Billing Efficiency (%)", "pct", 78, 98, "%"),
-    ("Dashboard-1", "Finance", "Collection Efficiency (%)", "pct", 72, 96, "%"),
-    ("Dashboard-1", "Finance", "AT&C Loss (%)", "pct", 8, 28, "%"),
-    ("Dashboard-1", "Finance", "Top X Best/Worst Feeders/DTs", "count", 5, 20, "count"),
-    ("Dashboard-1", "Finance", "Top High Loss DTs / Feeders", "count", 8, 35, "count"),
-    ("Dashboard-1", "Finance", "Top High-Loss Feeders / DTs", "count", 6, 28, "count"),
-    ("Dashboard-2", "Operation", "SAIDI", "minutes", 45, 380, "min"),
-    ("Dashboard-2", "Operation", "SAIFI", "index", 2, 25, "interruptions"),
-    ("Dashboard-2", "Operation", "CAIDI", "minutes", 25, 95, "min"),
-    ("Dashboard-2", "Operation", "CAIFI", "index", 1, 18, "interruptions"),
-    ("Dashboard-2", "Operation", "MAIFI", "index", 0.2, 8, "interruptions"),
-    ("Dashboard-2", "Operation", "Number of Outages (Frequency)", "count", 12, 450, "count"),
-    ("Dashboard-2", "Operation", "Duration of Outages (Minutes)", "minutes", 120, 7200, "min"),
-    ("Dashboard-2", "Operation", "DT/Feeder Reliability Trends (Monthly/Yearly)", "pct", 85, 99.5, "%"),
-    ("Dashboard-2", "Operation", "DTs with High Failure Rate", "count", 3, 45, "count"),
-    ("Dashboard-2", "Operation", "Detection Accuracy", "pct", 82, 98, "%"),
-    ("Dashboard-2", "Operation", "False Positive Rate", "pct", 1, 15, "%"),
-    ("Dashboard-2", "Operation", "Field inspection hit-rate", "pct", 65, 92, "%"),
-    ("Dashboard-2", "Operation", "MTTI", "minutes", 8, 95, "min"),
-    ("Dashboard-2", "Operation", "MTTR", "minutes", 25, 180, "min"),
-    ("Dashboard-2", "Operation", "Alert response time", "minutes", 5, 45, "min"),
-    ("Dashboard-2", "Operation", "Planned outage suppression rate", "pct", 70, 98, "%"),
-    ("Dashboard-2", "Analytics", "Low-voltage pockets", "count", 2, 28, "count"),
-    ("Dashboard-2", "Operation", "Feeders with Maximum Outages", "count", 4, 22, "count"),
-    ("Dashboard-2", "Operation", "Reliability Improvement Trend", "pct", 2, 18, "%"),
-    ("Dashboard-2", "Operation", "Consumer Service Reliability Score", "score", 72, 95, "score"),
-    ("Dashboard-2", "Operation", "Composite Reliability Score", "score", 68, 94, "score"),
-    ("Dashboard-2", "Operation", "Composite Efficiency Score", "score", 65, 92, "score"),
-    ("Dashboard-3", "Technical", "% DT Peak Loading", "pct", 45, 98, "%"),
-    ("Dashboard-3", "Technical", "% DT Loading", "pct", 38, 92, "%"),
-    ("Dashboard-3", "Technical", "DT Load (kVA)", "kva", 25, 315, "kVA"),
-    ("Dashboard-3", "Technical", "% Loading Bands", "pct", 0, 100, "%"),
-    ("Dashboard-3", "Technical", "Top Overloaded DTs / Feeders", "count", 5, 30, "count"),
-    ("Dashboard-3", "Technical", "Load Rise Trend", "pct", 2, 22, "%"),
-    ("Dashboard-3", "Technical", "Consumers exceeding sanctioned load", "count", 15, 380, "count"),
-    ("Dashboard-3", "Technical", "% Consumers with Load Violation", "pct", 0.5, 12, "%"),
-    ("Dashboard-3", "Technical", "Load Duration Curve & Asset Loading Spread", "pct", 55, 88, "%"),
-    ("Dashboard-3", "Technical", "DT Failure Rate (%)", "pct", 0.2, 5.5, "%"),
-    ("Dashboard-3", "Technical", "Top Overloaded Assets", "count", 8, 42, "count"),
-    ("Dashboard-3", "Technical", "Top Power Quality Issues", "count", 6, 35, "count"),
-    ("Dashboard-4", "Operation", "Voltage Deviation (%)", "pct", 1, 12, "%"),
-    ("Dashboard-4", "Operation", "Voltage Deviation Index (VDI)", "index", 0.02, 0.95, "index"),
-    ("Dashboard-4", "Operation", "Frequency Deviation Index (FDI)", "index", 0.01, 0.35, "index"),
-    ("Dashboard-4", "Operation", "Voltage Fluctuation Index", "index", 0.01, 0.45, "index"),
-    ("Dashboard-4", "Operation", "Voltage Unbalance Index", "index", 0.02, 0.28, "index"),
-    ("Dashboard-4", "Operation", "Voltage Drop (V)", "count", 5, 45, "V"),
-    ("Dashboard-4", "Operation", "Low Power Factor (%) by DT/Feeder", "pct", 60, 92, "%"),
-    ("Dashboard-4", "Operation", "Meter Current Unbalance (%)", "pct", 2, 18, "%"),
-    ("Dashboard-4", "Operation", "% Time beyond voltage tolerance band", "pct", 0.5, 15, "%"),
-    ("Dashboard-4", "Operation", "% Time with unacceptable current imbalance (>10%)", "pct", 1, 22, "%"),
-    ("Dashboard-5", "Analytics", "Number of Tamper Alerts (Cover Open)", "count", 2, 85, "count"),
-    ("Dashboard-5", "Analytics", "Number of Tamper Alerts (External Magnet)", "count", 0, 42, "count"),
-    ("Dashboard-5", "Analytics", "Number of Tamper Alerts (Neutral Disturbance)", "count", 1, 38, "count"),
-    ("Dashboard-5", "Analytics", "Number of Tamper Alerts (Neutral Missing)", "count", 0, 25, "count"),
-    ("Dashboard-5", "Analytics", "Consumption Comparison - Energy Gap (kWh)", "count", 120, 8500, "kWh"),
-    ("Dashboard-5", "Analytics", "Total anomalies detected (by time period)", "count", 25, 420, "count"),
-    ("Dashboard-5", "Analytics", "Anomalies by type", "count", 3, 12, "types"),
-    ("Dashboard-5", "Analytics", "Anomalies by severity", "count", 2, 5, "levels"),
-    ("Dashboard-5", "Analytics", "Anomalies by geography", "count", 5, 45, "zones"),
-    ("Dashboard-5", "Analytics", "Anomaly trends (daily/weekly/monthly)", "pct", -15, 25, "%"),
-    ("Dashboard-5", "Analytics", "Repeat anomaly tracking", "count", 3, 65, "count"),
-    ("Dashboard-6", "Analytics", "Theft Suspect Flags", "count", 8, 120, "count"),
-    ("Dashboard-6", "Analytics", "% Reduction in Theft Events (monthly trend)", "pct", 5, 45, "%"),
-    ("Dashboard-6", "Analytics", "Theft / Load diversion", "count", 2, 55, "count"),
-    ("Dashboard-6", "Analytics", "Areas with Highest Theft Risk", "count", 3, 28, "count"),
-    ("Dashboard-6", "Finance", "Revenue Recovery Improvement (%)", "pct", 3, 28, "%"),
-    ("Dashboard-7", "Analytics", "Communication health issues", "count", 5, 95, "count"),
-    ("Dashboard-7", "Technical", "Signal strength statistics", "pct", 72, 98, "%"),
-    ("Dashboard-7", "Technical", "Packet loss percentage", "pct", 0.2, 8, "%"),
-    ("Dashboard-7", "Technical", "Communication retry counts", "count", 50, 850, "count"),
-    ("Dashboard-7", "Technical", "Non-reporting meters (>24 hours)", "count", 12, 220, "count"),
-    ("Dashboard-7", "Technical", "Communication technology performance (RF/GPRS/PLC)", "pct", 85, 99, "%"),
-    ("Dashboard-7", "Technical", "Weak Signal Percentage", "pct", 2, 18, "%"),
-    ("Dashboard-8", "Advanced Analytics", "Auto-indexing consumers and DTRs for correct mapping", "count", 1200, 45000, "count"),
-    ("Dashboard-8", "Advanced Analytics", "Track updated tag of DTs to Feeders", "count", 85, 1200, "count"),
-    ("Dashboard-8", "Advanced Analytics", "Track updated tag of consumers to DTs", "count", 250, 8500, "count"),
-    ("Dashboard-8", "Advanced Analytics", "Re-index consumer/DTR data for correct past-period T&D loss", "count", 500, 12000, "count"),
-    ("Dashboard-8", "Advanced Analytics", "Mapping Accuracy (95%)", "pct", 88, 98, "%"),
-    ("Dashboard-8", "Advanced Analytics", "DT-to-meter mapping accuracy", "pct", 90, 99, "%"),
-    ("Dashboard-8", "Advanced Analytics", "% meters pending field verification (<5%)", "pct", 0.8, 6, "%"),
-    ("Dashboard-8", "Advanced Analytics", "Confidence scoring (High/Medium/Low)", "pct", 75, 95, "%"),
-    ("Dashboard-8", "Advanced Analytics", "Total assets tracked (Meters/Feeders/DTs)", "count", 5000, 85000, "count"),
-    ("Dashboard-8", "Advanced Analytics", "Overloaded DTs identified and monitored", "count", 15, 180, "count"),
-    ("Dashboard-8", "Advanced Analytics", "Mismatch analysis (Feeder→DT, DT→Meter)", "count", 20, 450, "count"),
-    ("Dashboard-8", "Advanced Analytics", "Correctly mapped meters (%)", "pct", 88, 99, "%"),
-    ("Dashboard-8", "Advanced Analytics", "Incorrectly mapped meters requiring correction (%)", "pct", 0.5, 8, "%"),
-    ("Dashboard-8", "Advanced Analytics", "Verification pending count", "count", 50, 1200, "count"),
-    ("Dashboard-8", "Advanced Analytics", "Correction cycle time (avg days)", "count", 2, 18, "days"),
-    ("Dashboard-8", "Advanced Analytics", "Transformer utilization rate (% of rated capacity)", "pct", 45, 88, "%"),
-    ("Dashboard-8", "Advanced Analytics", "Field verification completion rate", "pct", 82, 99, "%"),
-    ("Dashboard-9", "Analytics", "Tamper sequence detection", "count", 5, 75, "count"),
-    ("Dashboard-9", "Analytics", "Voltage/Current imbalance", "count", 8, 95, "count"),
-    ("Dashboard-9", "Analytics", "Power factor deterioration", "count", 3, 42, "count"),
-    ("Dashboard-9", "Analytics", "Overload / MD breach risk", "count", 12, 88, "count"),
-    ("Dashboard-9", "Analytics", "Hidden outage pockets", "count", 2, 35, "count"),
-    ("Dashboard-9", "Analytics", "Data quality issues", "count", 15, 120, "count"),
-    ("Dashboard-9", "Analytics", "Reverse flow", "count", 0, 28, "count"),
-    ("Dashboard-9", "Analytics", "Consumption spikes/drops", "count", 20, 180, "count"),
-    ("Dashboard-9", "Analytics", "Phase-level mapping accuracy", "pct", 82, 98, "%"),
-    ("Dashboard-9", "Analytics", "Phase imbalance reduced by minimum 30%", "pct", 28, 55, "%"),
-    ("Dashboard-9", "Analytics", "Real-time phase load monitoring per transformer", "pct", 85, 99, "%"),
-    ("Dashboard-9", "Analytics", "Imbalance alerts when threshold exceeded", "count", 10, 95, "count"),
-    ("Dashboard-9", "Analytics", "Phase transfer recommendations (what-if)", "count", 5, 65, "count"),
+import numpy as np
+
+import instrumentation
+import loading_sketch
+import ranking
+import wire_format
+from kpi_registry import (DEFAULT_PERIOD, KPI_SPECS, SEED, generate_value, kpi_rng, parse_period, shift_period,
+                          trend_months)
+
+# Bump when value/trend/chart logic changes so incremental runs recompute everything
+EXPORT_VERSION = 9
+
+MONTHS = trend_months(DEFAULT_PERIOD)  # Aug .. Jan
+
+OUT_DIR = Path(__file__).resolve().parent
+# Per-dashboard shards + manifest.json, fetched lazily by index.html
+SHARD_DIR = "dashboards"
+EXPORT_MANIFEST = "export_manifest.json"
+CUBE_DIR = "cube"
+
+# Ranked asset lists attached to "Top ..." KPIs:
+# KPI name -> (asset prefix, asset count, metric, unit, largest first, dummy lo, dummy hi)
+RANKINGS = {
+    "Top X Best/Worst Feeders/DTs": ("FDR", 120, "AT&C Loss", "%", True, 5, 45),
+    "Top High Loss DTs / Feeders": ("DT", 2400, "LT Loss", "%", True, 3, 40),
+    "Top High-Loss Feeders / DTs": ("FDR", 120, "Feeder Loss", "%", True, 4, 35),
+    "Feeders with Maximum Outages": ("FDR", 120, "Outage Duration", "min", True, 0, 900),
+    "Top Overloaded DTs / Feeders": ("DT", 2400, "Peak Loading", "%", True, 40, 160),
+    "Top Overloaded Assets": ("DT", 2400, "Mean Loading", "%", True, 30, 130),
+    "Top Power Quality Issues": ("DT", 2400, "Voltage Unbalance", "%", True, 0, 12),
+}
+RANK_CHUNK = 500
+
+# KPI that carries the DT loading distribution (bands, percentiles, load duration curve)
+DISTRIBUTION_KPI = "Load Duration Curve & Asset Loading Spread"
+DUMMY_DTS = 200
+DUMMY_DAYS = 30
+
+
+def dummy_ranking(name, period=DEFAULT_PERIOD, k=ranking.DEFAULT_K):
+    """Stream seeded dummy asset-level values through a TopK, RANK_CHUNK assets at a time."""
+    prefix, count, _, _, largest, lo, hi = RANKINGS[name]
+    rng = kpi_rng(name + "|ranking", period)
+    top = ranking.TopK(k, largest)
+    width = len(str(count))
+    for start in range(0, count, RANK_CHUNK):
+        ids = [f"{prefix}-{i:0{width}d}" for i in range(start, min(start + RANK_CHUNK, count))]
+        top.push_many(ids, [round(rng.uniform(lo, hi), 2) for _ in ids])
+    return top.items()
+
+
+def dummy_distribution(period=DEFAULT_PERIOD):
+    """Seeded dummy DT loading readings for a month, streamed a day at a time through a LoadingSketch."""
+    seed = int(hashlib.sha1(f"{SEED}|{period}|{DISTRIBUTION_KPI}".encode()).hexdigest()[:16], 16)
+    rng = np.random.default_rng(seed)
+    sketch = loading_sketch.LoadingSketch(DUMMY_DTS)
+    level = rng.lognormal(np.log(55), 0.35, DUMMY_DTS)
+    dts = np.repeat(np.arange(DUMMY_DTS), 96)
+    shape = np.tile(0.75 + 0.35 * np.sin(np.arange(96) * (2 * np.pi / 96) - 1.3), DUMMY_DTS)
+    for _ in range(DUMMY_DAYS):
+        sketch.update(dts, level[dts] * shape * rng.lognormal(0, 0.15, len(dts)))
+    return loading_sketch.distribution(sketch.rollup(None))
+
+
+def _epoch(period):
+    """Epoch seconds of the start (UTC) of a YYYY-MM month."""
+    year, month = parse_period(period)
+    return int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp())
+
+
+def trend_periods(period, n=len(MONTHS)):
+    """YYYY-MM of each trend point ending at period (the months behind trend_months labels)."""
+    return [shift_period(period, i - n + 1) for i in range(n)]
+
+
+def seeded_value(spec, period):
+    """Dummy value of a KPI for a month: the first draw of its (period, KPI) stream."""
+    _, _, name, vtype, lo, hi, unit = spec
+    return generate_value(vtype, lo, hi, unit, kpi_rng(name, period))
+
+
+def build_kpi(spec, computed=None, period=DEFAULT_PERIOD, rankings=None, distributions=None, trends=None,
+              breakdowns=None):
+    dashboard, dept, name, vtype, lo, hi, unit = spec
+    value = seeded_value(spec, period)
+    if computed and name in computed:
+        value = computed[name]
+    kpi = { "name": name, "department": dept, "value": value, "unit": unit }
+    # Add trend (last 6 months) for chart-friendly KPIs: each point is that month's own seeded
+    # value, so a backfilled month and the trends of later months agree
+    if vtype in ("pct", "minutes", "index", "score"):
+        trend = [seeded_value(spec, p) for p in trend_periods(period)]
+        trend[-1] = value  # current month = value
+        known = (trends or {}).get(name) or {}
+        for i, month in enumerate(trend_periods(period, len(trend))):
+            if month in known:
+                trend[i] = known[month]
+        kpi["trend"] = trend
+    if name in RANKINGS:
+        _, _, metric, metric_unit, _, _, _ = RANKINGS[name]
+        items = (rankings or {}).get(name)
+        if items is None:
+            items = dummy_ranking(name, period)
+        kpi["ranking"] = {"metric": metric, "unit": metric_unit,
+                          "items": [{"name": str(a), "value": v} for a, v in items]}
+    if name == DISTRIBUTION_KPI:
+        dist = (distributions or {}).get(name)
+        kpi["distribution"] = dist if dist is not None else dummy_distribution(period)
+    if name in (breakdowns or {}):
+        kpi["breakdown"] = [{"name": str(label), "value": n} for label, n in breakdowns[name].items()]
+    return kpi
+
+
+def _items(kpis, labels=None):
+    return [{"name": k["name"], "value": k["value"], "unit": k["unit"]} for k in kpis]
+
+
+def _loss_trend(ks, labels=MONTHS):
+    return {
+        "labels": labels,
+        "datasets": [{"name": k["name"].replace(" (%)", ""), "kpi": k["name"], "data": k.get("trend", [k["value"]]*6)} for k in ks]
+    }
+
+
+def _reliability_trend(ks, labels=MONTHS):
+    saidi = next((k for k in ks if k["name"] == "SAIDI"), None)
+    saifi = next((k for k in ks if k["name"] == "SAIFI"), None)
+    if not (saidi and saifi):
+        return None
+    return {
+        "labels": labels,
+        "SAIDI": saidi.get("trend", [saidi["value"]]*6),
+        "SAIFI": saifi.get("trend", [saifi["value"]]*6)
+    }
+
+
+def _tamper(ks, labels=None):
+    return [{"name": k["name"].replace("Number of Tamper Alerts (", "").replace(")", ""), "value": k["value"]} for k in ks]
+
+
+# Chart-specific datasets: (dashboard, chart key, select(kpis) -> KPIs read, build(selected, trend labels) -> block)
+CHARTS = [
+    ("Dashboard-1", "lossTrend", lambda ks: [k for k in ks if "Loss" in k["name"] and k["unit"] == "%"][:4], _loss_trend),
+    ("Dashboard-1", "efficiency", lambda ks: [k for k in ks if "Efficiency" in k["name"] or "AT&C" in k["name"]], _items),
+    ("Dashboard-2", "reliabilityTrend", lambda ks: [k for k in ks if k["name"] in ("SAIDI", "SAIFI")], _reliability_trend),
+    ("Dashboard-2", "outageMetrics", lambda ks: [k for k in ks if "Outage" in k["name"] or "MTTR" in k["name"] or "MTTI" in k["name"]][:6], _items),
+    ("Dashboard-3", "loadingBands", lambda ks: [k for k in ks if "Loading" in k["name"] or "Load" in k["name"]][:5], _items),
+    ("Dashboard-4", "voltageQuality", lambda ks: [k for k in ks if "Voltage" in k["name"] or "Power Factor" in k["name"] or "Unbalance" in k["name"]][:8], _items),
+    ("Dashboard-5", "tamperByType", lambda ks: [k for k in ks if "Tamper" in k["name"]], _tamper),
+    ("Dashboard-6", "theftRevenue", lambda ks: [k for k in ks if "Theft" in k["name"] or "Revenue" in k["name"] or "Risk" in k["name"]], _items),
+    ("Dashboard-7", "communication", lambda ks: [k for k in ks if "Signal" in k["name"] or "Packet" in k["name"] or "retry" in k["name"] or "Non-reporting" in k["name"]], _items),
+    ("Dashboard-8", "mappingAccuracy", lambda ks: [k for k in ks if "Mapping" in k["name"] or "mapped" in k["name"] or "Accuracy" in k["name"]][:8], _items),
+    ("Dashboard-9", "anomalyPhase", lambda ks: ks[:10], _items),
 ]
 
-MONTHS = ["Aug", "Sep", "Oct", "Nov", "Dec", "Jan"]
 
-def main():
-    random.seed(42)
+def _kpi_rows(kpi, rankings=None):
+    """Input rows behind a KPI: ranked assets / loading readings streamed, else 1."""
+    if "ranking" in kpi:
+        items = (rankings or {}).get(kpi["name"])
+        return len(items) if items is not None else RANKINGS[kpi["name"]][1]
+    if "distribution" in kpi:
+        return kpi["distribution"].get("readings", 1)
+    return 1
+
+
+def _hash(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def kpi_hash(spec, computed=None, inputs=None, period=DEFAULT_PERIOD, rankings=None, distributions=None,
+             trends=None, breakdowns=None):
+    """Content hash of everything a KPI value depends on."""
+    name = spec[2]
+    return _hash([EXPORT_VERSION, SEED, period, list(spec), (computed or {}).get(name), (inputs or {}).get(name),
+                  (rankings or {}).get(name), (distributions or {}).get(name), (trends or {}).get(name),
+                  (breakdowns or {}).get(name)])
+
+
+def build_dashboards(computed=None, inputs=None, previous=None, period=DEFAULT_PERIOD, dashboard_ids=None,
+                     rankings=None, distributions=None, recorder=None, trends=None, breakdowns=None):
+    """
+    computed: optional {KPI Name: value} from kpi_engine.compute_kpis, replacing the dummy value.
+    inputs: optional {KPI Name: input fingerprint}, e.g. profile_store.partition_hashes(...) of
+        the partitions the KPI was computed from.
+    previous: (manifest, dashboards) of the last export; unchanged KPIs and chart blocks are
+        reused from it.
+    period: YYYY-MM; values are seeded per (period, KPI) and trends end at this month.
+    dashboard_ids: optional subset of dashboards to build.
+    rankings: optional {KPI Name: [(asset, value)] best first}, e.g. ranking.Ranker.result()
+        over real asset-level results, replacing the dummy ranked list of a RANKINGS KPI.
+    distributions: optional {DISTRIBUTION_KPI: loading_sketch.distribution(...)} replacing the
+        dummy DT loading distribution.
+    recorder: optional instrumentation.Recorder; each recomputed KPI and chart block is a stage.
+    trends: optional {KPI Name: {YYYY-MM: value}}, e.g. energy_audit.trend_values(...); months
+        present replace the dummy trend points.
+    breakdowns: optional {KPI Name: {label: count}}, e.g. anomaly_detector.breakdowns(...),
+        attached to the KPI as "breakdown" items.
+    Returns (dashboards, manifest, stats).
+    """
+    labels = trend_months(period)
+    prev_manifest, prev_dashboards = previous or ({}, {})
+    prev_kpis = {}
+    for dval in prev_dashboards.values():
+        for k in dval.get("kpis", []):
+            prev_kpis[k["name"]] = k
+    prev_kpi_hashes = prev_manifest.get("kpis", {})
+    prev_chart_hashes = prev_manifest.get("charts", {})
+
     dashboards = {}
     for d in range(1, 10):
         key = f"Dashboard-{d}"
+        if dashboard_ids is not None and key not in dashboard_ids:
+            continue
         dashboards[key] = { "title": f"Dashboard-{d}", "departments": [], "kpis": [], "charts": {} }
 
+    manifest = {"version": EXPORT_VERSION, "period": period, "kpis": {}, "charts": {}}
+    stats = {"kpis": 0, "kpis_reused": 0, "charts": 0, "charts_reused": 0, "dirty": set()}
     for spec in KPI_SPECS:
-        dashboard, dept, name, vtype, lo, hi, unit = spec
-        value = generate_value(vtype, lo, hi, unit)
+        dashboard, dept, name = spec[:3]
+        if dashboard not in dashboards:
+            continue
+        h = kpi_hash(spec, computed, inputs, period, rankings, distributions, trends, breakdowns)
+        manifest["kpis"][name] = h
+        if prev_kpi_hashes.get(name) == h and name in prev_kpis:
+            kpi = prev_kpis[name]
+            stats["kpis_reused"] += 1
+        else:
+            with instrumentation.stage(recorder, "kpi", dashboard=dashboard, kpi=name) as st:
+                kpi = build_kpi(spec, computed, period, rankings, distributions, trends, breakdowns)
+                st["rows"] = _kpi_rows(kpi, rankings)
+            stats["kpis"] += 1
+            stats["dirty"].add(dashboard)
         if dept not in dashboards[dashboard]["departments"]:
             dashboards[dashboard]["departments"].append(dept)
-        kpi = { "name": name, "department": dept, "value": value, "unit": unit }
-        # Add trend (last 6 months) for chart-friendly KPIs
-        if vtype in ("pct", "minutes", "index", "score") and "trend" not in kpi:
-            trend = []
-            for _ in MONTHS:
-                trend.append(generate_value(vtype, max(lo, value * 0.7), min(hi, value * 1.3), unit))
-            trend[-1] = value  # current month = value
-            kpi["trend"] = trend
         dashboards[dashboard]["kpis"].append(kpi)
 
-    # Chart-specific datasets
+    for dkey, chart, select, build in CHARTS:
+        if dkey not in dashboards:
+            continue
+        selected = select(dashboards[dkey]["kpis"])
+        ckey = f"{dkey}/{chart}"
+        h = _hash([EXPORT_VERSION, chart, [manifest["kpis"][k["name"]] for k in selected]])
+        manifest["charts"][ckey] = h
+        prev_block = prev_dashboards.get(dkey, {}).get("charts", {}).get(chart)
+        if prev_chart_hashes.get(ckey) == h and prev_block is not None:
+            block = prev_block
+            stats["charts_reused"] += 1
+        else:
+            with instrumentation.stage(recorder, "chart", dashboard=dkey, chart=chart) as st:
+                block = build(selected, labels)
+                st["rows"] = len(selected)
+            stats["charts"] += 1
+            stats["dirty"].add(dkey)
+        if block is not None:
+            dashboards[dkey]["charts"][chart] = block
+
+    # Dashboards that gained or lost KPIs/charts since the last export
     for dkey, dval in dashboards.items():
-        kpis = dval["kpis"]
-        labels = MONTHS
-        if dkey == "Dashboard-1":
-            loss_kpis = [k for k in kpis if "Loss" in k["name"] and k["unit"] == "%"]
-            dval["charts"]["lossTrend"] = {
-                "labels": labels,
-                "datasets": [{"name": k["name"].replace(" (%)", ""), "data": k.get("trend", [k["value"]]*6)} for k in loss_kpis[:4]]
-            }
-            eff_kpis = [k for k in kpis if "Efficiency" in k["name"] or "AT&C" in k["name"]]
-            dval["charts"]["efficiency"] = [{"name": k["name"], "value": k["value"], "unit": k["unit"]} for k in eff_kpis]
-        if dkey == "Dashboard-2":
-            saidi = next((k for k in kpis if k["name"] == "SAIDI"), None)
-            saifi = next((k for k in kpis if k["name"] == "SAIFI"), None)
-            if saidi and saifi:
-                dval["charts"]["reliabilityTrend"] = {
-                    "labels": labels,
-                    "SAIDI": saidi.get("trend", [saidi["value"]]*6),
-                    "SAIFI": saifi.get("trend", [saifi["value"]]*6)
-                }
-            outage_kpis = [k for k in kpis if "Outage" in k["name"] or "MTTR" in k["name"] or "MTTI" in k["name"]][:6]
-            dval["charts"]["outageMetrics"] = [{"name": k["name"], "value": k["value"], "unit": k["unit"]} for k in outage_kpis]
-        if dkey == "Dashboard-3":
-            loading = [k for k in kpis if "Loading" in k["name"] or "Load" in k["name"]][:5]
-            dval["charts"]["loadingBands"] = [{"name": k["name"], "value": k["value"], "unit": k["unit"]} for k in loading]
-        if dkey == "Dashboard-4":
-            voltage = [k for k in kpis if "Voltage" in k["name"] or "Power Factor" in k["name"] or "Unbalance" in k["name"]][:8]
-            dval["charts"]["voltageQuality"] = [{"name": k["name"], "value": k["value"], "unit": k["unit"]} for k in voltage]
-        if dkey == "Dashboard-5":
-            tamper = [k for k in kpis if "Tamper" in k["name"]]
-            dval["charts"]["tamperByType"] = [{"name": k["name"].replace("Number of Tamper Alerts (", "").replace(")", ""), "value": k["value"]} for k in tamper]
-        if dkey == "Dashboard-6":
-            theft_rev = [k for k in kpis if "Theft" in k["name"] or "Revenue" in k["name"] or "Risk" in k["name"]]
-            dval["charts"]["theftRevenue"] = [{"name": k["name"], "value": k["value"], "unit": k["unit"]} for k in theft_rev]
-        if dkey == "Dashboard-7":
-            comm = [k for k in kpis if "Signal" in k["name"] or "Packet" in k["name"] or "retry" in k["name"] or "Non-reporting" in k["name"]]
-            dval["charts"]["communication"] = [{"name": k["name"], "value": k["value"], "unit": k["unit"]} for k in comm]
-        if dkey == "Dashboard-8":
-            mapping = [k for k in kpis if "Mapping" in k["name"] or "mapped" in k["name"] or "Accuracy" in k["name"]]
-            dval["charts"]["mappingAccuracy"] = [{"name": k["name"], "value": k["value"], "unit": k["unit"]} for k in mapping[:8]]
-        if dkey == "Dashboard-9":
-            anomaly_phase = kpis[:10]
-            dval["charts"]["anomalyPhase"] = [{"name": k["name"], "value": k["value"], "unit": k["unit"]} for k in anomaly_phase]
-
-    out_path = Path(__file__).resolve().parent / "dashboards.json"
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(dashboards, f, indent=2)
+        if prev_dashboards.get(dkey) != dval:
+            stats["dirty"].add(dkey)
+    return dashboards, manifest, stats
+
+
+def _write_json(path, obj, **kwargs):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, **kwargs)
+    tmp.replace(path)
+
+
+def load_previous(out_dir=OUT_DIR, period=DEFAULT_PERIOD):
+    """(export manifest, dashboards) of the last run, or None if there is nothing usable."""
+    shard_dir = out_dir / SHARD_DIR
+    try:
+        with open(shard_dir / EXPORT_MANIFEST, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != EXPORT_VERSION or manifest.get("period") != period:
+            return None
+        dashboards = {}
+        with open(shard_dir / "manifest.json", encoding="utf-8") as f:
+            for entry in json.load(f)["dashboards"]:
+                with open(out_dir / entry["file"], encoding="utf-8") as g:
+                    dashboards[entry["id"]] = json.load(g)
+        return manifest, dashboards
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def write_shards(dashboards, out_dir=OUT_DIR, only=None, shard_dir=SHARD_DIR):
+    """One compact JSON file (plus .col.json / .bin columnar variants) per dashboard under
+    dashboards/, plus a small manifest.json. The .bin is only kept (and listed) when it is
+    smaller than the .col.json: for small dashboards its padding and header outweigh the packing.
+    only: optional set of dashboard ids to rewrite (the others are left untouched).
+    shard_dir: directory relative to out_dir (manifest file paths are relative to out_dir)."""
+    rel_dir = shard_dir
+    shard_dir = out_dir / rel_dir
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    entries = []
+    for dkey, dval in dashboards.items():
+        if only is None or dkey in only:
+            _write_json(shard_dir / f"{dkey}.json", dval, separators=(",", ":"))
+            # Columnar variants (wire_format.py): dictionary-encoded JSON and the binary container
+            col = wire_format.encode(dval)
+            _write_json(shard_dir / f"{dkey}.col.json", col, separators=(",", ":"))
+            data = wire_format.to_binary(col)
+            if len(data) < (shard_dir / f"{dkey}.col.json").stat().st_size:
+                tmp = shard_dir / f"{dkey}.bin.tmp"
+                tmp.write_bytes(data)
+                tmp.replace(shard_dir / f"{dkey}.bin")
+            else:
+                (shard_dir / f"{dkey}.bin").unlink(missing_ok=True)
+        entry = {
+            "id": dkey,
+            "title": dval["title"],
+            "departments": dval["departments"],
+            "kpiCount": len(dval["kpis"]),
+            "file": f"{rel_dir}/{dkey}.json",
+            "col": f"{rel_dir}/{dkey}.col.json",
+        }
+        if (shard_dir / f"{dkey}.bin").exists():
+            entry["bin"] = f"{rel_dir}/{dkey}.bin"
+        entries.append(entry)
+    manifest_path = shard_dir / "manifest.json"
+    _write_json(manifest_path, {"dashboards": entries}, indent=2)
+    return manifest_path
+
+
+def main(computed=None, inputs=None, incremental=False, out_dir=OUT_DIR, period=DEFAULT_PERIOD, cube_store=None,
+         rankings=None, last_seen_store=None, series_days=None, loading_store=None, distributions=None,
+         trace_memory=False, profile=False, mapping_store=None, anomaly_store=None, audit_store=None, trends=None,
+         breakdowns=None, reliability_store=None, tamper_store=None, kpi_store=None):
+    recorder = instrumentation.Recorder("export", trace_memory)
+    metrics_dir = out_dir / instrumentation.METRICS_DIR
+    with instrumentation.profiled(metrics_dir / "export.prof" if profile else None):
+        dashboards = _export(
+            recorder, computed=computed, inputs=inputs, incremental=incremental, out_dir=out_dir, period=period,
+            cube_store=cube_store, rankings=rankings, last_seen_store=last_seen_store, series_days=series_days,
+            loading_store=loading_store, distributions=distributions, mapping_store=mapping_store,
+            anomaly_store=anomaly_store, audit_store=audit_store, trends=trends, breakdowns=breakdowns,
+            reliability_store=reliability_store, tamper_store=tamper_store, kpi_store=kpi_store)
+    recorder.close()
+    summary = recorder.summary()
+    slow = ", ".join(f"{r['kpi']} {r['seconds'] * 1000:.1f} ms" for r in recorder.slowest("kpi", 3))
+    print(f"Metrics: {recorder.save(metrics_dir)} ({summary['seconds']:.2f} s"
+          + (f"; slowest KPIs: {slow}" if slow else "") + ")")
+    return dashboards
+
+
+def _export(recorder, *, computed, inputs, incremental, out_dir, period, cube_store, rankings, last_seen_store,
+            series_days, loading_store, distributions, mapping_store, anomaly_store, audit_store, trends, breakdowns,
+            reliability_store, tamper_store, kpi_store):
+    # Keyword-only: main() forwards a long list of same-typed options
+    if last_seen_store is not None:
+        import last_seen
+        with recorder.stage("last_seen") as st:
+            index, _ = last_seen.update_from_store(last_seen_store)
+            st["rows"] = len(index)
+        # As of the period end, or now while the period is still running
+        now = min(int(time.time()), _epoch(shift_period(period, 1)))
+        computed = {**last_seen.dashboard_values(index, now), **(computed or {})}
+    if loading_store is not None:
+        with recorder.stage("loading_sketch") as st:
+            system = loading_sketch.build_from_store(loading_store).rollup(None)
+            st["rows"] = int(system.bands.sum())
+        computed = {**loading_sketch.dashboard_values(system), **(computed or {})}
+        distributions = {DISTRIBUTION_KPI: loading_sketch.distribution(system), **(distributions or {})}
+    if mapping_store is not None:
+        import dt_mapping
+        with recorder.stage("dt_mapping") as st:
+            mapping = dt_mapping.load(mapping_store)
+            st["rows"] = len(mapping["meter"])
+        computed = {**dt_mapping.dashboard_values(mapping), **(computed or {})}
+    if anomaly_store is not None:
+        import anomaly_detector
+        with recorder.stage("anomalies") as st:
+            _, new = anomaly_detector.update_store(anomaly_store)
+            records = anomaly_detector.load_records(anomaly_store, period)
+            st["rows"] = len(new)
+        computed = {**anomaly_detector.dashboard_values(records), **(computed or {})}
+        breakdowns = {**anomaly_detector.breakdowns(records), **(breakdowns or {})}
+    if reliability_store is not None:
+        import reliability
+        with recorder.stage("reliability") as st:
+            result = reliability.indices_from_store(reliability_store, period)
+            st["rows"] = len(result["consumer"]["customers"])
+        computed = {**reliability.dashboard_values(result), **(computed or {})}
+    if tamper_store is not None:
+        import tamper_detector
+        with recorder.stage("tamper") as st:
+            detector = tamper_detector.detect_store(tamper_store, period)
+            st["rows"] = detector.match_count
+        computed = {**tamper_detector.dashboard_values(detector), **(computed or {})}
+    if audit_store is not None:
+        import energy_audit
+        with recorder.stage("energy_audit") as st:
+            audit = energy_audit.audit_store(audit_store, trend_periods(period))
+            st["rows"] = audit["stats"]["rows"]
+        computed = {**energy_audit.dashboard_values(audit, period), **(computed or {})}
+        trends = {**energy_audit.trend_values(audit), **(trends or {})}
+        rankings = {**energy_audit.rankings(audit, period), **(rankings or {})}
+    if kpi_store is not None:
+        import kpi_engine
+        with recorder.stage("kpi_engine") as st:
+            values = kpi_engine.compute_kpis(**kpi_engine.inputs_from_store(kpi_store, period))
+            st["rows"] = len(values)
+        # Last, so the dedicated engines above keep their figures
+        computed = {**values, **(computed or {})}
+    with recorder.stage("load_previous"):
+        previous = load_previous(out_dir, period) if incremental else None
+    with recorder.stage("build") as st:
+        dashboards, manifest, stats = build_dashboards(computed, inputs, previous, period, rankings=rankings,
+                                                       distributions=distributions, recorder=recorder, trends=trends,
+                                                       breakdowns=breakdowns)
+        st["rows"] = stats["kpis"] + stats["kpis_reused"]
+    dirty = stats["dirty"] if previous is not None else None
+    out_path = out_dir / "dashboards.json"
+    if dirty is None or dirty:
+        with recorder.stage("write_dashboards_json") as st:
+            with open(out_path, "w", encoding="utf-8") as f:
+                json.dump(dashboards, f, indent=2)
+            st["rows"] = len(dashboards)
+    with recorder.stage("write_shards") as st:
+        manifest_path = write_shards(dashboards, out_dir, only=dirty)
+        _write_json(out_dir / SHARD_DIR / EXPORT_MANIFEST, manifest, indent=1, sort_keys=True)
+        st["rows"] = len(dashboards) if dirty is None else len(dirty)
     print(f"Exported: {out_path}")
+    print(f"Exported: {manifest_path} (+ {len(dashboards) if dirty is None else len(dirty)} shards)")
+    if series_days:
+        import trend_series
+        with recorder.stage("series") as st:
+            path = trend_series.write_series(dashboards, out_dir / SHARD_DIR, period, series_days)
+            st["rows"] = series_days * 96
+        print(f"Exported: {path} ({series_days} days at {', '.join(trend_series.RESOLUTIONS)})")
+    if cube_store is not None:
+        import kpi_cube
+        with recorder.stage("cube"):
+            path = kpi_cube.build_from_store(cube_store, out_dir / SHARD_DIR / CUBE_DIR)
+        print(f"Exported: {path} (aggregate cube)")
+    if previous is not None:
+        print(f"Incremental: {stats['kpis']} KPIs / {stats['charts']} charts recomputed, "
+              f"{stats['kpis_reused']} / {stats['charts_reused']} reused")
+    return dashboards
+
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Export dashboards.json and per-dashboard shards")
+    parser.add_argument("--incremental", action="store_true",
+                        help="reuse KPIs/charts whose input hashes match the last export manifest")
+    parser.add_argument("--period", default=DEFAULT_PERIOD, help="YYYY-MM (default: %(default)s)")
+    parser.add_argument("--cube-store", metavar="ROOT",
+                        help="also build the drill-down aggregate cube from this profile_store root")
+    parser.add_argument("--last-seen", metavar="ROOT",
+                        help="update the last-seen index of this profile_store root and use it for Dashboard-7")
+    parser.add_argument("--series", type=int, metavar="DAYS",
+                        help="also write full-resolution 15-minute / daily trend series covering DAYS days")
+    parser.add_argument("--loading-store", metavar="ROOT",
+                        help="compute the Dashboard-3 DT loading distribution from this profile_store root")
+    parser.add_argument("--mapping-store", metavar="ROOT",
+                        help="use the consumer-to-DT mapping last inferred by dt_mapping.py in this root for Dashboard-8")
+    parser.add_argument("--anomaly-store", metavar="ROOT",
+                        help="run the consumption anomaly detector over new partitions of this root for Dashboards 5 / 9")
+    parser.add_argument("--audit-store", metavar="ROOT",
+                        help="energy-audit this profile_store root for the Dashboard-1 loss / efficiency KPIs and trends")
+    parser.add_argument("--reliability-store", metavar="ROOT",
+                        help="compute the Dashboard-2 SAIDI / SAIFI / CAIDI / CAIFI / MAIFI from this root's event profile")
+    parser.add_argument("--tamper-store", metavar="ROOT",
+                        help="count Dashboard-9 tamper sequences in this root's event profile")
+    parser.add_argument("--kpi-store", metavar="ROOT",
+                        help="compute the kpi_engine loading / PF / demand / loss / billing KPIs from this root's profiles")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="record tracemalloc peak memory per stage / KPI / chart (about 2x slower)")
+    parser.add_argument("--profile", action="store_true", help="dump cProfile stats to run_metrics/export.prof")
+    args = parser.parse_args()
+    main(incremental=args.incremental, period=args.period, cube_store=args.cube_store, last_seen_store=args.last_seen,
+         series_days=args.series, loading_store=args.loading_store, trace_memory=args.trace_memory,
+         profile=args.profile, mapping_store=args.mapping_store, anomaly_store=args.anomaly_store,
+         audit_store=args.audit_store, reliability_store=args.reliability_store, tamper_store=args.tamper_store,
+         kpi_store=args.kpi_store)
@@ -0,0 +1,257 @@
+"""
+Run instrumentation for the KPI pipeline and the dashboard server.
+
+A Recorder collects one record per stage ({"stage", labels..., "seconds", "rows", "peak_mb"}):
+
+    rec = Recorder("export", trace_memory=True)
+    with rec.stage("kpi", kpi=name, dashboard=d) as s:
+        ...
+        s["rows"] = n
+
+Stages nest (per-KPI stages inside "build"); peak_mb is the tracemalloc peak reached inside
+the stage, including its children, and is only recorded when trace_memory is on (tracemalloc
+roughly doubles run time). Each run's summary is saved to run_metrics/<run>.json, where
+serve.py picks it up for /metrics. profiled() wraps a run in cProfile and dumps the stats.
+
+ServerMetrics holds the server side: request counts, bytes served and latency histograms per
+route. prometheus_text() renders both in the Prometheus text exposition format.
+"""
+import bisect
+import contextlib
+import cProfile
+import json
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS_DIR = "run_metrics"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+PREFIX = "kpi"
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (None where unavailable)."""
+    if resource is None:
+        return None
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(kb / 1024, 1)  # Linux reports KiB
+
+
+class Recorder:
+    def __init__(self, run, trace_memory=False):
+        self.run = run
+        self.trace_memory = trace_memory
+        self.records = []
+        self.started = datetime.now().isoformat(timespec="seconds")
+        self._t0 = time.perf_counter()
+        self._peaks = []  # running tracemalloc peak of each open stage
+        self._owns_tracing = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+
+    @contextlib.contextmanager
+    def stage(self, name, **labels):
+        record = {"stage": name, **labels}
+        if self.trace_memory:
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._peaks.append(tracemalloc.get_traced_memory()[0])
+        t0 = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = round(time.perf_counter() - t0, 6)
+            record.setdefault("rows", None)
+            if self.trace_memory:
+                peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                record["peak_mb"] = round(peak / 1e6, 3)
+                if self._peaks:
+                    # Children's peaks count towards the enclosing stage
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+                tracemalloc.reset_peak()
+            self.records.append(record)
+
+    def summary(self):
+        return {
+            "run": self.run,
+            "started": self.started,
+            "seconds": round(time.perf_counter() - self._t0, 6),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": self.records,
+        }
+
+    def slowest(self, stage, n=5):
+        return sorted((r for r in self.records if r["stage"] == stage), key=lambda r: -r["seconds"])[:n]
+
+    def close(self):
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+
+    def save(self, out_dir):
+        """Write the summary to <out_dir>/<run>.json (replacing the previous run's)."""
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        path = out_dir / f"{self.run}.json"
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=1)
+        tmp.replace(path)
+        return path
+
+
+def stage(recorder, name, **labels):
+    """recorder.stage(...), or a no-op yielding a throwaway record when recorder is None."""
+    return recorder.stage(name, **labels) if recorder is not None else contextlib.nullcontext({})
+
+
+@contextlib.contextmanager
+def profiled(path):
+    """cProfile the block and dump the stats to path (None = no profiling)."""
+    if path is None:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(path))
+
+
+def load_runs(metrics_dir):
+    """{run: summary} of every run saved under metrics_dir."""
+    runs = {}
+    for path in sorted(Path(metrics_dir).glob("*.json")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                summary = json.load(f)
+            runs[summary["run"]] = summary
+        except (OSError, ValueError, KeyError):
+            continue
+    return runs
+
+
+# --- Server side ---
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        out, total = [], 0
+        for le, n in zip(list(self.buckets) + ["+Inf"], self.counts):
+            total += n
+            out.append((le, total))
+        return out
+
+    def to_json(self):
+        return {"count": self.count, "sum": round(self.sum, 6), "buckets": {str(le): n for le, n in self.cumulative()}}
+
+
+class ServerMetrics:
+    """Per-route request counts (by status), bytes sent and latency histograms; thread-safe."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.requests = {}  # (route, status) -> count
+        self.bytes = {}  # route -> bytes written (headers included)
+        self.latency = {}  # route -> Histogram
+        self.open_streams = 0
+        self._lock = threading.Lock()
+
+    def observe(self, route, status, seconds, nbytes, latency=True):
+        with self._lock:
+            self.requests[route, status] = self.requests.get((route, status), 0) + 1
+            self.bytes[route] = self.bytes.get(route, 0) + nbytes
+            if latency:
+                self.latency.setdefault(route, Histogram()).observe(seconds)
+
+    def stream(self, delta):
+        with self._lock:
+            self.open_streams += delta
+
+    def to_json(self):
+        with self._lock:
+            routes = sorted(set(self.bytes) | {r for r, _ in self.requests})
+            return {
+                "uptime_seconds": round(time.time() - self.started, 3),
+                "open_streams": self.open_streams,
+                "peak_rss_mb": peak_rss_mb(),
+                "routes": {r: {
+                    "requests": {str(s): n for (rr, s), n in sorted(self.requests.items()) if rr == r},
+                    "bytes": self.bytes.get(r, 0),
+                    "latency": self.latency[r].to_json() if r in self.latency else None,
+                } for r in routes},
+            }
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items() if v is not None)
+    return "{" + body + "}" if body else ""
+
+
+def prometheus_text(server=None, runs=None):
+    """Prometheus text exposition (version 0.0.4) of server metrics and saved pipeline runs."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+        for suffix, labels, value in samples:
+            lines.append(f"{PREFIX}_{name}{suffix}{_labels(**labels)} {value}")
+
+    if server is not None:
+        with server._lock:
+            metric("http_requests_total", "counter", "HTTP requests served.",
+                   [("", {"route": r, "status": s}, n) for (r, s), n in sorted(server.requests.items())])
+            metric("http_response_bytes_total", "counter", "Bytes written to clients, headers included.",
+                   [("", {"route": r}, n) for r, n in sorted(server.bytes.items())])
+            samples = []
+            for r, h in sorted(server.latency.items()):
+                samples += [("_bucket", {"route": r, "le": le}, n) for le, n in h.cumulative()]
+                samples += [("_sum", {"route": r}, round(h.sum, 6)), ("_count", {"route": r}, h.count)]
+            metric("http_request_duration_seconds", "histogram", "Request latency (event streams excluded).", samples)
+            metric("sse_open_streams", "gauge", "Open /events streams.", [("", {}, server.open_streams)])
+            metric("uptime_seconds", "gauge", "Seconds since the server started.",
+                   [("", {}, round(time.time() - server.started, 3))])
+
+    stage_samples, rows, peaks, totals = [], [], [], []
+    for run, s in sorted((runs or {}).items()):
+        totals.append(("", {"run": run}, s["seconds"]))
+        for r in s["stages"]:
+            labels = {"run": run, **{k: v for k, v in r.items() if k not in ("seconds", "rows", "peak_mb")}}
+            stage_samples.append(("", labels, r["seconds"]))
+            if r.get("rows") is not None:
+                rows.append(("", labels, r["rows"]))
+            if r.get("peak_mb") is not None:
+                peaks.append(("", labels, int(r["peak_mb"] * 1e6)))
+    if runs:
+        metric("run_seconds", "gauge", "Wall time of the last pipeline run.", totals)
+        metric("stage_seconds", "gauge", "Wall time per stage / KPI / chart block of the last run.", stage_samples)
+        metric("stage_rows", "gauge", "Rows processed per stage of the last run.", rows)
+        metric("stage_peak_bytes", "gauge", "Traced peak memory per stage of the last run.", peaks)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,228 @@
+"""
+Precomputed hierarchical aggregate cube for drill-down (meter -> DT -> feeder -> substation).
+
+For every level, node, period and KPI the cube stores additive partial aggregates
+(sum, count, min, max). A value enters at its native level (meter kWh at "meter", DT
+loading at "dt") and is folded into every ancestor when the cube is built, so drill-down
+and roll-up queries are array lookups instead of recomputation from raw data.
+
+On disk a cube is a directory of .npy files (float32, memory-mapped on load) plus meta.json:
+    <level>.{sum,count,min,max}.npy    shape (nodes, periods, kpis)
+    <level>.parent.npy                 parent node per node
+    <level>.children.npy / .offsets.npy  CSR child lists of the level below
+"""
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+LEVELS = ("meter", "dt", "feeder", "substation")
+STATS = ("sum", "count", "min", "max")
+META_FILE = "meta.json"
+
+
+class CubeBuilder:
+    def __init__(self, parents, periods, kpis):
+        """
+        parents: {level: parent index array} for every level but the top, e.g.
+            {"meter": meter_dt, "dt": dt_feeder, "feeder": feeder_substation}.
+        """
+        self.periods = list(periods)
+        self.kpis = list(kpis)
+        self.parents = {lvl: np.asarray(parents[lvl], dtype=np.int64) for lvl in LEVELS[:-1]}
+        self.sizes = {lvl: len(self.parents[lvl]) for lvl in LEVELS[:-1]}
+        self.sizes[LEVELS[-1]] = int(self.parents[LEVELS[-2]].max()) + 1 if self.sizes[LEVELS[-2]] else 0
+        shape = lambda lvl: (self.sizes[lvl], len(self.periods), len(self.kpis))
+        self.agg = {
+            lvl: {
+                "sum": np.zeros(shape(lvl)),
+                "count": np.zeros(shape(lvl)),
+                "min": np.full(shape(lvl), np.inf),
+                "max": np.full(shape(lvl), -np.inf),
+            }
+            for lvl in LEVELS
+        }
+        self._p = {p: i for i, p in enumerate(self.periods)}
+        self._k = {k: i for i, k in enumerate(self.kpis)}
+
+    def add(self, level, kpi, period, nodes, values):
+        """Accumulate raw values for nodes of `level` (repeats allowed) into that level only."""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        ok = ~np.isnan(values)
+        nodes, values = nodes[ok], values[ok]
+        a = self.agg[level]
+        p, k = self._p[period], self._k[kpi]
+        n = self.sizes[level]
+        a["sum"][:, p, k] += np.bincount(nodes, weights=values, minlength=n)
+        a["count"][:, p, k] += np.bincount(nodes, minlength=n)
+        np.minimum.at(a["min"][:, p, k], nodes, values)
+        np.maximum.at(a["max"][:, p, k], nodes, values)
+
+    def _fold_up(self):
+        # Children sorted by parent form one contiguous run per parent, so each stat
+        # folds up with a single reduceat instead of a scatter.
+        for child, parent in zip(LEVELS[:-1], LEVELS[1:]):
+            idx = self.parents[child]
+            if not len(idx):
+                continue
+            order = np.argsort(idx, kind="stable")
+            sorted_idx = idx[order]
+            starts = np.flatnonzero(np.r_[True, sorted_idx[1:] != sorted_idx[:-1]])
+            present = sorted_idx[starts]
+            c, pa = self.agg[child], self.agg[parent]
+            for stat, ufunc in (("sum", np.add), ("count", np.add), ("min", np.minimum), ("max", np.maximum)):
+                folded = ufunc.reduceat(c[stat][order], starts, axis=0)
+                pa[stat][present] = ufunc(pa[stat][present], folded)
+
+    def save(self, out_dir):
+        """Roll every level up into its ancestors and write the cube; returns the output path."""
+        self._fold_up()
+        out = Path(out_dir)
+        out.mkdir(parents=True, exist_ok=True)
+        for lvl in LEVELS:
+            a = self.agg[lvl]
+            empty = a["count"] == 0
+            for stat in STATS:
+                arr = a[stat].astype(np.float32)
+                if stat in ("min", "max"):
+                    arr[empty] = np.nan
+                np.save(out / f"{lvl}.{stat}.npy", arr)
+        for child, parent in zip(LEVELS[:-1], LEVELS[1:]):
+            idx = self.parents[child]
+            np.save(out / f"{child}.parent.npy", idx)
+            np.save(out / f"{parent}.children.npy", np.argsort(idx, kind="stable"))
+            np.save(out / f"{parent}.offsets.npy",
+                    np.concatenate([[0], np.cumsum(np.bincount(idx, minlength=self.sizes[parent]))]))
+        with open(out / META_FILE, "w", encoding="utf-8") as f:
+            json.dump({"levels": list(LEVELS), "sizes": self.sizes, "periods": self.periods, "kpis": self.kpis}, f, indent=2)
+        return out
+
+
+class Cube:
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / META_FILE, encoding="utf-8") as f:
+            meta = json.load(f)
+        self.periods, self.kpis, self.sizes = meta["periods"], meta["kpis"], meta["sizes"]
+        self._p = {p: i for i, p in enumerate(self.periods)}
+        self._k = {k: i for i, k in enumerate(self.kpis)}
+        load = lambda name: np.load(self.path / f"{name}.npy", mmap_mode="r")
+        self.stats = {lvl: {s: load(f"{lvl}.{s}") for s in STATS} for lvl in LEVELS}
+        self.parent = {lvl: load(f"{lvl}.parent") for lvl in LEVELS[:-1]}
+        self._children = {lvl: (load(f"{lvl}.children"), load(f"{lvl}.offsets")) for lvl in LEVELS[1:]}
+
+    def _cell(self, level, period, kpi):
+        return self.stats[level], self._p[period], self._k[kpi]
+
+    def value(self, level, node, period, kpi, stat="mean"):
+        """One aggregate: stat is mean, sum, count, min or max."""
+        s, p, k = self._cell(level, period, kpi)
+        if stat == "mean":
+            n = s["count"][node, p, k]
+            return float(s["sum"][node, p, k] / n) if n else float("nan")
+        return float(s[stat][node, p, k])
+
+    def children(self, level, node):
+        """(child level, child node ids) of a node."""
+        i = LEVELS.index(level)
+        if i == 0:
+            return None, np.empty(0, dtype=np.int64)
+        order, offsets = self._children[level]
+        return LEVELS[i - 1], order[offsets[node]:offsets[node + 1]]
+
+    def drill_down(self, level, node, period, kpi, stat="mean"):
+        """{child id: aggregate} for the children of a node."""
+        child_level, ids = self.children(level, node)
+        if child_level is None:
+            return {}
+        s, p, k = self._cell(child_level, period, kpi)
+        if stat == "mean":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                vals = s["sum"][ids, p, k] / s["count"][ids, p, k]
+        else:
+            vals = s[stat][ids, p, k]
+        return dict(zip(ids.tolist(), np.asarray(vals, dtype=float).tolist()))
+
+    def roll_up(self, level, node):
+        """(parent level, parent id) of a node, or (None, None) at the top."""
+        i = LEVELS.index(level)
+        if i == len(LEVELS) - 1:
+            return None, None
+        return LEVELS[i + 1], int(self.parent[level][node])
+
+    def series(self, level, node, kpi, stat="mean"):
+        """Aggregate for every period, in period order."""
+        k = self._k[kpi]
+        s = self.stats[level]
+        if stat == "mean":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return np.asarray(s["sum"][node, :, k] / s["count"][node, :, k], dtype=float)
+        return np.asarray(s[stat][node, :, k], dtype=float)
+
+
+# --- Building from a profile_store root (export pipeline) ---
+
+CUBE_KPIS = ("Energy (kWh)", "Power Factor", "% DT Loading", "% DT Peak Loading")
+
+
+def build_from_store(root, out_dir):
+    """
+    Build the cube from a profile_store root (e.g. synthetic_ami output): monthly meter
+    energy and PF from block profiles, DT mean/peak loading from DT blocks.
+    """
+    import kpi_engine
+    import profile_store
+
+    asset = profile_store.open_partition(root, "asset_master", "master").read()
+    consumer = profile_store.open_partition(root, "consumer_master", "master").read(["meter", "dt"])
+    dt_feeder = np.asarray(asset["feeder"])
+    # Masters without a substation column roll every feeder up into substation 0
+    feeder_sub = np.zeros(int(dt_feeder.max()) + 1, dtype=np.int64)
+    if "substation" in asset:
+        feeder_sub[dt_feeder] = np.asarray(asset["substation"])
+    meter_dt = np.zeros(len(consumer["meter"]), dtype=np.int64)
+    meter_dt[np.asarray(consumer["meter"])] = np.asarray(consumer["dt"])
+
+    parts = profile_store.periods(root, "block_profile")
+    months = sorted({p[:7] for p in parts})
+    builder = CubeBuilder({"meter": meter_dt, "dt": dt_feeder, "feeder": feeder_sub}, months, CUBE_KPIS)
+    n_meter = len(meter_dt)
+    for month in months:
+        kwh = np.zeros(n_meter)
+        kvah = np.zeros(n_meter)
+        for part in (p for p in parts if p.startswith(month)):
+            b = profile_store.open_partition(root, "block_profile", part).read(["meter", "kwh_imp", "kvah_imp"])
+            kwh += np.bincount(b["meter"], weights=b["kwh_imp"], minlength=n_meter)
+            kvah += np.bincount(b["meter"], weights=b["kvah_imp"], minlength=n_meter)
+            d = profile_store.open_partition(root, "dt_block", part).read(["dt", "voltage", "current"])
+            loading = kpi_engine.dt_loading(d, asset)
+            seen = ~np.isnan(loading["loading_pct"])
+            builder.add("dt", "% DT Loading", month, np.flatnonzero(seen), loading["loading_pct"][seen])
+            builder.add("dt", "% DT Peak Loading", month, np.flatnonzero(seen), loading["peak_loading_pct"][seen])
+        meters = np.arange(n_meter)
+        builder.add("meter", "Energy (kWh)", month, meters, np.where(kvah > 0, kwh, np.nan))
+        builder.add("meter", "Power Factor", month, meters, kpi_engine.power_factor(kwh, kvah))
+    return builder.save(out_dir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the hierarchical KPI aggregate cube")
+    parser.add_argument("--store", help="profile_store root to build the cube from")
+    parser.add_argument("--cube", default=str(Path("dashboards") / "cube"), help="cube directory (default: %(default)s)")
+    parser.add_argument("--drill", nargs=4, metavar=("LEVEL", "NODE", "PERIOD", "KPI"),
+                        help="print the children of a node, e.g. feeder 3 2025-01 \"%% DT Loading\"")
+    args = parser.parse_args(argv)
+    if args.store:
+        print(f"Cube: {build_from_store(args.store, args.cube)}")
+    if args.drill:
+        level, node, period, kpi = args.drill
+        cube = Cube(args.cube)
+        print(f"{level} {node}: {cube.value(level, int(node), period, kpi):.3f}")
+        for child, v in cube.drill_down(level, int(node), period, kpi).items():
+            print(f"  {child}: {v:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+Vectorized KPI computation engine.
+Evaluates the FORMULA_MAP formulas on DT Block / Block Profile / Asset Master arrays
+for every DT and meter at once (NumPy batches, no per-row Python loops).
+
+Inputs are plain dicts of column arrays; asset references are dense integer indexes
+(0 .. n-1) into the matching master arrays:
+
+    dt_block     = {"dt": (rows,), "voltage": (rows, 3), "current": (rows, 3)}   # L1/L2/L3
+    asset_master = {"rated_kva": (n_dt,)}
+    block_profile = {"meter": (rows,), "kwh_imp": (rows,), "kvah_imp": (rows,), "current": (rows, 3)}
+    consumer     = {"max_demand": (n_meter,), "sanctioned_load": (n_meter,)}
+    billing      = {"supplied_kwh", "billed_kwh", "amount_billed", "amount_collected"}  # totals
+    energy       = {"dt_kwh": (n_dt,), "consumer_kwh": (n_meter,)}
+    consumer_dt  = (n_meter,)   # DT of each meter: rolls meter figures up to DTs
+
+Block Profile rows can also be reduced partition by partition with meter_block_sums() /
+add_block_sums() and passed as block_sums=...; inputs_from_store() does that for a month
+of a profile_store root.
+"""
+import numpy as np
+
+SQRT3 = np.sqrt(3.0)
+BLOCKS_PER_HOUR = 4  # 15-minute blocks
+# Block Profile rows reduced per slice in inputs_from_store
+STORE_CHUNK_ROWS = 1 << 20
+OVERLOAD_PCT = 80.0
+LOW_PF = 0.85
+MD_BREACH_PCT = 90.0
+IMBALANCE_PCT = 10.0
+# Band edges for "% Loading Bands": 0–50, 50–80, 80–100, >100
+LOADING_BAND_EDGES = (50.0, 80.0, 100.0)
+LOADING_BAND_LABELS = ("0-50%", "50-80%", "80-100%", ">100%")
+# The "% Loading Bands" card is one number: the share in the top two bands (80–100% and >100%),
+# i.e. DTs (here) or readings (loading_sketch.dashboard_values) at or above 80% of rating
+HIGH_LOADING_BANDS = 2
+
+
+def _f64(x):
+    return np.asarray(x, dtype=np.float64)
+
+
+def safe_div(num, den):
+    """Element-wise num / den with NaN where den == 0."""
+    num, den = np.broadcast_arrays(_f64(num), _f64(den))
+    out = np.full(num.shape, np.nan)
+    np.divide(num, den, out=out, where=den != 0)
+    return out
+
+
+def group_sum(values, idx, n):
+    return np.bincount(idx, weights=_f64(values), minlength=n)
+
+
+def group_mean(values, idx, n):
+    return safe_div(group_sum(values, idx, n), np.bincount(idx, minlength=n))
+
+
+def group_max(values, idx, n):
+    out = np.full(n, -np.inf)
+    np.maximum.at(out, idx, _f64(values))
+    out[np.isneginf(out)] = np.nan
+    return out
+
+
+# --- Formula primitives (one per FORMULA_MAP entry) ---
+
+def phase_kva(voltage, current):
+    """Phase kVA = Vphase × Iphase ÷ 1000 (works on (rows, 3) L1/L2/L3 arrays)."""
+    return _f64(voltage) * _f64(current) / 1000.0
+
+
+def dt_kva(voltage, current):
+    """√3 × Vavg × Iavg / 1000 per row."""
+    return SQRT3 * _f64(voltage).mean(axis=-1) * _f64(current).mean(axis=-1) / 1000.0
+
+
+def pct_loading(kva, rated_kva):
+    """(kVA ÷ Rated kVA) × 100."""
+    return safe_div(kva, rated_kva) * 100.0
+
+
+def power_factor(kwh, kvah):
+    """PF = kWh ÷ kVAh."""
+    return safe_div(kwh, kvah)
+
+
+def imbalance_pct(phase_values):
+    """(Max Phase − Avg Phase) ÷ Avg Phase × 100 along the last axis."""
+    v = _f64(phase_values)
+    avg = v.mean(axis=-1)
+    return safe_div(v.max(axis=-1) - avg, avg) * 100.0
+
+
+def lt_loss_pct(dt_kwh, consumer_kwh, consumer_dt):
+    """(DT Energy − Σ Consumer Energy) ÷ DT Energy × 100, per DT."""
+    dt_kwh = _f64(dt_kwh)
+    billed = group_sum(consumer_kwh, consumer_dt, len(dt_kwh))
+    return safe_div(dt_kwh - billed, dt_kwh) * 100.0
+
+
+def billing_efficiency(billed_kwh, supplied_kwh):
+    return safe_div(billed_kwh, supplied_kwh) * 100.0
+
+
+def collection_efficiency(amount_collected, amount_billed):
+    return safe_div(amount_collected, amount_billed) * 100.0
+
+
+def atc_loss(billing_eff_pct, collection_eff_pct):
+    """AT&C = 1 − (Billing Eff × Collection Eff), in %."""
+    return (1.0 - (_f64(billing_eff_pct) / 100.0) * (_f64(collection_eff_pct) / 100.0)) * 100.0
+
+
+def md_utilization_pct(max_demand, sanctioned_load):
+    """(Max Demand ÷ Sanctioned Load) × 100."""
+    return safe_div(max_demand, sanctioned_load) * 100.0
+
+
+def loading_band_counts(loading_pct):
+    """Count assets per LOADING_BAND_LABELS band (NaN loadings are ignored)."""
+    pct = _f64(loading_pct)
+    pct = pct[~np.isnan(pct)]
+    return np.bincount(np.searchsorted(LOADING_BAND_EDGES, pct, side="right"), minlength=len(LOADING_BAND_LABELS))
+
+
+# --- Per-asset batches ---
+
+def dt_loading(dt_block, asset_master):
+    """Per-DT mean/peak kVA and % loading from DT Block rows."""
+    rated = _f64(asset_master["rated_kva"])
+    n = len(rated)
+    idx = np.asarray(dt_block["dt"])
+    kva = dt_kva(dt_block["voltage"], dt_block["current"])
+    mean_kva = group_mean(kva, idx, n)
+    peak_kva = group_max(kva, idx, n)
+    return {
+        "mean_kva": mean_kva,
+        "peak_kva": peak_kva,
+        "loading_pct": pct_loading(mean_kva, rated),
+        "peak_loading_pct": pct_loading(peak_kva, rated),
+        "imbalance_pct": group_mean(imbalance_pct(dt_block["current"]), idx, n),
+    }
+
+
+def meter_block_sums(block_profile, n_meters):
+    """Per-meter Block Profile sums, additive across partitions (add_block_sums): kWh, kVAh,
+    blocks with a PF (kVAh > 0) and those below LOW_PF, peak block kWh and, when the phase
+    currents are given, the sum and count of current imbalance % over blocks with current
+    on all three phases."""
+    idx = np.asarray(block_profile["meter"])
+    kwh, kvah = _f64(block_profile["kwh_imp"]), _f64(block_profile["kvah_imp"])
+    valid = kvah != 0
+    with np.errstate(invalid="ignore"):
+        low = valid & (power_factor(kwh, kvah) < LOW_PF)
+    out = {
+        "kwh": group_sum(kwh, idx, n_meters),
+        "kvah": group_sum(kvah, idx, n_meters),
+        "pf_blocks": np.bincount(idx, weights=valid, minlength=n_meters),
+        "low_pf_blocks": np.bincount(idx, weights=low, minlength=n_meters),
+        "peak_kwh": group_max(kwh, idx, n_meters),
+    }
+    if "current" in block_profile:
+        current = _f64(block_profile["current"])
+        imb = imbalance_pct(current)
+        # Polyphase blocks only: a single-phase meter's idle phases are not an imbalance
+        ok = ~np.isnan(imb) & (current > 0).all(axis=-1)
+        out["imbalance_sum"] = np.bincount(idx[ok], weights=imb[ok], minlength=n_meters)
+        out["imbalance_blocks"] = np.bincount(idx[ok], minlength=n_meters)
+    return out
+
+
+def add_block_sums(a, b):
+    """Combine two meter_block_sums() results (same n_meters)."""
+    if a is None:
+        return b
+    return {k: np.fmax(a[k], b[k]) if k == "peak_kwh" else a[k] + b[k] for k in a if k in b}
+
+
+def meter_power_factor(sums):
+    """Per-meter period PF (Σ kWh ÷ Σ kVAh) and % of blocks below LOW_PF (blocks without kVAh
+    have no PF and are left out of both counts)."""
+    return {
+        "pf": power_factor(sums["kwh"], sums["kvah"]),
+        "low_pf_block_pct": safe_div(sums["low_pf_blocks"], sums["pf_blocks"]) * 100.0,
+    }
+
+
+def _pct(x):
+    return None if np.isnan(x) else round(float(x), 2)
+
+
+def compute_kpis(dt_block=None, asset_master=None, block_profile=None, consumer=None, billing=None, energy=None,
+                 consumer_dt=None, block_sums=None):
+    """
+    Evaluate every KPI the supplied inputs allow. Returns {KPI Name: value} using the
+    KPI_SPECS names, so results can be passed straight to generate_kpi_data.main(computed=...).
+    block_sums: meter_block_sums() of the Block Profile, instead of the block_profile rows.
+    """
+    out = {}
+    if dt_block is not None and asset_master is not None:
+        dt = dt_loading(dt_block, asset_master)
+        loading = dt["loading_pct"]
+        with np.errstate(invalid="ignore"):
+            out["% DT Loading"] = _pct(np.nanmean(loading))
+            out["% DT Peak Loading"] = _pct(np.nanmean(dt["peak_loading_pct"]))
+            out["DT Load (kVA)"] = _pct(np.nanmean(dt["mean_kva"]))
+            out["Transformer utilization rate (% of rated capacity)"] = _pct(
+                safe_div(np.nansum(dt["mean_kva"]), np.sum(_f64(asset_master["rated_kva"])))[()] * 100.0)
+            out["Overloaded DTs identified and monitored"] = int(np.count_nonzero(dt["peak_loading_pct"] > OVERLOAD_PCT))
+            # DTs whose mean phase-current imbalance is over the threshold
+            out["Imbalance alerts when threshold exceeded"] = int(np.count_nonzero(dt["imbalance_pct"] > IMBALANCE_PCT))
+            bands = loading_band_counts(loading)
+            out["% Loading Bands"] = _pct(bands[-HIGH_LOADING_BANDS:].sum() / max(bands.sum(), 1) * 100.0)
+    if block_sums is None and block_profile is not None:
+        n = int(np.max(block_profile["meter"])) + 1 if len(block_profile["meter"]) else 0
+        block_sums = meter_block_sums(block_profile, n)
+    if block_sums is not None:
+        pf = meter_power_factor(block_sums)
+        with np.errstate(invalid="ignore"):
+            if consumer_dt is not None:
+                # Share of low-PF blocks per DT, averaged over DTs
+                cdt = np.asarray(consumer_dt)[:len(pf["pf"])]
+                n_dt = int(np.max(cdt)) + 1 if len(cdt) else 0
+                by_dt = safe_div(group_sum(block_sums["low_pf_blocks"], cdt, n_dt),
+                                 group_sum(block_sums["pf_blocks"], cdt, n_dt)) * 100.0
+                out["Low Power Factor (%) by DT/Feeder"] = _pct(np.nanmean(by_dt))
+            out["Power factor deterioration"] = int(np.count_nonzero(pf["pf"] < LOW_PF))
+            if "imbalance_sum" in block_sums and np.any(block_sums["imbalance_blocks"]):
+                meter_imb = safe_div(block_sums["imbalance_sum"], block_sums["imbalance_blocks"])
+                out["Meter Current Unbalance (%)"] = _pct(np.nanmean(meter_imb))
+    if consumer is not None:
+        md = md_utilization_pct(consumer["max_demand"], consumer["sanctioned_load"])
+        over = np.count_nonzero(md > 100.0)
+        out["Overload / MD breach risk"] = int(np.count_nonzero(md > MD_BREACH_PCT))
+        out["Consumers exceeding sanctioned load"] = int(over)
+        out["% Consumers with Load Violation"] = _pct(over / max(len(md), 1) * 100.0)
+    if energy is not None:
+        dt_kwh = _f64(energy["dt_kwh"])
+        consumer_kwh = _f64(energy["consumer_kwh"])
+        if consumer_dt is None:
+            out["LT Loss (%)"] = _pct(safe_div(dt_kwh.sum() - consumer_kwh.sum(), dt_kwh.sum())[()] * 100.0)
+        else:
+            # Per-DT losses weighted by DT energy: consumers of DTs without a DT reading drop out
+            loss = lt_loss_pct(dt_kwh, consumer_kwh, np.asarray(consumer_dt)[:len(consumer_kwh)])
+            ok = ~np.isnan(loss)
+            out["LT Loss (%)"] = _pct(safe_div(np.sum(loss[ok] * dt_kwh[ok]), np.sum(dt_kwh[ok]))[()])
+    if billing is not None:
+        be = billing_efficiency(billing["billed_kwh"], billing["supplied_kwh"])
+        ce = collection_efficiency(billing["amount_collected"], billing["amount_billed"])
+        out["Billing Efficiency (%)"] = _pct(be)
+        out["Collection Efficiency (%)"] = _pct(ce)
+        out["AT&C Loss (%)"] = _pct(atc_loss(be, ce))
+    return {k: v for k, v in out.items() if v is not None}
+
+
+# --- profile_store driver ---
+
+def inputs_from_store(root, period):
+    """compute_kpis keyword arguments for a YYYY-MM month of a profile_store root. Block Profile
+    partitions are reduced STORE_CHUNK_ROWS rows at a time; the other profiles are read whole."""
+    import profile_store
+
+    def parts(profile):
+        return [p for p in profile_store.periods(root, profile) if p.startswith(period)]
+
+    asset = profile_store.open_partition(root, "asset_master", "master").read(["dt", "rated_kva"])
+    n_dt = int(np.max(asset["dt"])) + 1
+    rated = np.zeros(n_dt)
+    rated[asset["dt"]] = asset["rated_kva"]
+    cm = profile_store.open_partition(root, "consumer_master", "master").read(["meter", "dt", "sanctioned_load"])
+    n_meters = int(np.max(cm["meter"])) + 1
+    consumer_dt = np.zeros(n_meters, dtype=np.int64)
+    consumer_dt[cm["meter"]] = cm["dt"]
+    sanctioned = np.full(n_meters, np.nan)
+    sanctioned[cm["meter"]] = cm["sanctioned_load"]
+
+    sums = None
+    for period_name in parts("block_profile"):
+        part = profile_store.open_partition(root, "block_profile", period_name)
+        cols = {c: part.column(c) for c in ("meter", "kwh_imp", "kvah_imp", "current")}
+        for i in range(0, len(part), STORE_CHUNK_ROWS):
+            sums = add_block_sums(sums, meter_block_sums({c: v[i:i + STORE_CHUNK_ROWS] for c, v in cols.items()}, n_meters))
+
+    out = {"asset_master": {"rated_kva": rated}, "consumer_dt": consumer_dt}
+    dt_parts = parts("dt_block")
+    if dt_parts:
+        dt_block = profile_store.read(root, "dt_block", ["dt", "voltage", "current", "kwh_imp"], dt_parts)
+        out["dt_block"] = dt_block
+        if sums is not None:
+            out["energy"] = {"dt_kwh": group_sum(dt_block["kwh_imp"], dt_block["dt"], n_dt), "consumer_kwh": sums["kwh"]}
+    if sums is not None:
+        out["block_sums"] = sums
+        out["consumer"] = {"max_demand": sums["peak_kwh"] * BLOCKS_PER_HOUR, "sanctioned_load": sanctioned}
+    bill_parts, feeder_parts = parts("billing"), parts("feeder_block")
+    if bill_parts and feeder_parts:
+        bill = profile_store.read(root, "billing", ["billed_kwh", "amount_billed", "amount_collected"], bill_parts)
+        out["billing"] = {c: float(np.sum(_f64(v))) for c, v in bill.items()}
+        out["billing"]["supplied_kwh"] = float(np.sum(_f64(
+            profile_store.read(root, "feeder_block", ["kwh_imp"], feeder_parts)["kwh_imp"])))
+    return out
@@ -0,0 +1,240 @@
+"""
+Filtered KPI queries over the exported dashboards (the /query endpoint of serve.py).
+
+    /query?dashboard=Dashboard-1&department=Finance&kpi=<name>&period=2025-01|all&asset=DT-0042
+           &offset=0&limit=100
+
+Every filter takes comma-separated values (OR within a filter, AND across filters). period
+defaults to the current export's period; backfilled periods (dashboards/periods/) are
+included too, and "all" anywhere in the list selects every period. asset keeps the KPIs whose ranked asset list contains that asset and adds the
+asset's rank and value to each item.
+
+KpiIndex holds one row per (period, KPI) and an inverted index (field -> value -> row ids)
+per filterable field, so a query is a few set intersections. Encoded responses (JSON, plus
+gzip when large) go into a ResultCache: LRU, bounded in entries and bytes, entries expire
+after a TTL. The index and cache are rebuilt when the exporter or backfill publishes, which
+is detected from the stamps of the files they write last (export_manifest.json and
+periods/index.json).
+"""
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+EXPORT_MANIFEST = "export_manifest.json"
+PERIODS_INDEX = "periods/index.json"
+FILTERS = ("dashboard", "department", "kpi", "period", "asset")
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+CACHE_ENTRIES = 1024
+CACHE_BYTES = 32 * 1024 * 1024
+CACHE_TTL = 300.0  # seconds
+MIN_GZIP_SIZE = 1024
+
+
+class ResultCache:
+    """LRU of encoded responses, bounded by entry count and total bytes, with a per-entry TTL."""
+
+    def __init__(self, max_entries=CACHE_ENTRIES, max_bytes=CACHE_BYTES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires, size, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, value, size):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        self.bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class KpiIndex:
+    """Rows (one per period and KPI) plus field -> value -> set(row ids) postings."""
+
+    def __init__(self, periods, current=None):
+        """periods: {YYYY-MM: {dashboard id: shard}}; current: the default period."""
+        self.current = current
+        self.rows = []
+        self.postings = {f: {} for f in FILTERS}
+        self.ranks = {}  # (row id, asset) -> (rank, value)
+        for period in sorted(periods, reverse=True):
+            for dkey, shard in periods[period].items():
+                for kpi in shard.get("kpis", []):
+                    self._add(period, dkey, kpi)
+
+    def _add(self, period, dashboard, kpi):
+        i = len(self.rows)
+        self.rows.append({"period": period, "dashboard": dashboard, **kpi})
+        for field, value in (("dashboard", dashboard), ("department", kpi["department"]),
+                             ("kpi", kpi["name"]), ("period", period)):
+            self.postings[field].setdefault(value, set()).add(i)
+        for rank, item in enumerate((kpi.get("ranking") or {}).get("items", []), 1):
+            self.postings["asset"].setdefault(item["name"], set()).add(i)
+            self.ranks[i, item["name"]] = (rank, item["value"])
+
+    def select(self, filters):
+        """Sorted row ids matching {field: [values]}."""
+        sets = []
+        for field, values in filters.items():
+            posting = self.postings[field]
+            sets.append(set().union(*(posting.get(v, ()) for v in values)))
+        if not sets:
+            return list(range(len(self.rows)))
+        sets.sort(key=len)
+        return sorted(sets[0].intersection(*sets[1:]))
+
+    def values(self, field):
+        return sorted(self.postings[field])
+
+
+def _load_json(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_periods(shard_root):
+    """({period: {dashboard: shard}}, current period) from the current export and backfilled periods."""
+    root = Path(shard_root)
+    periods = {}
+    try:
+        index = _load_json(root / PERIODS_INDEX)
+    except (OSError, ValueError):
+        index = {"periods": []}
+    base = root.parent  # manifest file paths are relative to the export directory
+    for entry in index["periods"]:
+        try:
+            manifest = _load_json(base / entry["manifest"])
+            periods[entry["period"]] = {d["id"]: _load_json(base / d["file"]) for d in manifest["dashboards"]}
+        except (OSError, ValueError, KeyError):
+            continue
+    current = None
+    try:
+        current = _load_json(root / EXPORT_MANIFEST)["period"]
+        manifest = _load_json(root / "manifest.json")
+        periods[current] = {d["id"]: _load_json(base / d["file"]) for d in manifest["dashboards"]}
+    except (OSError, ValueError, KeyError):
+        pass
+    return periods, current
+
+
+def parse_query(params):
+    """Normalized (filters, offset, limit) from {name: value} query parameters; ValueError if invalid."""
+    filters = {}
+    for field in FILTERS:
+        raw = params.get(field)
+        if raw:
+            values = tuple(sorted({v.strip() for v in raw.split(",") if v.strip()}))
+            if values:
+                filters[field] = values
+    offset = int(params.get("offset", 0))
+    limit = int(params.get("limit", DEFAULT_LIMIT))
+    if offset < 0 or limit < 1:
+        raise ValueError("offset must be >= 0 and limit >= 1")
+    return filters, offset, min(limit, MAX_LIMIT)
+
+
+class QueryService:
+    """Answers queries from a KpiIndex through a ResultCache; both reset when new output is published."""
+
+    def __init__(self, shard_root, cache=None):
+        self.root = Path(shard_root)
+        self.cache = cache or ResultCache()
+        self._current = (None, None)  # (stamp, KpiIndex), replaced as one object
+        self._lock = threading.Lock()
+
+    def _published(self):
+        stamp = []
+        for name in (EXPORT_MANIFEST, PERIODS_INDEX):
+            try:
+                st = (self.root / name).stat()
+                stamp.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def snapshot(self):
+        """(stamp, KpiIndex) of the current output; the index is the one built for that stamp."""
+        stamp = self._published()
+        if stamp != self._current[0]:
+            with self._lock:
+                if stamp != self._current[0]:
+                    self.cache.clear()
+                    self._current = (stamp, KpiIndex(*load_periods(self.root)))
+        return self._current
+
+    def index(self):
+        return self.snapshot()[1]
+
+    def query(self, params):
+        """
+        (body, gzip body or None, etag) of the JSON response for query parameters.
+        Raises ValueError for malformed parameters.
+        """
+        filters, offset, limit = parse_query(params)
+        # One snapshot for the lookup, the rows and the store: an export publishing meanwhile
+        # cannot file old rows under its new stamp
+        stamp, index = self.snapshot()
+        if "period" not in filters and index.current is not None:
+            filters["period"] = (index.current,)
+        elif "all" in filters.get("period", ()):
+            del filters["period"]  # "all" is a wildcard, whatever else is listed with it
+        key = (stamp, tuple(sorted(filters.items())), offset, limit)
+        hit = self.cache.get(key)
+        if hit is not None:
+            return hit
+        ids = index.select(filters)
+        items = []
+        for i in ids[offset:offset + limit]:
+            row = dict(index.rows[i])
+            for asset in filters.get("asset", ()):
+                if (i, asset) in index.ranks:
+                    rank, value = index.ranks[i, asset]
+                    row.setdefault("assets", []).append({"name": asset, "rank": rank, "value": value})
+            items.append(row)
+        body = json.dumps({
+            "filters": {f: list(v) for f, v in filters.items()},
+            "total": len(ids), "offset": offset, "limit": limit, "items": items,
+        }, separators=(",", ":")).encode()
+        zipped = gzip.compress(body, compresslevel=5, mtime=0) if len(body) >= MIN_GZIP_SIZE else None
+        result = (body, zipped, '"' + hashlib.sha1(body).hexdigest()[:20] + '"')
+        self.cache.put(key, result, len(body) + len(zipped or b""))
+        return result
+
+    def facets(self):
+        """Filter values available: dashboards, departments, KPI names and periods."""
+        index = self.index()
+        return {f: index.values(f) for f in ("dashboard", "department", "kpi", "period")} | {"current": index.current}
@@ -0,0 +1,166 @@
+"""
+Persistent last-seen index for non-reporting meter detection.
+
+    python last_seen.py --store store [--index store/last_seen] [--hours 24]
+
+Formula: Last_Report_Time = MAX(RTC) per meter; flag if Current_Time - Last_Report_Time > 24 hours.
+Instead of rescanning every historical read, the index keeps one int64 last-report epoch per
+dense meter id (-1 = never reported) and folds in only block_profile partitions it has not
+ingested yet (or whose content hash changed). "Silent longer than X" queries run against a
+lazily rebuilt sorted copy with searchsorted, so counts are O(log n) and bucketed histograms
+(SILENCE_BANDS_HOURS) are one searchsorted call.
+
+Current_Time is the wall clock (or a period end, for reports on a past month), never the
+newest read ingested: if the whole feed stalls, every meter must go silent.
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+import profile_store
+
+NEVER = -1
+NON_REPORTING_HOURS = 24
+COMM_ISSUE_HOURS = 1  # missed four or more 15-minute blocks
+SILENCE_BANDS_HOURS = (1, 6, 24, 72, 168)
+INDEX_FILE = "last_seen.npy"
+META_FILE = "meta.json"
+
+
+class LastSeenIndex:
+    def __init__(self, n_meters=0):
+        self.last = np.full(n_meters, NEVER, dtype=np.int64)
+        self.partitions = {}  # ingested block_profile partition -> content hash
+        self._sorted = None
+
+    def __len__(self):
+        return len(self.last)
+
+    @property
+    def watermark(self):
+        """Latest report time ingested (NEVER when empty)."""
+        return int(self.last.max()) if len(self.last) else NEVER
+
+    def _grow(self, n):
+        if n > len(self.last):
+            self.last = np.concatenate([self.last, np.full(n - len(self.last), NEVER, dtype=np.int64)])
+
+    def update(self, meters, ts):
+        """Fold a batch of reads (dense meter id, RTC epoch seconds) into the index."""
+        meters = np.asarray(meters, dtype=np.int64)
+        if not len(meters):
+            return self
+        self._grow(int(meters.max()) + 1)
+        np.maximum.at(self.last, meters, np.asarray(ts, dtype=np.int64))
+        self._sorted = None
+        return self
+
+    def _order(self):
+        if self._sorted is None:
+            order = np.argsort(self.last, kind="stable")
+            self._sorted = (order, self.last[order])
+        return self._sorted
+
+    def silent_count(self, now, hours=NON_REPORTING_HOURS):
+        """Meters whose last report is older than `hours` before `now` (never-seen meters included)."""
+        _, last = self._order()
+        return int(np.searchsorted(last, now - hours * 3600, side="left"))
+
+    def silent_meters(self, now, hours=NON_REPORTING_HOURS):
+        """Dense ids of those meters, longest-silent first."""
+        order, last = self._order()
+        return order[:np.searchsorted(last, now - hours * 3600, side="left")]
+
+    def silence_histogram(self, now, bands=SILENCE_BANDS_HOURS):
+        """{label: meters} for reporting within bands[0] hours, each band, and beyond the last band."""
+        _, last = self._order()
+        cutoffs = now - np.asarray(bands[::-1], dtype=np.int64) * 3600
+        # Meters at or after each cutoff, from the longest band to the shortest
+        counts = np.diff(np.concatenate([[0], np.searchsorted(last, cutoffs, side="left"), [len(last)]]))
+        labels = [f">{bands[-1]}h"] + [f"{lo}-{hi}h" for lo, hi in zip(bands[-2::-1], bands[::-1])] + [f"<{bands[0]}h"]
+        return dict(zip(labels[::-1], counts[::-1].tolist()))
+
+    def save(self, path):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / INDEX_FILE, self.last)
+        with open(path / META_FILE, "w", encoding="utf-8") as f:
+            json.dump({"meters": len(self.last), "watermark": self.watermark, "partitions": self.partitions},
+                      f, indent=1, sort_keys=True)
+        return path
+
+    @classmethod
+    def load(cls, path, n_meters=0):
+        """Index saved at path, or an empty one sized for n_meters if there is none yet."""
+        path = Path(path)
+        index = cls(n_meters)
+        if (path / INDEX_FILE).exists():
+            index.last = np.load(path / INDEX_FILE)
+            with open(path / META_FILE, encoding="utf-8") as f:
+                index.partitions = json.load(f)["partitions"]
+            index._grow(n_meters)
+        return index
+
+
+def ingest_store(index, root):
+    """Fold new or rewritten block_profile partitions of a profile_store root into index."""
+    hashes = profile_store.partition_hashes(root, "block_profile")
+    new = [p for p, h in hashes.items() if index.partitions.get(p) != h]
+    for period in new:
+        part = profile_store.open_partition(root, "block_profile", period)
+        meter, ts = np.asarray(part.column("meter")), np.asarray(part.column("ts"))
+        if len(meter):
+            # Partitions are stored sorted by meter: one reduceat per run instead of a scatter
+            starts = np.flatnonzero(np.r_[True, meter[1:] != meter[:-1]])
+            index.update(meter[starts], np.maximum.reduceat(ts, starts))
+        index.partitions[period] = hashes[period]
+    return new
+
+
+def dashboard_values(index, now=None):
+    """Dashboard-7 KPI values (KPI_SPECS names) as of now (epoch s, default: wall clock)."""
+    now = int(time.time()) if now is None else now
+    return {
+        "Non-reporting meters (>24 hours)": index.silent_count(now, NON_REPORTING_HOURS),
+        "Communication health issues": index.silent_count(now, COMM_ISSUE_HOURS),
+    }
+
+
+def update_from_store(root, index_dir=None):
+    """Load (or create) the index next to a store, ingest new partitions and save it."""
+    index_dir = Path(index_dir) if index_dir else Path(root) / "last_seen"
+    masters = profile_store.periods(root, "consumer_master")
+    n_meters = 0
+    if masters:
+        n_meters = len(profile_store.open_partition(root, "consumer_master", masters[0]).column("meter"))
+    index = LastSeenIndex.load(index_dir, n_meters)
+    new = ingest_store(index, root)
+    index.save(index_dir)
+    return index, new
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Update the last-seen index and report non-reporting meters")
+    parser.add_argument("--store", required=True, help="profile_store root")
+    parser.add_argument("--index", help="index directory (default: <store>/last_seen)")
+    parser.add_argument("--hours", type=float, default=NON_REPORTING_HOURS)
+    parser.add_argument("--now", help="ISO timestamp (default: current time)")
+    args = parser.parse_args(argv)
+    index, new = update_from_store(args.store, args.index)
+    now = int(time.time())
+    if args.now:
+        now = int(datetime.fromisoformat(args.now).replace(tzinfo=timezone.utc).timestamp())
+    print(f"Ingested {len(new)} new partitions; {len(index):,} meters, "
+          f"as of {datetime.fromtimestamp(now, timezone.utc):%Y-%m-%d %H:%M} UTC")
+    print(f"Silent > {args.hours:g}h: {index.silent_count(now, args.hours):,}")
+    for band, n in index.silence_histogram(now).items():
+        print(f"  {band:>10}: {n:,}")
+    return index
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Mergeable per-DT loading distribution sketches (loading bands, percentiles, load duration curves).
+
+A LoadingSketch holds, for every DT, exact counts per loading band (kpi_engine.LOADING_BAND_EDGES)
+and a log-bucket quantile sketch in the style of DDSketch: bucket i covers
+(GAMMA^(i-1), GAMMA^i] % loading with GAMMA = (1 + ALPHA) / (1 - ALPHA), so any quantile is
+returned within ALPHA relative error. Both parts are plain count arrays, updated from DT Block
+chunks with one bincount and merged (across periods, DTs or worker processes) by addition;
+no interval reading is ever retained or sorted.
+
+Serialized form (to_bytes / from_bytes) is sparse: only non-empty buckets are stored, as
+compressed npz.
+"""
+import io
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import kpi_engine
+
+ALPHA = 0.01
+GAMMA = (1 + ALPHA) / (1 - ALPHA)
+MIN_LOADING = 0.1    # % ; at or below goes to the zero bucket
+MAX_LOADING = 1000.0  # % ; above is clamped into the top bucket
+_LOG_GAMMA = np.log(GAMMA)
+_KEY_MIN = int(np.ceil(np.log(MIN_LOADING) / _LOG_GAMMA))
+N_BUCKETS = int(np.ceil(np.log(MAX_LOADING) / _LOG_GAMMA)) - _KEY_MIN + 2  # + zero bucket
+N_BANDS = len(kpi_engine.LOADING_BAND_LABELS)
+LDC_EXCEEDANCE = tuple(range(0, 101, 5))  # % of time the loading is exceeded
+PERCENTILES = (50, 90, 95, 99)
+
+
+def bucket_of(loading_pct):
+    """Sketch bucket per value (0 = zero bucket)."""
+    x = np.asarray(loading_pct, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        keys = np.ceil(np.log(np.maximum(x, MIN_LOADING)) / _LOG_GAMMA) - _KEY_MIN + 1
+    keys = np.clip(keys, 1, N_BUCKETS - 1).astype(np.int64)
+    keys[x <= MIN_LOADING] = 0
+    return keys
+
+
+def bucket_value(keys):
+    """Representative loading of each bucket (relative error <= ALPHA)."""
+    keys = np.asarray(keys)
+    value = 2 * GAMMA ** (keys + _KEY_MIN - 1) / (GAMMA + 1)
+    return np.where(keys == 0, 0.0, value)
+
+
+class LoadingSketch:
+    def __init__(self, n_dt):
+        self.n_dt = n_dt
+        self.counts = np.zeros((n_dt, N_BUCKETS), dtype=np.int64)
+        self.bands = np.zeros((n_dt, N_BANDS), dtype=np.int64)
+
+    def update(self, dt, loading_pct):
+        """Fold a chunk of (dense DT index, % loading) readings in; NaNs are skipped."""
+        dt = np.asarray(dt, dtype=np.int64)
+        x = np.asarray(loading_pct, dtype=np.float64)
+        ok = ~np.isnan(x)
+        dt, x = dt[ok], x[ok]
+        self.counts += np.bincount(dt * N_BUCKETS + bucket_of(x),
+                                   minlength=self.n_dt * N_BUCKETS).reshape(self.n_dt, N_BUCKETS)
+        band = np.searchsorted(kpi_engine.LOADING_BAND_EDGES, x, side="right")
+        self.bands += np.bincount(dt * N_BANDS + band, minlength=self.n_dt * N_BANDS).reshape(self.n_dt, N_BANDS)
+        return self
+
+    def update_dt_block(self, dt_block, asset_master):
+        """Update from DT Block rows: % loading = √3·Vavg·Iavg/1000 ÷ rated kVA × 100 per row."""
+        dt = np.asarray(dt_block["dt"])
+        rated = np.asarray(asset_master["rated_kva"], dtype=np.float64)
+        kva = kpi_engine.dt_kva(dt_block["voltage"], dt_block["current"])
+        return self.update(dt, kpi_engine.pct_loading(kva, rated[dt]))
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.bands += other.bands
+        return self
+
+    def rollup(self, parent, n_parent=None):
+        """Sketch per parent (e.g. dt -> feeder index array); parent=None gives one system row."""
+        parent = np.zeros(self.n_dt, dtype=np.int64) if parent is None else np.asarray(parent, dtype=np.int64)
+        n_parent = int(parent.max()) + 1 if n_parent is None else n_parent
+        out = LoadingSketch(n_parent)
+        np.add.at(out.counts, parent, self.counts)
+        np.add.at(out.bands, parent, self.bands)
+        return out
+
+    def quantiles(self, qs):
+        """(n_dt, len(qs)) loading at each quantile (0..1); NaN for DTs without readings."""
+        qs = np.atleast_1d(np.asarray(qs, dtype=np.float64))
+        cum = np.cumsum(self.counts, axis=1)
+        total = cum[:, -1:]
+        # Rank (0-based) of the quantile reading, then the first bucket whose running count passes it
+        rank = np.floor(qs[None, :] * np.maximum(total - 1, 0))
+        keys = np.stack([(cum <= rank[:, j:j + 1]).sum(axis=1) for j in range(len(qs))], axis=1)
+        out = bucket_value(np.minimum(keys, N_BUCKETS - 1))
+        out[total[:, 0] == 0] = np.nan
+        return out
+
+    def percentiles(self, ps=PERCENTILES):
+        return self.quantiles(np.asarray(ps) / 100.0)
+
+    def load_duration_curve(self, exceedance=LDC_EXCEEDANCE):
+        """(n_dt, len(exceedance)) loading exceeded for each % of the time."""
+        return self.quantiles(1.0 - np.asarray(exceedance) / 100.0)
+
+    def band_pct(self):
+        """(n_dt, N_BANDS) share of readings per loading band, in %."""
+        return kpi_engine.safe_div(self.bands, self.bands.sum(axis=1, keepdims=True)) * 100.0
+
+    def to_bytes(self):
+        rows, keys = np.nonzero(self.counts)
+        buf = io.BytesIO()
+        np.savez_compressed(
+            buf, n_dt=np.int64(self.n_dt), alpha=np.float64(ALPHA),
+            offsets=np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=self.n_dt))]).astype(np.int64),
+            keys=keys.astype(np.uint16), counts=self.counts[rows, keys], bands=self.bands,
+        )
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        z = np.load(io.BytesIO(data))
+        if float(z["alpha"]) != ALPHA:
+            raise ValueError(f"sketch built with alpha={float(z['alpha'])}, expected {ALPHA}")
+        sketch = cls(int(z["n_dt"]))
+        rows = np.repeat(np.arange(sketch.n_dt), np.diff(z["offsets"]))
+        sketch.counts[rows, z["keys"].astype(np.int64)] = z["counts"]
+        sketch.bands[:] = z["bands"]
+        return sketch
+
+
+def distribution(sketch, row=0):
+    """JSON block for one sketch row: band shares, percentiles and load duration curve."""
+    return {
+        "labels": list(kpi_engine.LOADING_BAND_LABELS),
+        "bands": [None if np.isnan(v) else round(float(v), 2) for v in sketch.band_pct()[row]],
+        "percentiles": {f"p{p}": None if np.isnan(v) else round(float(v), 1)
+                        for p, v in zip(PERCENTILES, sketch.percentiles()[row])},
+        "exceedance": list(LDC_EXCEEDANCE),
+        "ldc": [None if np.isnan(v) else round(float(v), 1) for v in sketch.load_duration_curve()[row]],
+        "readings": int(sketch.bands[row].sum()),
+    }
+
+
+def dashboard_values(sketch, row=0):
+    """Dashboard-3 KPI values: % of readings above 80% loading, and the P90 loading."""
+    bands = sketch.band_pct()[row]
+    p90 = sketch.percentiles((90,))[row, 0]
+    out = {}
+    if not np.isnan(bands).all():
+        out["% Loading Bands"] = round(float(bands[-kpi_engine.HIGH_LOADING_BANDS:].sum()), 2)
+    if not np.isnan(p90):
+        out["Load Duration Curve & Asset Loading Spread"] = round(float(p90), 2)
+    return out
+
+
+# --- Building from a profile_store root ---
+
+def _partition_sketch(args):
+    root, period = args
+    import profile_store
+    asset = profile_store.open_partition(root, "asset_master", "master").read(["rated_kva"])
+    sketch = LoadingSketch(len(asset["rated_kva"]))
+    block = profile_store.open_partition(root, "dt_block", period).read(["dt", "voltage", "current"])
+    return sketch.update_dt_block(block, asset).to_bytes()
+
+
+def build_from_store(root, workers=None, prefix=""):
+    """Per-DT sketch over every dt_block partition (optionally those starting with prefix, e.g. a month)."""
+    import profile_store
+    parts = [p for p in profile_store.periods(root, "dt_block") if p.startswith(prefix)]
+    n_dt = len(profile_store.open_partition(root, "asset_master", "master").column("rated_kva"))
+    sketch = LoadingSketch(n_dt)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for data in pool.map(_partition_sketch, [(str(root), p) for p in parts]):
+            sketch.merge(LoadingSketch.from_bytes(data))
+    return sketch
@@ -0,0 +1,226 @@
+"""
+Phase transfer what-if optimizer ("phase transfer recommendation").
+
+    python phase_optimizer.py --store store [--threshold 10] [--workers 8] [--out <store>/phase_transfers.csv]
+
+For each DT, per-consumer load profiles (typical day, one value per 15-minute block) are
+summed per phase and scored with the FORMULA_MAP imbalance formula, averaged over the day:
+Imbalance % = (Max Phase − Avg Phase) ÷ Avg Phase × 100. A greedy search then applies, one at a
+time, the single consumer transfer that lowers the score the most (every candidate move of
+every consumer is scored at once as a (consumers, 3, 3, blocks) array) until the DT is within
+the threshold or no move helps; when single moves stall, a local-search step tries the best
+exchange of two consumers between phases (scored in batches of consumer pairs). A pruning pass
+drops transfers that are not needed to stay within the threshold, so the recommended set is
+minimal. DTs are independent and run in
+parallel, in chunks, on a process pool.
+"""
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import kpi_engine
+
+BLOCKS_PER_DAY = 96
+TARGET_PCT = kpi_engine.IMBALANCE_PCT
+MIN_GAIN = 0.1           # % points a transfer must save to be worth a site visit
+MAX_MOVE_SHARE = 0.2     # at most this share of a DT's consumers is moved
+PHASES = ("R", "Y", "B")
+
+
+def imbalance_score(phase_load):
+    """Mean over blocks of the imbalance % of (..., 3, blocks) phase loads (0 where unloaded)."""
+    avg = phase_load.mean(axis=-2)
+    imb = kpi_engine.safe_div(phase_load.max(axis=-2) - avg, avg) * 100.0
+    return np.nan_to_num(imb).mean(axis=-1)
+
+
+def phase_loads(load, phase):
+    """(3, blocks) load per phase from (consumers, blocks) profiles and a phase per consumer."""
+    out = np.zeros((3, load.shape[1]))
+    np.add.at(out, phase, load)
+    return out
+
+
+def optimize_dt(load, phase, target_pct=TARGET_PCT, max_moves=None, min_gain=MIN_GAIN):
+    """
+    load: (consumers, blocks) profile of one DT's consumers; phase: (consumers,) 0/1/2.
+    Returns (moves [(consumer index, from, to)], score before, score after).
+    """
+    load = np.asarray(load, dtype=np.float64)
+    phase = np.asarray(phase, dtype=np.int64).copy()
+    n = len(phase)
+    max_moves = max(1, int(n * MAX_MOVE_SHARE)) if max_moves is None else max_moves
+    eye = np.eye(3)
+    current = phase_loads(load, phase)
+    before = score = float(imbalance_score(current))
+    moved = np.zeros(n, dtype=bool)
+    moves = []
+    while score > target_pct and len(moves) < max_moves:
+        # Phase loads after moving consumer c to phase q, for every (c, q): (n, 3, 3, blocks)
+        delta = (eye[None, :, :] - eye[phase][:, None, :])[..., None] * load[:, None, None, :]
+        candidates = imbalance_score(current[None, None] + delta)
+        candidates[np.arange(n), phase] = np.inf
+        candidates[moved] = np.inf
+        c, q = np.unravel_index(np.argmin(candidates), candidates.shape)
+        if score - candidates[c, q] >= min_gain:
+            moves.append((int(c), int(phase[c]), int(q)))
+            current += delta[c, q]
+            phase[c] = q
+            moved[c] = True
+            score = float(candidates[c, q])
+            continue
+        # Local search: no single transfer helps enough, try exchanging two consumers' phases
+        if len(moves) + 2 > max_moves:
+            break
+        i, j, s = _best_swap(load, phase, moved, current)
+        if i is None or not score - s >= min_gain:
+            break
+        moves += [(i, int(phase[i]), int(phase[j])), (j, int(phase[j]), int(phase[i]))]
+        current += _move(load[i], phase[i], phase[j]) + _move(load[j], phase[j], phase[i])
+        phase[i], phase[j] = phase[j], phase[i]
+        moved[[i, j]] = True
+        score = s
+
+    # Pruning: undo transfers (cheapest loss first) while the DT stays within the target
+    if score <= target_pct:
+        for c, src, dst in sorted(moves, key=lambda m: _undo_score(current, load, m)):
+            undone = current + _move(load[c], dst, src)
+            s = float(imbalance_score(undone))
+            if s <= target_pct:
+                current, score = undone, s
+                moves.remove((c, src, dst))
+    return moves, before, score
+
+
+def _best_swap(load, phase, moved, current, rows_per_batch=32):
+    """(i, j, score) of the best exchange of two unmoved consumers on different phases."""
+    eye = np.eye(3)
+    free = np.flatnonzero(~moved)
+    best = (None, None, np.inf)
+    for lo in range(0, len(free), rows_per_batch):
+        a = free[lo:lo + rows_per_batch]
+        # i moves to phase[j] and j to phase[i]: net (x_i - x_j) shifts from phase[i] to phase[j]
+        diff = load[a][:, None, :] - load[free][None, :, :]
+        shift = (eye[phase[free]][None, :, :] - eye[phase[a]][:, None, :])[..., None] * diff[:, :, None, :]
+        scores = imbalance_score(current[None, None] + shift)
+        scores[phase[a][:, None] == phase[free][None, :]] = np.inf
+        k = np.unravel_index(np.argmin(scores), scores.shape)
+        if scores[k] < best[2]:
+            best = (int(a[k[0]]), int(free[k[1]]), float(scores[k]))
+    return best
+
+
+def _move(x, src, dst):
+    d = np.zeros((3, len(x)))
+    d[src] -= x
+    d[dst] += x
+    return d
+
+
+def _undo_score(current, load, m):
+    c, src, dst = m
+    return float(imbalance_score(current + _move(load[c], dst, src)))
+
+
+# --- Profile store driver ---
+
+def typical_day(block, n_meters, meter_ids):
+    """(len(meter_ids), BLOCKS_PER_DAY) mean kWh per block-of-day from Block Profile rows."""
+    pos = np.searchsorted(meter_ids, block["meter"])
+    slot = (np.asarray(block["ts"]) // 900) % BLOCKS_PER_DAY
+    flat = pos * BLOCKS_PER_DAY + slot
+    total = np.bincount(flat, weights=np.asarray(block["kwh_imp"], dtype=np.float64),
+                        minlength=len(meter_ids) * BLOCKS_PER_DAY)
+    count = np.bincount(flat, minlength=len(meter_ids) * BLOCKS_PER_DAY)
+    return kpi_engine.safe_div(total, count).reshape(len(meter_ids), BLOCKS_PER_DAY)
+
+
+def _dt_chunk(args):
+    """Optimize DTs [lo, hi) of a profile_store root; returns one result dict per DT with consumers."""
+    import profile_store
+    root, lo, hi, target_pct = args
+    cm = profile_store.open_partition(root, "consumer_master", "master")
+    rows = cm.rows_for("dt", np.arange(lo, hi))
+    meter = np.asarray(cm.column("meter")[rows])
+    dt = np.asarray(cm.column("dt")[rows])
+    phase = np.asarray(cm.column("phase")[rows]).astype(np.int64)
+    order = np.argsort(meter)
+    meter, dt, phase = meter[order], dt[order], phase[order]
+
+    sums = np.zeros((len(meter), BLOCKS_PER_DAY))
+    days = 0
+    for period in profile_store.periods(root, "block_profile"):
+        part = profile_store.open_partition(root, "block_profile", period)
+        block = part.read(["meter", "ts", "kwh_imp"], dt=np.arange(lo, hi))
+        if len(block["meter"]):
+            sums += np.nan_to_num(typical_day(block, len(meter), meter))
+            days += 1
+    load = sums / max(days, 1)
+
+    results = []
+    for d in np.unique(dt):
+        sel = np.flatnonzero(dt == d)
+        moves, before, after = optimize_dt(load[sel], phase[sel], target_pct)
+        results.append({
+            "dt": int(d), "consumers": len(sel), "before_pct": round(before, 2), "after_pct": round(after, 2),
+            "moves": [(int(meter[sel[c]]), src, dst) for c, src, dst in moves],
+        })
+    return results
+
+
+def optimize_store(root, target_pct=TARGET_PCT, workers=None, dts_per_task=200):
+    """Recommendations for every DT of a profile_store root, DT chunks fanned out over processes."""
+    import profile_store
+    n_dt = len(profile_store.open_partition(root, "asset_master", "master").column("dt"))
+    tasks = [(str(root), lo, min(lo + dts_per_task, n_dt), target_pct) for lo in range(0, n_dt, dts_per_task)]
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk in pool.map(_dt_chunk, tasks):
+            results.extend(chunk)
+    return results
+
+
+def dashboard_values(results, target_pct=TARGET_PCT):
+    """Dashboard-9 KPI values: transfers recommended, and the mean imbalance reduction they achieve."""
+    flagged = [r for r in results if r["moves"]]
+    out = {"Phase transfer recommendations (what-if)": sum(len(r["moves"]) for r in flagged)}
+    if flagged:
+        reduction = [(r["before_pct"] - r["after_pct"]) / r["before_pct"] * 100 for r in flagged if r["before_pct"] > 0]
+        out["Phase imbalance reduced by minimum 30%"] = round(float(np.mean(reduction)), 2)
+    return out
+
+
+def write_recommendations(path, results):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["DT", "Meter", "From Phase", "To Phase", "DT Imbalance Before (%)", "DT Imbalance After (%)"])
+        for r in results:
+            for meter, src, dst in r["moves"]:
+                w.writerow([r["dt"], meter, PHASES[src], PHASES[dst], r["before_pct"], r["after_pct"]])
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recommend consumer phase transfers that bring DT imbalance within threshold")
+    parser.add_argument("--store", required=True, help="profile_store root")
+    parser.add_argument("--threshold", type=float, default=TARGET_PCT, help="target imbalance %% (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--out", help="recommendations CSV (default: <store>/phase_transfers.csv)")
+    args = parser.parse_args(argv)
+    args.out = args.out or os.path.join(args.store, "phase_transfers.csv")
+    results = optimize_store(args.store, args.threshold, args.workers or os.cpu_count())
+    write_recommendations(args.out, results)
+    over = [r for r in results if r["before_pct"] > args.threshold]
+    fixed = [r for r in over if r["after_pct"] <= args.threshold]
+    print(f"{len(results):,} DTs, {len(over):,} above {args.threshold:g}% imbalance, {len(fixed):,} brought within it")
+    for k, v in dashboard_values(results, args.threshold).items():
+        print(f"  {k}: {v}")
+    print(f"Recommendations: {args.out}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
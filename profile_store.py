@@ -0,0 +1,201 @@
+"""
+Columnar, memory-mapped store for block-profile, event and master data.
+Each profile (DT Block, Block Profile, Event Profile, Consumer Master) is partitioned by
+period; every partition is a directory of one .npy file per column, rows sorted by the
+profile's primary asset key, plus offset indexes for the key and any secondary asset
+columns (DT / feeder). Reads open columns with mmap, so selecting one asset is a zero-copy
+slice and untouched columns are never read from disk.
+
+    root/<profile>/<period>/_meta.json
+    root/<profile>/<period>/<column>.npy
+    root/<profile>/<period>/_idx.<column>.keys.npy / .offsets.npy [/ .rows.npy]
+
+Asset IDs are integer codes (map meter numbers / DTRCode / FeederCode to ints in the masters).
+"""
+import hashlib
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+# profile -> (primary key column, secondary indexed columns)
+PROFILES = {
+    "dt_block": ("dt", ("feeder",)),
+    "feeder_block": ("feeder", ()),
+    "block_profile": ("meter", ("dt", "feeder")),
+    "event_profile": ("meter", ()),
+    "consumer_master": ("meter", ("dt", "feeder")),
+    "billing": ("meter", ()),
+}
+
+META_FILE = "_meta.json"
+
+
+def partition_dir(root, profile, period):
+    return Path(root) / profile / str(period)
+
+
+def _offsets(sorted_keys):
+    """Unique keys and their [start, stop) offsets in a sorted key array."""
+    keys, starts = np.unique(sorted_keys, return_index=True)
+    return keys, np.append(starts, len(sorted_keys)).astype(np.int64)
+
+
+def write_partition(root, profile, period, columns, key=None, index=None):
+    """
+    Write one period partition. columns: {name: array}, all the same length.
+    Rows are sorted by the primary key; returns the partition's metadata dict.
+    """
+    default_key, default_index = PROFILES.get(profile, (None, ()))
+    key = key or default_key
+    index = tuple(c for c in (default_index if index is None else index) if c in columns)
+    if key not in columns:
+        raise ValueError(f"{profile}: key column {key!r} missing")
+    n = len(columns[key])
+    for name, arr in columns.items():
+        if len(arr) != n:
+            raise ValueError(f"{profile}: column {name!r} has {len(arr)} rows, expected {n}")
+
+    out = partition_dir(root, profile, period)
+    tmp = out.with_name(out.name + ".tmp")
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+
+    order = np.argsort(columns[key], kind="stable")
+    digest = hashlib.sha1()
+    schema = {}
+    for name, arr in columns.items():
+        col = np.ascontiguousarray(np.asarray(arr)[order])
+        np.save(tmp / f"{name}.npy", col)
+        digest.update(name.encode())
+        digest.update(col)
+        schema[name] = {"dtype": col.dtype.str, "shape": list(col.shape[1:])}
+
+    keys, offsets = _offsets(np.asarray(columns[key])[order])
+    np.save(tmp / f"_idx.{key}.keys.npy", keys)
+    np.save(tmp / f"_idx.{key}.offsets.npy", offsets)
+    for name in index:
+        vals = np.asarray(columns[name])[order]
+        rows = np.argsort(vals, kind="stable")
+        ikeys, ioffsets = _offsets(vals[rows])
+        np.save(tmp / f"_idx.{name}.keys.npy", ikeys)
+        np.save(tmp / f"_idx.{name}.offsets.npy", ioffsets)
+        np.save(tmp / f"_idx.{name}.rows.npy", rows.astype(np.int64))
+
+    meta = {
+        "profile": profile,
+        "period": str(period),
+        "rows": int(n),
+        "key": key,
+        "index": list(index),
+        "columns": schema,
+        "hash": digest.hexdigest(),
+    }
+    with open(tmp / META_FILE, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    # Swap in atomically-ish so readers never see a half-written partition
+    if out.exists():
+        shutil.rmtree(out)
+    tmp.rename(out)
+    return meta
+
+
+class Partition:
+    def __init__(self, root, profile, period):
+        self.path = partition_dir(root, profile, period)
+        with open(self.path / META_FILE, encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self._cols = {}
+        self._idx = {}
+
+    @property
+    def key(self):
+        return self.meta["key"]
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    def column(self, name):
+        """Memory-mapped column (read-only)."""
+        if name not in self._cols:
+            if name not in self.meta["columns"]:
+                raise KeyError(f"{self.meta['profile']}/{self.meta['period']}: no column {name!r}")
+            self._cols[name] = np.load(self.path / f"{name}.npy", mmap_mode="r")
+        return self._cols[name]
+
+    def _index(self, name):
+        if name not in self._idx:
+            base = self.path / f"_idx.{name}"
+            rows = None
+            if name != self.key:
+                rows = np.load(f"{base}.rows.npy", mmap_mode="r")
+            self._idx[name] = (
+                np.load(f"{base}.keys.npy", mmap_mode="r"),
+                np.load(f"{base}.offsets.npy", mmap_mode="r"),
+                rows,
+            )
+        return self._idx[name]
+
+    def rows_for(self, name, ids):
+        """Row selector for assets `ids` of column `name`: a slice when contiguous, else an index array."""
+        if name != self.key and name not in self.meta["index"]:
+            raise KeyError(f"{self.meta['profile']}: column {name!r} is not indexed")
+        keys, offsets, rows = self._index(name)
+        ids = np.atleast_1d(np.asarray(ids))
+        pos = np.searchsorted(keys, ids)
+        pos = pos[(pos < len(keys)) & (keys[np.minimum(pos, len(keys) - 1)] == ids)]
+        if rows is None and len(pos) == 1:
+            return slice(int(offsets[pos[0]]), int(offsets[pos[0] + 1]))
+        if len(pos) == 0:
+            return np.empty(0, dtype=np.int64)
+        parts = [np.arange(offsets[p], offsets[p + 1]) for p in np.sort(pos)]
+        sel = np.concatenate(parts)
+        return np.sort(rows[sel]) if rows is not None else sel
+
+    def read(self, columns=None, **assets):
+        """
+        Read `columns` (default: all), optionally restricted to assets, e.g. read(["kwh_imp"], meter=[3, 7]).
+        A single primary-key asset returns zero-copy memmap views.
+        """
+        names = list(self.meta["columns"]) if columns is None else list(columns)
+        sel = slice(None)
+        for name, ids in assets.items():
+            rows = self.rows_for(name, ids)
+            if isinstance(sel, slice) and sel == slice(None):
+                sel = rows
+            else:
+                a = np.arange(len(self))[sel]
+                b = np.arange(len(self))[rows]
+                sel = np.intersect1d(a, b, assume_unique=True)
+        return {c: self.column(c)[sel] for c in names}
+
+
+def periods(root, profile):
+    base = Path(root) / profile
+    if not base.exists():
+        return []
+    return sorted(p.name for p in base.iterdir() if (p / META_FILE).exists())
+
+
+def open_partition(root, profile, period):
+    return Partition(root, profile, period)
+
+
+def read(root, profile, columns=None, period_list=None, **assets):
+    """Read columns across periods (default: all), concatenated in period order."""
+    parts = [open_partition(root, profile, p).read(columns, **assets) for p in (period_list or periods(root, profile))]
+    if not parts:
+        return {}
+    if len(parts) == 1:
+        return parts[0]
+    return {c: np.concatenate([p[c] for p in parts]) for c in parts[0]}
+
+
+def partition_hashes(root, profile):
+    """{period: content hash} for every partition of a profile."""
+    out = {}
+    for p in periods(root, profile):
+        out[p] = open_partition(root, profile, p).meta["hash"]
+    return out
@@ -0,0 +1,98 @@
+"""
+Streaming top-K rankings ("Top X Worst Feeders", "Top Overloaded DTs", ...).
+
+TopK keeps a bounded min-heap of the k best (asset, value) pairs seen so far. Chunks of
+asset-level results are pre-filtered with numpy (argpartition plus the current heap
+threshold) so only candidates that can still enter the top k reach heapq; nothing is ever
+fully sorted. Ties break on the asset id, which makes the result a pure function of the
+input set: partials built by parallel workers over any split of the assets merge() to the
+same ranking as a single pass.
+"""
+import heapq
+
+import numpy as np
+
+DEFAULT_K = 10
+
+
+class TopK:
+    def __init__(self, k=DEFAULT_K, largest=True):
+        self.k = k
+        self.largest = largest
+        self._heap = []  # (score, asset); score = value, or -value when ranking smallest first
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _score(self, value):
+        return value if self.largest else -value
+
+    def threshold(self):
+        """Score an asset must beat to enter a full heap (None while not full)."""
+        return self._heap[0][0] if len(self._heap) >= self.k else None
+
+    def push(self, asset, value):
+        if value != value:  # NaN
+            return
+        item = (self._score(value), asset)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item > self._heap[0]:
+            heapq.heapreplace(self._heap, item)
+
+    def push_many(self, assets, values):
+        """Feed one chunk of asset-level results."""
+        values = np.asarray(values, dtype=np.float64)
+        scores = values if self.largest else -values
+        cand = np.flatnonzero(~np.isnan(scores))
+        if len(cand) > self.k:
+            # Keep everything tied with the chunk's k-th best so asset-id tie-breaks still apply
+            kth = np.partition(scores[cand], len(cand) - self.k)[len(cand) - self.k]
+            cand = cand[scores[cand] >= kth]
+        floor = self.threshold()
+        if floor is not None:
+            cand = cand[scores[cand] >= floor]
+        for i in cand:
+            self.push(assets[i], float(values[i]))
+        return self
+
+    def merge(self, other):
+        for score, asset in other._heap:
+            self.push(asset, score if other.largest else -score)
+        return self
+
+    def items(self):
+        """[(asset, value)] best first."""
+        return [(a, s if self.largest else -s) for s, a in sorted(self._heap, reverse=True)]
+
+
+class Ranker:
+    """One TopK per ranking name; picklable, so worker processes can return partials."""
+
+    def __init__(self, specs, k=DEFAULT_K):
+        """specs: {name: largest (bool)}."""
+        self.tops = {name: TopK(k, largest) for name, largest in specs.items()}
+
+    def feed(self, name, assets, values):
+        self.tops[name].push_many(assets, values)
+        return self
+
+    def merge(self, other):
+        for name, top in other.tops.items():
+            self.tops[name].merge(top)
+        return self
+
+    def result(self):
+        """{name: [(asset, value)] best first}."""
+        return {name: top.items() for name, top in self.tops.items()}
+
+
+def merge_all(partials):
+    """Merge Rankers returned by parallel workers (None when there are none)."""
+    partials = list(partials)
+    if not partials:
+        return None
+    out = partials[0]
+    for p in partials[1:]:
+        out.merge(p)
+    return out
@@ -0,0 +1,203 @@
+"""
+Reliability indices engine (SAIDI / SAIFI / CAIDI / CAIFI / MAIFI) over outage logs.
+
+Outage / interruption records are per consumer: (consumer, start, end) in epoch seconds,
+consumer a dense index into the consumer master. Overlapping or touching records of the
+same consumer are merged with one sort + running-max sweep, interruptions shorter than
+MOMENTARY_MINUTES count as momentary (MAIFI), the rest as sustained, and the per-consumer
+totals roll up consumer -> DT -> feeder -> circle -> system with bincount. Everything is
+vectorized and O(n log n) in the number of records. Zero-length records are dropped.
+
+For a profile_store root, outages come from the Event Profile: an IS 15959 power-fail
+occurrence (POWER_FAIL) closed by the meter's next event if that is a restoration
+(POWER_RESTORE, or POWER_FAIL with status 0) within MAX_OUTAGE_HOURS. Events up to
+MAX_OUTAGE_HOURS either side of the month are read too, so an outage that crosses a month
+boundary is counted for the part inside the month.
+"""
+from datetime import datetime, timezone
+
+import numpy as np
+
+MOMENTARY_MINUTES = 5.0
+LEVELS = ("consumer", "dt", "feeder", "circle", "system")
+POWER_FAIL = 101
+POWER_RESTORE = 102
+MAX_OUTAGE_HOURS = 72  # a failure without a restoration this soon is a data gap, not an outage
+
+
+def merge_intervals(consumer, start, end):
+    """
+    Merge overlapping intervals per consumer.
+    Returns (consumer, start, end) of the merged intervals, sorted by consumer then start.
+    """
+    consumer = np.asarray(consumer, dtype=np.int64)
+    start = np.asarray(start, dtype=np.int64)
+    end = np.maximum(np.asarray(end, dtype=np.int64), start)
+    if len(consumer) == 0:
+        return consumer, start, end
+    order = np.lexsort((start, consumer))
+    c, s, e = consumer[order], start[order], end[order]
+
+    # Running max of end that restarts per consumer: shift each consumer into its own
+    # disjoint time band so one global maximum.accumulate never crosses a boundary.
+    t0 = min(s.min(), e.min())
+    span = int(e.max() - t0) + 1
+    band = (c - c.min()) * span
+    run_end = np.maximum.accumulate(band + (e - t0)) - band + t0
+
+    new = np.empty(len(c), dtype=bool)
+    new[0] = True
+    new[1:] = (c[1:] != c[:-1]) | (s[1:] > run_end[:-1])
+    idx = np.flatnonzero(new)
+    return c[idx], s[idx], np.maximum.reduceat(e, idx)
+
+
+def _rollup(values, parent, n_parent):
+    return np.bincount(parent, weights=values, minlength=n_parent)
+
+
+def _indices(customers, sustained, minutes, momentary, affected):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        saidi = np.where(customers > 0, minutes / customers, np.nan)
+        saifi = np.where(customers > 0, sustained / customers, np.nan)
+        return {
+            "customers": customers,
+            "interruptions": sustained,
+            "minutes": minutes,
+            "momentary": momentary,
+            "affected": affected,
+            "saidi": saidi,
+            "saifi": saifi,
+            "caidi": np.where(saifi > 0, saidi / saifi, np.nan),
+            "caifi": np.where(affected > 0, sustained / affected, np.nan),
+            "maifi": np.where(customers > 0, momentary / customers, np.nan),
+        }
+
+
+def reliability_indices(consumer, start, end, consumer_dt, dt_feeder, feeder_circle=None,
+                        period=None, momentary_minutes=MOMENTARY_MINUTES):
+    """
+    consumer/start/end: interruption records. consumer_dt, dt_feeder, feeder_circle: parent
+    index arrays of the asset hierarchy (every consumer counts as served, interrupted or not).
+    period: optional (start, end) epoch seconds; intervals are clipped to it. Records with no
+    duration (end <= start) are dropped, so they never count as momentary interruptions.
+    Returns {level: {metric: array}} for LEVELS (system arrays have length 1).
+    """
+    consumer_dt = np.asarray(consumer_dt)
+    dt_feeder = np.asarray(dt_feeder)
+    n_cons, n_dt, n_feeder = len(consumer_dt), len(dt_feeder), int(dt_feeder.max()) + 1 if len(dt_feeder) else 0
+    feeder_circle = np.zeros(n_feeder, dtype=np.int64) if feeder_circle is None else np.asarray(feeder_circle)
+    n_circle = int(feeder_circle.max()) + 1 if len(feeder_circle) else 0
+
+    start = np.asarray(start, dtype=np.int64)
+    end = np.asarray(end, dtype=np.int64)
+    consumer = np.asarray(consumer, dtype=np.int64)
+    if period is not None:
+        start = np.maximum(start, int(period[0]))
+        end = np.minimum(end, int(period[1]))
+    keep = end > start
+    consumer, start, end = consumer[keep], start[keep], end[keep]
+
+    c, s, e = merge_intervals(consumer, start, end)
+    minutes = (e - s) / 60.0
+    momentary = minutes < momentary_minutes
+
+    sustained_n = np.bincount(c[~momentary], minlength=n_cons).astype(np.float64)
+    levels = {
+        "consumer": (
+            np.ones(n_cons),
+            sustained_n,
+            np.bincount(c[~momentary], weights=minutes[~momentary], minlength=n_cons),
+            np.bincount(c[momentary], minlength=n_cons).astype(np.float64),
+            (sustained_n > 0).astype(np.float64),
+        )
+    }
+    levels["dt"] = tuple(_rollup(v, consumer_dt, n_dt) for v in levels["consumer"])
+    levels["feeder"] = tuple(_rollup(v, dt_feeder, n_feeder) for v in levels["dt"])
+    levels["circle"] = tuple(_rollup(v, feeder_circle, n_circle) for v in levels["feeder"])
+    levels["system"] = tuple(np.array([v.sum()]) for v in levels["circle"])
+    return {level: _indices(*vals) for level, vals in levels.items()}
+
+
+def dashboard_values(result, level="system", node=0):
+    """Dashboard-2 KPI values (KPI_SPECS names) for one node, ready for computed=... overrides."""
+    r = {k: float(v[node]) for k, v in result[level].items()}
+
+    def num(x, nd):
+        return None if np.isnan(x) else round(x, nd)
+
+    out = {
+        "SAIDI": num(r["saidi"], 1),
+        "SAIFI": num(r["saifi"], 3),
+        "CAIDI": num(r["caidi"], 1),
+        "CAIFI": num(r["caifi"], 3),
+        "MAIFI": num(r["maifi"], 3),
+        "Number of Outages (Frequency)": int(r["interruptions"]),
+        "Duration of Outages (Minutes)": round(r["minutes"], 1),
+    }
+    return {k: v for k, v in out.items() if v is not None}
+
+
+def worst_feeders(result, k=10, by="minutes"):
+    """Feeder indexes with the most outage minutes (or interruptions), for "Feeders with Maximum Outages"."""
+    vals = result["feeder"][by]
+    k = min(k, len(vals))
+    top = np.argpartition(-vals, k - 1)[:k] if k else np.empty(0, dtype=np.int64)
+    return top[np.argsort(-vals[top], kind="stable")]
+
+
+# --- profile_store driver ---
+
+def outages_from_events(meter, ts, code, status):
+    """(meter, start, end) of power-fail -> restoration pairs in Event Profile columns."""
+    meter = np.asarray(meter, dtype=np.int64)
+    ts = np.asarray(ts, dtype=np.int64)
+    code = np.asarray(code)
+    status = np.asarray(status)
+    fail = (code == POWER_FAIL) & (status == 1)
+    restore = (code == POWER_RESTORE) | ((code == POWER_FAIL) & (status == 0))
+    sel = np.flatnonzero(fail | restore)
+    order = sel[np.lexsort((ts[sel], meter[sel]))]
+    m, t, f = meter[order], ts[order], fail[order]
+    pair = f[:-1] & ~f[1:] & (m[:-1] == m[1:]) & (t[1:] - t[:-1] <= MAX_OUTAGE_HOURS * 3600)
+    i = np.flatnonzero(pair)
+    return m[i], t[i], t[i + 1]
+
+
+def month_bounds(period):
+    """(start, end) epoch seconds (UTC) of a YYYY-MM month."""
+    year, month = (int(x) for x in period.split("-"))
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def _day_start(partition):
+    """Epoch seconds (UTC) of a "YYYY-MM-DD[_cNNNNN]" partition's day, or None for other names."""
+    try:
+        return int(datetime.strptime(partition[:10], "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+    except ValueError:
+        return None
+
+
+def indices_from_store(root, period):
+    """reliability_indices for a YYYY-MM month of a profile_store root. Events are read from
+    MAX_OUTAGE_HOURS before to MAX_OUTAGE_HOURS after the month, so outages crossing a month
+    boundary are paired before being clipped to the month."""
+    import profile_store
+    cm = profile_store.open_partition(root, "consumer_master", "master")
+    asset = profile_store.open_partition(root, "asset_master", "master").read(["dt", "feeder"])
+    consumer_dt = np.zeros(int(np.max(cm.column("meter"))) + 1, dtype=np.int64)
+    consumer_dt[np.asarray(cm.column("meter"))] = cm.column("dt")
+    dt_feeder = np.zeros(int(np.max(asset["dt"])) + 1, dtype=np.int64)
+    dt_feeder[np.asarray(asset["dt"])] = asset["feeder"]
+    bounds = month_bounds(period)
+    lo, hi = bounds[0] - MAX_OUTAGE_HOURS * 3600, bounds[1] + MAX_OUTAGE_HOURS * 3600
+    parts = [p for p in profile_store.periods(root, "event_profile")
+             if _day_start(p) is not None and _day_start(p) + 86400 > lo and _day_start(p) < hi]
+    events = profile_store.read(root, "event_profile", ["meter", "ts", "event_code", "event_status"], parts) if parts else {}
+    if events:
+        records = outages_from_events(events["meter"], events["ts"], events["event_code"], events["event_status"])
+    else:
+        records = (np.empty(0, np.int64),) * 3
+    return reliability_indices(*records, consumer_dt, dt_feeder, period=bounds)
@@ -1,25 +1,538 @@
-"""Serve the KPI dashboard frontend on http://localhost:8080"""
+"""Serve the KPI dashboard frontend on http://localhost:8080
+
+Threaded HTTP/1.1 server (keep-alive) that caches static files in memory (LRU, bounded by
+FILE_CACHE_ENTRIES / FILE_CACHE_BYTES) together with precompressed gzip (and brotli, when the
+module is installed) variants. Every response
+carries an ETag; clients polling with If-None-Match get a 304 until the file changes on disk.
+
+GET /series?kpi=<name>&res=15min|day&points=300&method=lttb|minmax[&start=&end=] returns a
+trend series downsampled to the point budget (see trend_series.py).
+
+GET /query?dashboard=&department=&kpi=&period=&asset=&offset=&limit= returns KPIs matching the
+filters from in-memory indexes, through an LRU / TTL response cache that is reset whenever the
+exporter publishes (see kpi_query.py); GET /query/facets lists the available filter values.
+
+GET /events is a server-sent-events stream: a single watcher thread diffs each dashboard
+shard when the exporter rewrites it and broadcasts only the changed KPI values and chart
+points, encoded once for all subscribers. Reconnecting clients send Last-Event-ID and get
+the patches they missed replayed (or a "reload" event when the backlog no longer has them).
+
+GET /metrics reports request counts, bytes served and latency histograms per route, plus the
+per-stage / per-KPI timings the generator and exporter saved under run_metrics/, as Prometheus
+text (default) or JSON (?format=json or Accept: application/json); see instrumentation.py.
+"""
+import argparse
+import collections
+import email.utils
+import gzip
+import hashlib
 import http.server
-import webbrowser
-import threading
+import json
+import mimetypes
 import os
+import re
+import shutil
+import threading
+import time
+import urllib.parse
+import webbrowser
 from pathlib import Path
 
+import instrumentation
+import kpi_query
+import trend_series
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 PORT = 8080
 DIR = Path(__file__).resolve().parent
 os.chdir(DIR)
 
-def open_browser():
+COMPRESSIBLE = {".html", ".json", ".js", ".css", ".svg", ".txt", ".bin"}
+MIN_COMPRESS_SIZE = 1024
+# Dashboards poll: always revalidate (cheap 304), but let other assets sit for a minute.
+CACHE_CONTROL = {".html": "no-cache", ".json": "no-cache", ".bin": "no-cache"}
+DEFAULT_CACHE_CONTROL = "public, max-age=60"
+FILE_CACHE_ENTRIES = 512
+FILE_CACHE_BYTES = 64 * 1024 * 1024  # bodies + compressed variants
+STREAM_CHUNK = 1024 * 1024  # read size when streaming files too large for the cache
+
+
+class CachedFile:
+    __slots__ = ("stamp", "body", "variants", "etag", "last_modified", "ctype", "size")
+
+    def __init__(self, path, stamp):
+        self.stamp = stamp
+        self.body = path.read_bytes()
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest()[:20] + '"'
+        self.last_modified = email.utils.formatdate(stamp[0] / 1e9, usegmt=True)
+        self.ctype = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        if self.ctype.startswith("text/") or self.ctype == "application/json":
+            self.ctype += "; charset=utf-8"
+        self.variants = {}
+        if path.suffix in COMPRESSIBLE and len(self.body) >= MIN_COMPRESS_SIZE:
+            self.variants["gzip"] = gzip.compress(self.body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.variants["br"] = brotli.compress(self.body)
+        self.size = len(self.body) + sum(len(v) for v in self.variants.values())
+
+    def trim(self, max_bytes):
+        """Fit in max_bytes: drop the body (streamed from disk instead), then the compressed
+        variants, largest first; the ETag and headers always stay."""
+        self.body = None
+        for enc in sorted(self.variants, key=lambda e: len(self.variants[e]), reverse=True):
+            if sum(len(v) for v in self.variants.values()) <= max_bytes:
+                break
+            del self.variants[enc]
+        self.size = sum(len(v) for v in self.variants.values())
+
+
+class FileCache:
+    """
+    In-memory LRU of served files, refreshed when mtime or size changes; bounded by entry
+    count and total bytes like kpi_query.ResultCache. Files too large to fit keep their ETag
+    and the compressed variants that fit, and their body is streamed from disk.
+    """
+
+    def __init__(self, max_entries=FILE_CACHE_ENTRIES, max_bytes=FILE_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._files = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._files.get(path)
+            if entry is not None and entry.stamp == stamp:
+                self._files.move_to_end(path)
+                return entry
+        entry = CachedFile(path, stamp)
+        with self._lock:
+            old = self._files.pop(path, None)
+            if old is not None:
+                self.bytes -= old.size
+            if entry.size > self.max_bytes:
+                entry.trim(self.max_bytes)
+            self._files[path] = entry
+            self.bytes += entry.size
+            while len(self._files) > self.max_entries or self.bytes > self.max_bytes:
+                self.bytes -= self._files.popitem(last=False)[1].size
+        return entry
+
+    def __len__(self):
+        return len(self._files)
+
+
+CACHE = FileCache()
+
+SHARD_GLOB = "dashboards/Dashboard-*.json"
+SHARD_NAME = re.compile(r"Dashboard-\d+\.json$")  # not the .col.json variants
+POLL_SECONDS = 1.0
+KEEPALIVE_SECONDS = 15.0
+BACKLOG = 256
+
+
+def diff_items(old, new):
+    """[[index, value]] of changed points when two item lists share their names, else None."""
+    if not (isinstance(old, list) and isinstance(new, list)) or len(old) != len(new):
+        return None
+    if any(not isinstance(o, dict) or o.get("name") != n.get("name") for o, n in zip(old, new)):
+        return None
+    return [[i, n["value"]] for i, (o, n) in enumerate(zip(old, new)) if o != n]
+
+
+def diff_dashboard(old, new):
+    """
+    Patch turning shard `old` into `new`:
+    {"kpis": {name: {changed fields}}, "charts": {key: {"points": [[i, value]]} | {"block": ...}}},
+    {"reload": True} when KPIs or charts were added / removed, or None when nothing changed.
+    """
+    if old == new:
+        return None
+    old_kpis = {k["name"]: k for k in old.get("kpis", [])}
+    new_kpis = {k["name"]: k for k in new.get("kpis", [])}
+    old_charts, new_charts = old.get("charts", {}), new.get("charts", {})
+    if list(old_kpis) != list(new_kpis) or set(old_charts) != set(new_charts):
+        return {"reload": True}
+    kpis = {}
+    for name, k in new_kpis.items():
+        changed = {f: v for f, v in k.items() if old_kpis[name].get(f) != v}
+        if changed:
+            kpis[name] = changed
+    charts = {}
+    for key, block in new_charts.items():
+        if old_charts[key] != block:
+            points = diff_items(old_charts[key], block)
+            charts[key] = {"points": points} if points is not None else {"block": block}
+    return {"kpis": kpis, "charts": charts}
+
+
+class LiveFeed:
+    """Watches the dashboard shards and keeps the last BACKLOG patches as encoded SSE events."""
+
+    def __init__(self, root=DIR, pattern=SHARD_GLOB, interval=POLL_SECONDS):
+        self.root = Path(root)
+        self.pattern = pattern
+        self.interval = interval
+        self.seq = 0
+        self.events = collections.deque(maxlen=BACKLOG)  # (seq, encoded event)
+        self._shards = {}  # path -> (stamp, parsed shard)
+        self._cond = threading.Condition()
+        self._thread = None
+        self.scan()  # baseline: no patches for what is already on disk
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        stop = threading.Event()
+        while not stop.wait(self.interval):
+            self.scan()
+
+    def scan(self):
+        """Diff shards whose (mtime, size) changed; publish one event per changed dashboard."""
+        for path in sorted(self.root.glob(self.pattern)):
+            if not SHARD_NAME.match(path.name):
+                continue
+            try:
+                st = path.stat()
+                stamp = (st.st_mtime_ns, st.st_size)
+                known = self._shards.get(path)
+                if known is not None and known[0] == stamp:
+                    continue
+                with open(path, encoding="utf-8") as f:
+                    shard = json.load(f)
+            except (OSError, ValueError):
+                continue  # mid-write or removed; retry next poll
+            self._shards[path] = (stamp, shard)
+            patch = diff_dashboard(known[1], shard) if known is not None else None
+            if patch:
+                self.publish("patch", {"dashboard": path.stem, **patch})
+
+    def publish(self, event, data):
+        with self._cond:
+            self.seq += 1
+            body = json.dumps(data, separators=(",", ":"))
+            self.events.append((self.seq, f"id: {self.seq}\nevent: {event}\ndata: {body}\n\n".encode()))
+            self._cond.notify_all()
+
+    def since(self, seq, timeout):
+        """Encoded events after seq (waiting up to timeout for one); None if seq fell out of the backlog."""
+        with self._cond:
+            if seq >= 0 and not self._cond.wait_for(lambda: self.seq > seq, timeout):
+                return []
+            if seq < 0 or (self.events and self.events[0][0] > seq + 1):
+                return None
+            return [(s, e) for s, e in self.events if s > seq]
+
+
+SERIES = trend_series.SeriesStore(DIR / "dashboards")
+QUERIES = kpi_query.QueryService(DIR / "dashboards")
+METRICS = instrumentation.ServerMetrics()
+ROUTES = ("/events", "/series", "/metrics", "/query", "/query/facets")
+
+FEED = None
+_FEED_LOCK = threading.Lock()
+
+
+def live_feed():
+    global FEED
+    with _FEED_LOCK:
+        if FEED is None:
+            FEED = LiveFeed().start()
+    return FEED
+
+
+def etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = [t.strip() for t in header.split(",")]
+    return etag in tags or f"W/{etag}" in tags
+
+
+def pick_encoding(accept, variants):
+    accept = (accept or "").lower()
+    for enc in ("br", "gzip"):
+        if enc in variants and enc in accept:
+            return enc
+    return None
+
+
+def route_label(path):
+    """Metrics label for a request path (bounded: API routes, "shard" or "static")."""
+    route = path.split("?")[0]
+    if route in ROUTES:
+        return route
+    return "shard" if route.startswith("/dashboards/") else "static"
+
+
+class _CountingWriter:
+    """Wraps the response stream to count bytes written (headers included)."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        return self.raw.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+class DashboardHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without TCP_NODELAY keep-alive clients
+    # stall on delayed ACKs (~40 ms per request).
+    disable_nagle_algorithm = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=str(DIR), **kwargs)
+
+    def setup(self):
+        super().setup()
+        self.wfile = _CountingWriter(self.wfile)
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+    def do_GET(self):
+        self._timed(self._get)
+
+    def do_HEAD(self):
+        self._timed(lambda: self._serve(head_only=True))
+
+    def _get(self):
+        route = self.path.split("?")[0]
+        if route == "/events":
+            return self._events()
+        if route == "/series":
+            return self._series()
+        if route == "/metrics":
+            return self._metrics()
+        if route == "/query":
+            return self._query()
+        if route == "/query/facets":
+            return self._send_json(200, QUERIES.facets())
+        self._serve(head_only=False)
+
+    def _timed(self, handler):
+        route = route_label(self.path)
+        self._status = None
+        sent = self.wfile.bytes
+        t0 = time.perf_counter()
+        try:
+            handler()
+        finally:
+            # Event streams last as long as the client stays: counted, but kept out of the latency histogram
+            METRICS.observe(route, self._status, time.perf_counter() - t0, self.wfile.bytes - sent,
+                            latency=route != "/events")
+
+    def _serve(self, head_only):
+        path = Path(self.translate_path(self.path))
+        if path.is_dir():
+            path = path / "index.html"
+        entry = CACHE.get(path) if path.is_file() else None
+        if entry is None:
+            # Directory listings and 404s: fall back to the stock handler
+            return super().do_HEAD() if head_only else super().do_GET()
+
+        if etag_matches(self.headers.get("If-None-Match"), entry.etag):
+            self.send_response(304)
+            self._common_headers(path, entry)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        enc = pick_encoding(self.headers.get("Accept-Encoding"), entry.variants)
+        body = entry.variants[enc] if enc else entry.body
+        f = None
+        if body is None:
+            # Too large to keep in memory: stream the file the entry was built from
+            f = open(path, "rb")
+            st = os.fstat(f.fileno())
+            if (st.st_mtime_ns, st.st_size) != entry.stamp:
+                f.close()  # replaced since: serve the new version
+                return self._serve(head_only)
+        try:
+            self.send_response(200)
+            self._common_headers(path, entry)
+            self.send_header("Content-Type", entry.ctype)
+            if enc:
+                self.send_header("Content-Encoding", enc)
+            self.send_header("Content-Length", str(entry.stamp[1] if body is None else len(body)))
+            self.end_headers()
+            if head_only:
+                return
+            if body is None:
+                shutil.copyfileobj(f, self.wfile, STREAM_CHUNK)
+            else:
+                self.wfile.write(body)
+        finally:
+            if f is not None:
+                f.close()
+
+    def _send_json(self, status, obj):
+        body = json.dumps(obj, separators=(",", ":")).encode()
+        compressible = len(body) >= MIN_COMPRESS_SIZE
+        enc = pick_encoding(self.headers.get("Accept-Encoding"), {"gzip"} if compressible else ())
+        if enc:
+            body = gzip.compress(body, compresslevel=5, mtime=0)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        if compressible:
+            self.send_header("Vary", "Accept-Encoding")
+        if enc:
+            self.send_header("Content-Encoding", enc)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _query(self):
+        q = {k: v[-1] for k, v in urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query).items()}
+        try:
+            body, zipped, etag = QUERIES.query(q)
+        except ValueError as e:
+            return self._send_json(400, {"error": str(e)})
+        if etag_matches(self.headers.get("If-None-Match"), etag):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        enc = pick_encoding(self.headers.get("Accept-Encoding"), {"gzip"} if zipped else ())
+        if enc:
+            body = zipped
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("ETag", etag)
+        if zipped:
+            self.send_header("Vary", "Accept-Encoding")
+        if enc:
+            self.send_header("Content-Encoding", enc)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _series(self):
+        q = {k: v[-1] for k, v in urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query).items()}
+        res, method = q.get("res", "day"), q.get("method", "lttb")
+        try:
+            window = {k: int(q[k]) for k in ("start", "end") if k in q}
+            points = int(q.get("points", trend_series.DEFAULT_POINTS))
+            if "kpi" not in q or res not in trend_series.RESOLUTIONS or method not in trend_series.METHODS:
+                raise ValueError("kpi is required; res must be one of " + ", ".join(trend_series.RESOLUTIONS)
+                                 + " and method one of " + ", ".join(trend_series.METHODS))
+        except ValueError as e:
+            return self._send_json(400, {"error": str(e)})
+        try:
+            result = SERIES.query(q["kpi"], res, points, method, **window)
+        except (KeyError, OSError) as e:
+            return self._send_json(404, {"error": f"no series: {e}"})
+        self._send_json(200, result)
+
+    def _metrics(self):
+        q = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        fmt = q.get("format", [""])[-1] or ("json" if "application/json" in self.headers.get("Accept", "") else "")
+        runs = instrumentation.load_runs(DIR / instrumentation.METRICS_DIR)
+        if fmt == "json":
+            return self._send_json(200, {"server": METRICS.to_json(), "runs": runs})
+        body = instrumentation.prometheus_text(METRICS, runs).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _events(self):
+        feed = live_feed()
+        try:
+            seq = int(self.headers.get("Last-Event-ID", ""))
+        except ValueError:
+            seq = feed.seq
+        if seq > feed.seq:
+            seq = -1  # ids from before a server restart: force a reload below
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("X-Accel-Buffering", "no")
+        self.end_headers()
+        self.close_connection = True
+        METRICS.stream(1)
+        try:
+            self.wfile.write(b"retry: 3000\n\n")
+            self.wfile.flush()
+            while True:
+                events = feed.since(seq, KEEPALIVE_SECONDS)
+                if events is None:
+                    seq = feed.seq
+                    events = [(seq, f"id: {seq}\nevent: reload\ndata: {{}}\n\n".encode())]
+                for seq, event in events:
+                    self.wfile.write(event)
+                if not events:
+                    self.wfile.write(b": ping\n\n")  # also detects clients that went away
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass
+        finally:
+            METRICS.stream(-1)
+
+    def _common_headers(self, path, entry):
+        self.send_header("ETag", entry.etag)
+        self.send_header("Last-Modified", entry.last_modified)
+        self.send_header("Cache-Control", CACHE_CONTROL.get(path.suffix, DEFAULT_CACHE_CONTROL))
+        if entry.variants:
+            self.send_header("Vary", "Accept-Encoding")
+
+
+class DashboardServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+
+def open_browser(port=PORT):
     import time
     time.sleep(0.8)
-    webbrowser.open(f"http://localhost:{PORT}")
+    webbrowser.open(f"http://localhost:{port}")
 
-if __name__ == "__main__":
-    server = http.server.HTTPServer(("", PORT), http.server.SimpleHTTPRequestHandler)
-    print(f"Serving at http://localhost:{PORT}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--bind", default="")
+    parser.add_argument("--no-browser", action="store_true", help="don't open a browser tab")
+    args = parser.parse_args(argv)
+
+    server = DashboardServer((args.bind, args.port), DashboardHandler)
+    live_feed()
+    print(f"Serving at http://localhost:{args.port}")
     print("Open the link in your browser. Press Ctrl+C to stop.")
-    threading.Thread(target=open_browser, daemon=True).start()
+    if not args.no_browser:
+        threading.Thread(target=open_browser, args=(args.port,), daemon=True).start()
     try:
         server.serve_forever()
     except KeyboardInterrupt:
         server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
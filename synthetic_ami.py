@@ -0,0 +1,262 @@
+"""
+Deterministic, chunked synthetic AMI data generator for load testing.
+
+    python synthetic_ami.py --meters 1000000 --days 30 --out store [--workers 8]
+
+Builds a substation -> feeder -> DT -> meter hierarchy and writes, into a profile_store root:
+  asset_master / consumer_master     (partition "master"); consumer_master.tagged_dt is the
+                                     recorded DT tag, wrong for MISTAG_RATE of meters
+  block_profile                      15-minute meter blocks: L1/L2/L3 voltage & current,
+                                     kWh/kVAh import/export; voltage follows the meter's
+                                     (true) DT plus meter noise
+  dt_block                           15-minute DT blocks aggregated from its meters
+  feeder_block                       15-minute feeder input energy (its DTs + HT line loss)
+  billing                            daily prepaid billing per meter: billed kWh (a few meters
+                                     unbilled / under-billed), amount billed and collected
+  event_profile                      IS 15959 events, with injected tamper sequences
+
+Block, DT and event data are partitioned per (day, DT chunk) and each partition is seeded
+from (seed, day, chunk), so output is identical for any worker count. Each worker streams
+its partitions straight to disk; memory is bounded by one chunk.
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+
+import profile_store
+
+BLOCKS_PER_DAY = 96
+BLOCK_SECONDS = 900
+METERS_PER_DT = 50
+DTS_PER_FEEDER = 20
+FEEDERS_PER_SUBSTATION = 8
+MISTAG_RATE = 0.02  # share of meters whose recorded DT tag (tagged_dt) is another DT on the same feeder
+DT_VOLTAGE_SD = 5.0  # per-DT, per-block voltage swing shared by the DT's meters
+METER_VOLTAGE_SD = 3.0
+TARIFF = 6.5  # ₹ / kWh
+UNBILLED_RATE = 0.03  # share of meters billed nothing (billing exceptions)
+UNDERBILLED_RATE = 0.05  # share billed 30–90% of their metered energy
+DEFAULTER_RATE = 0.05  # share paying nothing; PARTIAL_PAYER_RATE pay 30–90% of the bill
+PARTIAL_PAYER_RATE = 0.10
+DT_RATINGS = np.array([25, 63, 100, 160, 200, 250, 315], dtype=np.float32)
+MASTER_PARTITION = "master"
+# Event codes drawn as background noise (occurrences), plus the injected tamper sequence
+BACKGROUND_EVENTS = np.array([1, 3, 5, 7, 9, 101, 102, 201, 203, 251], dtype=np.int16)
+TAMPER_SEQUENCE = (101, 251, 51)
+
+# Relative hourly load shape (morning and evening peaks), interpolated to 15-minute blocks
+_HOURLY = np.array([0.45, 0.4, 0.38, 0.37, 0.4, 0.55, 0.8, 0.95, 0.85, 0.7, 0.65, 0.65,
+                    0.7, 0.7, 0.65, 0.65, 0.7, 0.85, 1.0, 1.0, 0.95, 0.85, 0.7, 0.55], dtype=np.float32)
+LOAD_SHAPE = np.interp(np.arange(BLOCKS_PER_DAY) / 4.0, np.arange(25), np.append(_HOURLY, _HOURLY[0])).astype(np.float32)
+
+
+def build_masters(n_meters, seed=0):
+    """Asset (DT) and consumer (meter) masters for n_meters; deterministic in (n_meters, seed)."""
+    rng = np.random.default_rng([seed, 0])
+    n_dt = max(1, -(-n_meters // METERS_PER_DT))
+    dt = np.arange(n_dt, dtype=np.int32)
+    meter = np.arange(n_meters, dtype=np.int32)
+    meter_dt = (meter // METERS_PER_DT).astype(np.int32)
+    asset = {
+        "dt": dt,
+        "feeder": (dt // DTS_PER_FEEDER).astype(np.int32),
+        "substation": (dt // (DTS_PER_FEEDER * FEEDERS_PER_SUBSTATION)).astype(np.int32),
+        "rated_kva": rng.choice(DT_RATINGS, n_dt),
+    }
+    consumer = {
+        "meter": meter,
+        "dt": meter_dt,
+        "feeder": asset["feeder"][meter_dt],
+        "phase": rng.integers(0, 3, n_meters).astype(np.int8),
+        "sanctioned_load": rng.choice(np.array([1, 2, 3, 5, 7.5, 10], dtype=np.float32), n_meters),
+        # Per-meter scale and power factor, fixed across days
+        "load_scale": rng.lognormal(-0.3, 0.5, n_meters).astype(np.float32),
+        "pf": rng.uniform(0.75, 0.99, n_meters).astype(np.float32),
+    }
+    # DT tag as recorded in GIS / billing: wrong (another DT of the same feeder) for MISTAG_RATE of meters
+    tagged = meter_dt.copy()
+    wrong = np.flatnonzero(rng.random(n_meters) < MISTAG_RATE)
+    first = consumer["feeder"][wrong] * DTS_PER_FEEDER
+    size = np.minimum(DTS_PER_FEEDER, n_dt - first)  # DTs on the meter's feeder
+    wrong, first, size = wrong[size > 1], first[size > 1], size[size > 1]
+    tagged[wrong] = first + (meter_dt[wrong] - first + rng.integers(1, size)) % size
+    consumer["tagged_dt"] = tagged
+    return asset, consumer
+
+
+def _day_start(day):
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+
+
+def generate_chunk(consumer, asset, day, day_index, chunk_index, seed=0, event_rate=0.2, tamper_rate=0.002):
+    """
+    Block profile, DT block, feeder block, billing and event profile columns for one day of
+    one chunk of whole DTs. consumer / asset hold the chunk's master rows.
+    """
+    rng = np.random.default_rng([seed, 1, day_index, chunk_index])
+    n = len(consumer["meter"])
+    dt_ids = asset["dt"]
+    local = consumer["dt"] - dt_ids[0]
+    n_dt = len(dt_ids)
+    # Voltage each DT delivers per block and phase (own stream, so the draws below are unchanged)
+    dt_common = 240.0 + np.random.default_rng([seed, 2, day_index, chunk_index]).normal(
+        0.0, DT_VOLTAGE_SD, (n_dt, BLOCKS_PER_DAY, 3)).astype(np.float32)
+    t0 = _day_start(day)
+    ts = t0 + np.arange(BLOCKS_PER_DAY, dtype=np.int64) * BLOCK_SECONDS
+
+    # kW per meter x block, ~= sanctioned load share x daily shape x noise
+    kw = (consumer["load_scale"][:, None] * consumer["sanctioned_load"][:, None] * 0.35 * LOAD_SHAPE[None, :]
+          * rng.lognormal(0.0, 0.15, (n, BLOCKS_PER_DAY)).astype(np.float32))
+    pf = np.clip(consumer["pf"][:, None] + rng.normal(0, 0.02, (n, BLOCKS_PER_DAY)).astype(np.float32), 0.5, 1.0)
+    v = dt_common[local] + rng.normal(0.0, METER_VOLTAGE_SD, (n, BLOCKS_PER_DAY, 3)).astype(np.float32)
+    i = np.zeros((n, BLOCKS_PER_DAY, 3), dtype=np.float32)
+    phase = consumer["phase"].astype(np.intp)
+    rows = np.arange(n)
+    i[rows, :, phase] = kw * 1000.0 / (v[rows, :, phase] * pf)
+    kwh = kw / 4.0
+    exp = rng.random((n, 1)) < 0.02  # a few net-metered consumers export midday
+    kwh_exp = np.where(exp, np.maximum(0, 0.3 - kwh) * LOAD_SHAPE[None, :].clip(0.6, 1.0), 0).astype(np.float32)
+
+    block = {
+        "meter": np.repeat(consumer["meter"], BLOCKS_PER_DAY),
+        "dt": np.repeat(consumer["dt"], BLOCKS_PER_DAY),
+        "feeder": np.repeat(consumer["feeder"], BLOCKS_PER_DAY),
+        "ts": np.tile(ts, n),
+        "voltage": v.reshape(-1, 3),
+        "current": i.reshape(-1, 3),
+        "kwh_imp": kwh.reshape(-1),
+        "kwh_exp": kwh_exp.reshape(-1),
+        "kvah_imp": (kwh / pf).reshape(-1),
+        "kvah_exp": (kwh_exp / 0.95).reshape(-1).astype(np.float32),
+    }
+
+    # DT block: per-phase current summed over the DT's meters (+ technical loss), mean voltage.
+    # Consumer rows are sorted by meter and meters are numbered DT by DT, so each DT's
+    # meters are one contiguous run and reduceat sums them without a scatter.
+    loss = rng.uniform(1.02, 1.12, n_dt).astype(np.float32)
+    starts = np.flatnonzero(np.r_[True, local[1:] != local[:-1]])
+    present = local[starts]
+    dt_i = np.zeros((n_dt, BLOCKS_PER_DAY, 3), dtype=np.float32)
+    dt_i[present] = np.add.reduceat(i, starts, axis=0)
+    dt_v = np.full((n_dt, BLOCKS_PER_DAY, 3), np.nan, dtype=np.float32)
+    dt_v[present] = np.add.reduceat(v, starts, axis=0) / np.diff(np.append(starts, n))[:, None, None]
+    dt_kwh = np.zeros((n_dt, BLOCKS_PER_DAY), dtype=np.float32)
+    dt_kwh[present] = np.add.reduceat(kwh, starts, axis=0)
+    dt_block = {
+        "dt": np.repeat(dt_ids, BLOCKS_PER_DAY),
+        "feeder": np.repeat(asset["feeder"], BLOCKS_PER_DAY),
+        "ts": np.tile(ts, n_dt),
+        "voltage": dt_v.reshape(-1, 3),
+        "current": (dt_i * loss[:, None, None]).reshape(-1, 3),
+        "kwh_imp": (dt_kwh * loss[:, None]).reshape(-1),
+    }
+
+    # Feeder input energy: the chunk's DTs (loss included) plus HT line loss. A feeder split
+    # across two chunks gets one partial row set per chunk; readers sum them.
+    extra = np.random.default_rng([seed, 3, day_index, chunk_index])  # own stream, draws above unchanged
+    feeders, dt_feeder = np.unique(asset["feeder"], return_inverse=True)
+    fdr_kwh = np.zeros((len(feeders), BLOCKS_PER_DAY), dtype=np.float32)
+    np.add.at(fdr_kwh, dt_feeder, dt_kwh * loss[:, None])
+    fdr_kwh *= extra.uniform(1.01, 1.05, len(feeders)).astype(np.float32)[:, None]
+    feeder_block = {
+        "feeder": np.repeat(feeders, BLOCKS_PER_DAY),
+        "ts": np.tile(ts, len(feeders)),
+        "kwh_imp": fdr_kwh.reshape(-1),
+    }
+
+    # Daily prepaid billing. Billing exceptions and payment behaviour are per meter, fixed
+    # across days (seeded by chunk only).
+    habit = np.random.default_rng([seed, 4, chunk_index])
+    u, partial = habit.random((2, n)), habit.uniform(0.3, 0.9, (2, n))
+    bill_factor = np.select([u[0] < UNBILLED_RATE, u[0] < UNBILLED_RATE + UNDERBILLED_RATE], [0.0, partial[0]], 1.0)
+    pay_rate = np.select([u[1] < DEFAULTER_RATE, u[1] < DEFAULTER_RATE + PARTIAL_PAYER_RATE], [0.0, partial[1]], 1.0)
+    billed_kwh = (kwh.sum(axis=1) * bill_factor).astype(np.float32)
+    amount = billed_kwh * np.float32(TARIFF)
+    billing = {
+        "meter": consumer["meter"],
+        "billed_kwh": billed_kwh,
+        "amount_billed": amount,
+        "amount_collected": (amount * np.clip(pay_rate * extra.lognormal(0.0, 0.05, n), 0, 1)).astype(np.float32),
+    }
+
+    # Event profile: Poisson background events + injected tamper sequences
+    counts = rng.poisson(event_rate, n)
+    ev_meter = np.repeat(consumer["meter"], counts)
+    ev_code = rng.choice(BACKGROUND_EVENTS, len(ev_meter))
+    ev_ts = t0 + rng.integers(0, 86400, len(ev_meter))
+    tampered = consumer["meter"][rng.random(n) < tamper_rate]
+    if len(tampered):
+        start = t0 + rng.integers(0, 86400 - 3600, len(tampered))
+        gaps = np.cumsum(rng.integers(30, 900, (len(tampered), len(TAMPER_SEQUENCE))), axis=1)
+        ev_meter = np.concatenate([ev_meter, np.repeat(tampered, len(TAMPER_SEQUENCE))])
+        ev_code = np.concatenate([ev_code, np.tile(np.array(TAMPER_SEQUENCE, dtype=np.int16), len(tampered))])
+        ev_ts = np.concatenate([ev_ts, (start[:, None] + gaps).reshape(-1)])
+    events = {
+        "meter": ev_meter.astype(np.int32),
+        "ts": ev_ts.astype(np.int64),
+        "event_code": ev_code.astype(np.int16),
+        "event_status": np.ones(len(ev_meter), dtype=np.int8),
+    }
+    return block, dt_block, feeder_block, billing, events
+
+
+def _chunk_task(args):
+    root, day_iso, day_index, chunk_index, dt_lo, dt_hi, seed = args
+    asset = profile_store.open_partition(root, "asset_master", MASTER_PARTITION).read()
+    consumer_part = profile_store.open_partition(root, "consumer_master", MASTER_PARTITION)
+    sel = consumer_part.rows_for("dt", np.arange(dt_lo, dt_hi))
+    consumer = {c: np.asarray(consumer_part.column(c)[sel]) for c in consumer_part.meta["columns"]}
+    asset = {c: np.asarray(a[dt_lo:dt_hi]) for c, a in asset.items()}
+    block, dt_block, feeder_block, billing, events = generate_chunk(consumer, asset, date.fromisoformat(day_iso), day_index, chunk_index, seed)
+    part = f"{day_iso}_c{chunk_index:05d}"
+    profile_store.write_partition(root, "block_profile", part, block)
+    profile_store.write_partition(root, "dt_block", part, dt_block)
+    profile_store.write_partition(root, "feeder_block", part, feeder_block)
+    profile_store.write_partition(root, "billing", part, billing)
+    profile_store.write_partition(root, "event_profile", part, events)
+    return part, len(block["meter"]), len(events["meter"])
+
+
+def generate(root, n_meters, days, start=date(2025, 1, 1), dts_per_chunk=400, workers=None, seed=0):
+    """Write masters, then fan (day, DT chunk) partitions out over a process pool."""
+    asset, consumer = build_masters(n_meters, seed)
+    profile_store.write_partition(root, "asset_master", MASTER_PARTITION, asset, key="dt", index=("feeder",))
+    profile_store.write_partition(root, "consumer_master", MASTER_PARTITION, consumer)
+    n_dt = len(asset["dt"])
+    tasks = []
+    for d in range(days):
+        day = (start + timedelta(days=d)).isoformat()
+        for c, lo in enumerate(range(0, n_dt, dts_per_chunk)):
+            tasks.append((str(root), day, d, c, lo, min(lo + dts_per_chunk, n_dt), seed))
+    rows = events = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for part, r, e in pool.map(_chunk_task, tasks):
+            rows += r
+            events += e
+    return {"partitions": len(tasks), "block_rows": rows, "events": events, "dts": n_dt, "meters": n_meters}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic AMI profiles into a profile_store root")
+    parser.add_argument("--meters", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--start", default="2025-01-01", help="first day, YYYY-MM-DD")
+    parser.add_argument("--out", default="store")
+    parser.add_argument("--dts-per-chunk", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    t0 = datetime.now()
+    stats = generate(args.out, args.meters, args.days, date.fromisoformat(args.start),
+                     args.dts_per_chunk, args.workers or os.cpu_count(), args.seed)
+    print(f"Generated {stats['block_rows']:,} block rows, {stats['events']:,} events for "
+          f"{stats['meters']:,} meters / {stats['dts']:,} DTs in {stats['partitions']} partitions "
+          f"({(datetime.now() - t0).total_seconds():.1f}s) -> {args.out}")
+    return stats
+
+
+if __name__ == "__main__":
+    main()
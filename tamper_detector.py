@@ -0,0 +1,225 @@
+"""
+Streaming tamper-sequence detector over IS 15959 Event Profile data.
+Implements the "tamper sequence detection" entry of FORMULA_MAP: match ordered event
+patterns (e.g. Power Fail → Cover Open → Reverse Current) per meter within a time window.
+
+Events are consumed chunk by chunk (Meter ID, Timestamp, Event Code, Event Status); only a
+few floats of partial-match state are kept per active meter and dropped once they fall
+out of the window, so memory stays bounded by the meters with recent tamper activity.
+
+Ordering is per meter, since patterns never span meters. A meter's events may arrive in
+any order within a chunk, and up to max_window (the longest pattern window) behind that
+meter's newest timestamp from earlier chunks. They wait in a per-meter time-ordered buffer
+and are applied once the meter's watermark has moved max_window past them, so every meter's
+events are matched in timestamp order whatever the arrival order (events at the same
+timestamp in event code order). Events later than that are counted in late_events and
+dropped. A meter whose watermark falls max_window behind the newest timestamp overall is
+flushed and forgotten, which keeps the buffers bounded by recently active meters. Data
+ordered by meter rather than time, such as profile_store partitions, therefore streams
+without loss. flush() (called by run() at the end of the stream) applies what is still
+buffered.
+"""
+import csv
+import heapq
+import sys
+from collections import namedtuple
+from datetime import datetime
+
+# IS 15959 event codes (occurrence) mapped to pattern symbols
+EVENT_SYMBOLS = {
+    51: "REVERSE_CURRENT",  # Phase R CT reverse
+    53: "REVERSE_CURRENT",  # Phase Y CT reverse
+    55: "REVERSE_CURRENT",  # Phase B CT reverse
+    101: "POWER_FAIL",
+    201: "MAGNET",
+    203: "NEUTRAL_DISTURBANCE",
+    251: "COVER_OPEN",
+}
+
+Pattern = namedtuple("Pattern", "name steps window")
+Match = namedtuple("Match", "meter_id pattern start end")
+
+DEFAULT_PATTERNS = (
+    Pattern("power_fail_cover_open_reverse", ("POWER_FAIL", "COVER_OPEN", "REVERSE_CURRENT"), 3600.0),
+    Pattern("cover_open_magnet", ("COVER_OPEN", "MAGNET"), 1800.0),
+)
+
+_NONE = float("-inf")
+# Rows per feed() chunk when reading a profile_store root
+STORE_CHUNK_ROWS = 65536
+
+
+def is_occurrence(status):
+    """Event Status 1 / "Occurrence" counts; restorations (0 / "Restoration") are ignored."""
+    if isinstance(status, str):
+        return status.strip().lower() in ("1", "o", "occ", "occurrence")
+    return status == 1
+
+
+def to_epoch(ts):
+    if isinstance(ts, (int, float)):
+        return float(ts)
+    if isinstance(ts, datetime):
+        return ts.timestamp()
+    return datetime.fromisoformat(str(ts)).timestamp()
+
+
+class TamperSequenceDetector:
+    def __init__(self, patterns=DEFAULT_PATTERNS, symbols=EVENT_SYMBOLS):
+        self.patterns = tuple(patterns)
+        self.symbols = symbols
+        self.max_window = max(p.window for p in self.patterns)
+        # meter_id -> per pattern list of partial-match start times (starts[k]: steps 0..k seen)
+        self.state = {}
+        self.watermark = _NONE  # newest event time seen
+        self._meter_watermark = {}  # meter_id -> newest event time seen for that meter
+        self._pending = {}  # meter_id -> heap of buffered (time, event_code, symbol)
+        self.late_events = 0
+        self.match_count = 0
+
+    def _new_state(self):
+        return [[_NONE] * (len(p.steps) - 1) for p in self.patterns]
+
+    def feed(self, chunk):
+        """Consume one chunk of (meter_id, timestamp, event_code, event_status) records; return matches."""
+        newest = {}
+        for meter_id, ts, code, status in _records(chunk):
+            sym = self.symbols.get(int(code))
+            if sym is None or not is_occurrence(status):
+                continue
+            t = to_epoch(ts)
+            # Judged against previous chunks only: order within a chunk does not matter
+            if t < self._meter_watermark.get(meter_id, _NONE) - self.max_window:
+                self.late_events += 1
+                continue
+            if t > newest.get(meter_id, _NONE):
+                newest[meter_id] = t
+            heapq.heappush(self._pending.setdefault(meter_id, []), (t, int(code), sym))
+        matches = []
+        for meter_id, t in newest.items():
+            wm = self._meter_watermark[meter_id] = max(self._meter_watermark.get(meter_id, _NONE), t)
+            self.watermark = max(self.watermark, wm)
+            # Anything still to arrive for this meter is no older than wm - max_window
+            matches += self._apply(meter_id, wm - self.max_window)
+        matches += self.expire()
+        return self._emit(matches)
+
+    def flush(self):
+        """Apply every buffered event (end of stream); return matches."""
+        matches = []
+        for meter_id in list(self._pending):
+            matches += self._apply(meter_id, float("inf"))
+        return self._emit(matches)
+
+    def _emit(self, matches):
+        matches.sort(key=lambda m: m.end)
+        self.match_count += len(matches)
+        return matches
+
+    def _apply(self, meter_id, until):
+        """Match the meter's buffered events older than until, in timestamp order."""
+        matches = []
+        pending = self._pending.get(meter_id)
+        if not pending or pending[0][0] >= until:
+            return matches
+        st = self.state.get(meter_id)
+        if st is None:
+            st = self.state[meter_id] = self._new_state()
+        while pending and pending[0][0] < until:
+            t, _, sym = heapq.heappop(pending)
+            for p, starts in zip(self.patterns, st):
+                steps = p.steps
+                # Walk backwards so one event advances each partial match by at most one step
+                for k in range(len(starts) - 1, -1, -1):
+                    s0 = starts[k]
+                    if s0 == _NONE or steps[k + 1] != sym:
+                        continue
+                    if t - s0 > p.window:
+                        starts[k] = _NONE
+                    elif k + 1 == len(steps) - 1:
+                        matches.append(Match(meter_id, p.name, s0, t))
+                        starts[k] = _NONE
+                    elif s0 > starts[k + 1]:
+                        starts[k + 1] = s0
+                if steps[0] == sym:
+                    starts[0] = t
+        if not pending:
+            del self._pending[meter_id]
+        return matches
+
+    def expire(self):
+        """Flush meters that have gone quiet for max_window and drop those whose partial matches
+        have all left their window; return the matches flushed."""
+        matches = []
+        for meter_id, wm in list(self._meter_watermark.items()):
+            if wm < self.watermark - self.max_window:
+                matches += self._apply(meter_id, float("inf"))
+            if meter_id in self._pending:
+                continue
+            st = self.state.get(meter_id, ())
+            if not any(s != _NONE and wm - s <= p.window for p, starts in zip(self.patterns, st) for s in starts):
+                self.state.pop(meter_id, None)
+                del self._meter_watermark[meter_id]
+        return matches
+
+    def run(self, chunks):
+        """Generator over all matches from an iterable of chunks."""
+        for chunk in chunks:
+            yield from self.feed(chunk)
+        yield from self.flush()
+
+
+def _records(chunk):
+    """Records from a list of tuples or a column mapping / DataFrame with Event Profile columns."""
+    if hasattr(chunk, "keys") and "Meter ID" in chunk.keys():
+        return zip(chunk["Meter ID"], chunk["Timestamp"], chunk["Event Code"], chunk["Event Status"])
+    return chunk
+
+
+def read_event_profile(path, chunksize=500_000):
+    """Yield chunks of (meter_id, timestamp, event_code, event_status) from an Event Profile CSV."""
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        chunk = []
+        for row in reader:
+            chunk.append((row["Meter ID"], row["Timestamp"], row["Event Code"], row["Event Status"]))
+            if len(chunk) >= chunksize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def dashboard_values(detector):
+    """Dashboard-9 KPI value (KPI_SPECS name), ready for computed=... overrides."""
+    return {"Tamper sequence detection": detector.match_count}
+
+
+def detect_store(root, period, detector=None, chunk_rows=STORE_CHUNK_ROWS):
+    """Run the detector over the event_profile partitions of a profile_store root for a YYYY-MM month,
+    chunk_rows rows of the memory-mapped columns at a time."""
+    import profile_store
+    detector = detector or TamperSequenceDetector()
+    for part in sorted(p for p in profile_store.periods(root, "event_profile") if p.startswith(period)):
+        part = profile_store.open_partition(root, "event_profile", part)
+        cols = [part.column(c) for c in ("meter", "ts", "event_code", "event_status")]
+        for i in range(0, len(cols[0]), chunk_rows):
+            for _ in detector.feed(zip(*(c[i:i + chunk_rows].tolist() for c in cols))):
+                pass
+    for _ in detector.flush():
+        pass
+    return detector
+
+
+def main(path):
+    detector = TamperSequenceDetector()
+    for m in detector.run(read_event_profile(path)):
+        print(f"{m.meter_id},{m.pattern},{datetime.fromtimestamp(m.start).isoformat()},{datetime.fromtimestamp(m.end).isoformat()}")
+    print(f"Tamper sequences detected: {detector.match_count}", file=sys.stderr)
+    return detector.match_count
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        raise SystemExit("Usage: python tamper_detector.py <event_profile.csv>")
+    main(sys.argv[1])
@@ -0,0 +1,187 @@
+"""
+Full-resolution KPI trend series and point-budget downsampling.
+
+The exporter (--series DAYS) writes one float32 array per trend KPI and resolution
+(RESOLUTIONS: 15-minute and daily) under dashboards/series/, plus index.json with each
+series' start and step. query() returns a series downsampled to a point budget with
+Largest-Triangle-Three-Buckets (shape-preserving, default) or min/max buckets (keeps every
+spike), so a zoomed-out chart stays at a few hundred points however long the history is.
+Results are cached per (KPI, resolution, budget, method, window) and dropped when the
+underlying file changes.
+"""
+import hashlib
+import json
+import re
+import threading
+from calendar import monthrange
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from kpi_registry import KPI_SPECS, SEED, parse_period
+
+RESOLUTIONS = {"15min": 900, "day": 86400}
+TREND_TYPES = ("pct", "minutes", "index", "score")
+DEFAULT_POINTS = 300
+MAX_POINTS = 5000
+SERIES_DIR = "series"
+INDEX_FILE = "index.json"
+CACHE_SIZE = 512
+
+
+# --- Downsampling ---
+
+def lttb(x, y, n):
+    """Indexes of the n points Largest-Triangle-Three-Buckets keeps (first and last always)."""
+    size = len(y)
+    if n >= size:
+        return np.arange(size)
+    if n < 3:
+        raise ValueError("LTTB needs a budget of at least 3 points")
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = (np.arange(n - 1) * (size - 2) / (n - 2)).astype(np.int64) + 1  # bucket bounds; edges[-1] == size - 1
+    out = np.empty(n, dtype=np.int64)
+    out[0], out[-1] = 0, size - 1
+    a = 0
+    for b in range(n - 2):
+        lo, hi = edges[b], edges[b + 1]
+        nlo, nhi = hi, edges[b + 2] if b + 2 < n - 1 else size
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        # Twice the triangle area (a, candidate, next bucket average); constant factors don't matter
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        out[b + 1] = a
+    return out
+
+
+def minmax(y, n):
+    """Indexes of each bucket's min and max (n // 2 buckets), in order."""
+    size = len(y)
+    if n >= size:
+        return np.arange(size)
+    y = np.asarray(y, dtype=np.float64)
+    buckets = max(1, n // 2)
+    starts = (np.arange(buckets) * size / buckets).astype(np.int64)
+    bucket = np.searchsorted(starts, np.arange(size), side="right") - 1
+    lo = np.minimum.reduceat(y, starts)
+    hi = np.maximum.reduceat(y, starts)
+    # First occurrence of each bucket's min / max
+    first_min = np.unique(bucket[y == lo[bucket]], return_index=True)[1]
+    first_max = np.unique(bucket[y == hi[bucket]], return_index=True)[1]
+    idx_min = np.flatnonzero(y == lo[bucket])[first_min]
+    idx_max = np.flatnonzero(y == hi[bucket])[first_max]
+    return np.unique(np.concatenate([idx_min, idx_max]))
+
+
+METHODS = {"lttb": lambda x, y, n: lttb(x, y, n), "minmax": lambda x, y, n: minmax(y, n)}
+
+
+# --- Writing (export pipeline) ---
+
+def slug(name):
+    return re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_")[:60] + "-" + hashlib.sha1(name.encode()).hexdigest()[:6]
+
+
+def period_end(period):
+    """Epoch seconds at the end of a YYYY-MM period (UTC)."""
+    year, month = parse_period(period)
+    start = datetime(year, month, 1, tzinfo=timezone.utc).timestamp()
+    return int(start) + monthrange(year, month)[1] * 86400
+
+
+def dummy_series(spec, value, period, days):
+    """Seeded 15-minute series for a trend KPI, ending at `value`, within the spec's range."""
+    name, lo, hi = spec[2], spec[4], spec[5]
+    digest = hashlib.sha1(f"{SEED}|{period}|{name}|series".encode()).digest()
+    rng = np.random.default_rng(int.from_bytes(digest[:8], "little"))
+    n = days * 96
+    span = hi - lo
+    # Slow daily drift + intra-day cycle + block noise
+    drift = np.interp(np.arange(n), np.arange(0, n + 96, 96), np.cumsum(rng.normal(0, 0.03 * span, days + 1)))
+    cycle = 0.05 * span * np.sin(np.arange(n) * (2 * np.pi / 96))
+    y = drift - drift[-1] + cycle + rng.normal(0, 0.01 * span, n)
+    y += value - y[-1]
+    return np.clip(y, lo, hi).astype(np.float32)
+
+
+def write_series(dashboards, out_dir, period, days=90):
+    """Full-resolution series for every trend KPI in dashboards; returns the index path."""
+    series_dir = Path(out_dir) / SERIES_DIR
+    series_dir.mkdir(parents=True, exist_ok=True)
+    values = {k["name"]: k["value"] for d in dashboards.values() for k in d["kpis"]}
+    end = period_end(period)
+    index = {"period": period, "days": days, "series": {}}
+    for spec in KPI_SPECS:
+        name = spec[2]
+        if spec[3] not in TREND_TYPES or not isinstance(values.get(name), (int, float)):
+            continue
+        full = dummy_series(spec, values[name], period, days)
+        entry = {}
+        for res, step in RESOLUTIONS.items():
+            data = full if step == 900 else full.reshape(-1, step // 900).mean(axis=1).astype(np.float32)
+            fname = f"{slug(name)}.{res}.npy"
+            np.save(series_dir / fname, data)
+            entry[res] = {"file": fname, "start": end - len(data) * step, "step": step, "points": len(data)}
+        index["series"][name] = entry
+    path = series_dir / INDEX_FILE
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1)
+    return path
+
+
+# --- Querying (serving layer) ---
+
+class SeriesStore:
+    """Reads series under <root>/series and caches downsampled results (LRU, CACHE_SIZE entries)."""
+
+    def __init__(self, root):
+        self.dir = Path(root) / SERIES_DIR
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._index = (None, None)  # (stamp, parsed index.json)
+
+    def _stamp(self, path):
+        st = path.stat()
+        return st.st_mtime_ns, st.st_size
+
+    def index(self):
+        path = self.dir / INDEX_FILE
+        stamp = self._stamp(path)
+        if self._index[0] != stamp:
+            with open(path, encoding="utf-8") as f:
+                self._index = (stamp, json.load(f))
+        return self._index[1]
+
+    def query(self, kpi, res="day", points=DEFAULT_POINTS, method="lttb", start=None, end=None):
+        """
+        {"kpi", "res", "total", "x": [epoch s], "y": [...]} with at most `points` points.
+        start / end: optional epoch-second window. Raises KeyError for unknown KPI / res / method.
+        """
+        entry = self.index()["series"][kpi][res]
+        pick = METHODS[method]
+        points = max(3, min(int(points), MAX_POINTS))
+        path = self.dir / entry["file"]
+        key = (kpi, res, points, method, start, end, self._stamp(path))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        y = np.load(path, mmap_mode="r")
+        t0, step = entry["start"], entry["step"]
+        lo = 0 if start is None else int(np.clip((start - t0 + step - 1) // step, 0, len(y)))
+        hi = len(y) if end is None else int(np.clip((end - t0) // step + 1, lo, len(y)))
+        x = t0 + np.arange(lo, hi, dtype=np.int64) * step
+        window = np.asarray(y[lo:hi], dtype=np.float64)
+        keep = pick(x, window, points) if len(window) else np.empty(0, dtype=np.int64)
+        result = {
+            "kpi": kpi, "res": res, "method": method, "total": len(window),
+            "x": x[keep].tolist(), "y": np.round(window[keep], 3).tolist(),
+        }
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return result
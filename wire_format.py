@@ -0,0 +1,201 @@
+"""
+Compact columnar wire format for dashboard shards.
+
+encode() turns a dashboard ({"title", "departments", "kpis": [...], "charts": {...}}) into
+columns: every string (KPI names, departments, units, asset names) goes into one dictionary
+and is referenced by index, KPI fields become parallel arrays, trends are one flat array
+plus per-KPI lengths, and item-list charts ([{"name", "value", "unit"}]) become columns too.
+The result is written as JSON (<id>.col.json) and as a binary container (<id>.bin):
+
+    b"KPIC" | u32 header length | header JSON | pad to 8 | buffers (each 8-byte aligned)
+
+where long numeric arrays are moved out of the header into typed buffers. Decimals with at
+most MAX_SCALE_DIGITS digits are stored as scaled integers in the narrowest integer type
+that holds them ("u8", "u16", "i16", "i32"), anything else as "f64". decode() / from_binary()
+are the inverse (index.html carries the same decoders in JavaScript).
+"""
+import json
+import struct
+
+import numpy as np
+
+FORMAT_VERSION = 1
+MAGIC = b"KPIC"
+BUFFER_MIN = 8  # shorter arrays stay inline in the header
+MAX_SCALE_DIGITS = 3
+INT_TYPES = (("u8", 0, 255), ("u16", 0, 65535), ("i16", -32768, 32767), ("i32", -2**31, 2**31 - 1))
+KPI_FIELDS = {"name", "department", "value", "unit", "trend", "ranking"}
+DTYPES = {"u8": "<u1", "u16": "<u2", "i16": "<i2", "i32": "<i4", "f64": "<f8"}
+
+
+class _Strings:
+    def __init__(self):
+        self.values = []
+        self._index = {}
+
+    def __call__(self, s):
+        i = self._index.get(s)
+        if i is None:
+            i = self._index[s] = len(self.values)
+            self.values.append(s)
+        return i
+
+
+def _is_num(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def _is_item_list(block):
+    return (isinstance(block, list) and block and
+            all(isinstance(x, dict) and set(x) <= {"name", "value", "unit"} and _is_num(x.get("value")) for x in block))
+
+
+def encode(dashboard):
+    """Columnar form of one dashboard (plain JSON-serializable)."""
+    s = _Strings()
+    kpis = dashboard.get("kpis", [])
+    values = [k["value"] for k in kpis]
+    numeric = all(_is_num(v) for v in values)
+    trends = [k.get("trend") for k in kpis]
+    rankings, extra = [], []
+    for i, k in enumerate(kpis):
+        # Fields without a column of their own (e.g. "distribution") travel as-is
+        rest = {f: v for f, v in k.items() if f not in KPI_FIELDS}
+        if rest:
+            extra.append([i, rest])
+        r = k.get("ranking")
+        if r is not None:
+            rankings.append([i, s(r["metric"]), s(r["unit"]),
+                             [s(x["name"]) for x in r["items"]], [x["value"] for x in r["items"]]])
+    cols = {
+        "name": [s(k["name"]) for k in kpis],
+        "department": [s(k["department"]) for k in kpis],
+        "unit": [s(k["unit"]) for k in kpis],
+        # Non-numeric values (e.g. text from computed overrides) fall back to a plain list
+        "value": values if numeric else {"json": values},
+        # -1 = no trend
+        "trendLength": [len(t) if t is not None else -1 for t in trends],
+        "trend": [v for t in trends if t for v in t],
+        "ranking": rankings,
+        "extra": extra,
+    }
+    charts = {}
+    for key, block in dashboard.get("charts", {}).items():
+        if _is_item_list(block):
+            charts[key] = {"items": {
+                "name": [s(x["name"]) for x in block],
+                "value": [x["value"] for x in block],
+                "unit": [s(x["unit"]) if "unit" in x else -1 for x in block],
+            }}
+        else:
+            charts[key] = {"raw": block}
+    return {
+        "format": FORMAT_VERSION,
+        "title": s(dashboard["title"]),
+        "departments": [s(d) for d in dashboard.get("departments", [])],
+        "kpis": cols,
+        "charts": charts,
+        "strings": s.values,
+    }
+
+
+def decode(col):
+    """Inverse of encode()."""
+    st = col["strings"]
+    c = col["kpis"]
+    values = c["value"]["json"] if isinstance(c["value"], dict) else c["value"]
+    kpis, pos = [], 0
+    for i, name in enumerate(c["name"]):
+        k = {"name": st[name], "department": st[c["department"][i]], "value": values[i], "unit": st[c["unit"][i]]}
+        n = c["trendLength"][i]
+        if n >= 0:
+            k["trend"] = list(c["trend"][pos:pos + n])
+            pos += n
+        kpis.append(k)
+    for i, rest in c.get("extra", []):
+        kpis[i].update(rest)
+    for i, metric, unit, names, vals in c["ranking"]:
+        kpis[i]["ranking"] = {"metric": st[metric], "unit": st[unit],
+                              "items": [{"name": st[a], "value": v} for a, v in zip(names, vals)]}
+    charts = {}
+    for key, block in col["charts"].items():
+        if "items" in block:
+            it = block["items"]
+            charts[key] = [dict({"name": st[n], "value": v}, **({"unit": st[u]} if u >= 0 else {}))
+                           for n, v, u in zip(it["name"], it["value"], it["unit"])]
+        else:
+            charts[key] = block["raw"]
+    return {"title": st[col["title"]], "departments": [st[d] for d in col["departments"]],
+            "kpis": kpis, "charts": charts}
+
+
+# --- Binary container ---
+
+def _pack_numbers(values):
+    """(dtype, scale, numpy array) using scaled integers where that is exact."""
+    arr = np.asarray(values, dtype=np.float64)
+    for digits in range(MAX_SCALE_DIGITS + 1):
+        scaled = arr * 10 ** digits
+        ints = np.round(scaled)
+        if np.all(np.abs(scaled - ints) < 1e-6):
+            lo, hi = (ints.min(), ints.max()) if len(ints) else (0, 0)
+            for dtype, tmin, tmax in INT_TYPES:
+                if tmin <= lo and hi <= tmax:
+                    return dtype, 10 ** digits, ints.astype(DTYPES[dtype])
+            break
+    return "f64", 1, arr.astype(DTYPES["f64"])
+
+
+def _extract(node, buffers):
+    """Move long all-numeric lists into buffers, leaving {"$b": index} in the tree."""
+    if isinstance(node, dict):
+        if "raw" in node and len(node) == 1:
+            return node  # opaque chart blocks stay JSON
+        if "extra" in node:
+            return {k: (v if k == "extra" else _extract(v, buffers)) for k, v in node.items()}
+        return {k: _extract(v, buffers) for k, v in node.items()}
+    if isinstance(node, list):
+        if len(node) >= BUFFER_MIN and all(_is_num(v) for v in node):
+            buffers.append(_pack_numbers(node))
+            return {"$b": len(buffers) - 1}
+        return [_extract(v, buffers) for v in node]
+    return node
+
+
+def to_binary(col):
+    buffers = []
+    body = _extract(col, buffers)
+    layout, offset = [], 0
+    for dtype, scale, arr in buffers:
+        layout.append([dtype, scale, offset, len(arr)])
+        offset += -(-arr.nbytes // 8) * 8
+    header = json.dumps({"buffers": layout, "body": body}, separators=(",", ":")).encode()
+    out = bytearray(MAGIC + struct.pack("<I", len(header)) + header)
+    out += b"\0" * (-len(out) % 8)
+    for _, _, arr in buffers:
+        out += arr.tobytes()
+        out += b"\0" * (-len(out) % 8)
+    return bytes(out)
+
+
+def from_binary(data):
+    """Inverse of to_binary() (numeric buffers come back as Python lists)."""
+    if data[:4] != MAGIC:
+        raise ValueError("not a KPIC payload")
+    (n,) = struct.unpack_from("<I", data, 4)
+    header = json.loads(data[8:8 + n])
+    base = 8 + n + (-(8 + n) % 8)
+    arrays = []
+    for dtype, scale, offset, count in header["buffers"]:
+        arr = np.frombuffer(data, DTYPES[dtype], count, base + offset)
+        arrays.append((arr / scale if scale != 1 else arr).tolist())
+
+    def fill(node):
+        if isinstance(node, dict):
+            if set(node) == {"$b"}:
+                return arrays[node["$b"]]
+            return {k: fill(v) for k, v in node.items()}
+        if isinstance(node, list):
+            return [fill(v) for v in node]
+        return node
+    return fill(header["body"])